@@ -1,6 +1,21 @@
+import os
+
 from django.apps import AppConfig
 
 
 class ChatbotConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chatbot"
+
+    def ready(self):
+        # Build the RAG engine once per worker at startup instead of on the first /chat/ request
+        if os.getenv("RAG_PRELOAD", "1") == "0":
+            return
+
+        from rag.langchain.rag_engine import get_rag_engine
+
+        try:
+            get_rag_engine()
+        except Exception as e:
+            # Management commands (migrate, collectstatic...) must still work without the index or credentials
+            print(f"[WARNING] RAG engine preload failed, it will be built on the first request: {e}")
@@ -1,12 +1,18 @@
 from django.urls import path
-from rag.rag_views import rag_ask_view
+from rag.rag_views import rag_ask_view, rag_stream_view, grag_stream_view, rag_ask_async_view, grag_async_view
 from rag.langchain.graph_answer import grag_view
-from tts.tts_generate import tts_generate
+from tts.tts_generate import tts_generate, tts_generate_async
 
 urlpatterns = [
     # path('chat/', chat_view),
     path("chat/", rag_ask_view),
     path("gchat/", grag_view),
+    path("chat/stream/", rag_stream_view),
+    path("gchat/stream/", grag_stream_view),
     path("tts/generate/", tts_generate),
+    # Coroutine views, run under an ASGI server (see README)
+    path("async/chat/", rag_ask_async_view),
+    path("async/gchat/", grag_async_view),
+    path("async/tts/generate/", tts_generate_async),
     # path('location_query/', LocationQueryView.as_view()),
 ]
\ No newline at end of file
@@ -31,6 +31,57 @@ const images = {
   loading: getImagePath('loading.gif'),
 };
 
+const CHAT_STREAM_URL = "https://nesbot-czf8e6dzgtbjgsgz.canadacentral-01.azurewebsites.net/chat/stream/";
+// const CHAT_STREAM_URL = "http://localhost:8000/chat/stream/";
+
+// POST to an SSE endpoint and call onToken with the text received so far.
+// Resolves with the payload of the final "done" event (the post-processed answer).
+const streamChat = async (url, payload, onToken) => {
+  const response = await fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Chat stream failed: ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let text = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      let data = '';
+      rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      const parsed = data ? JSON.parse(data) : {};
+
+      if (event === 'token') {
+        text += parsed.text;
+        onToken(text);
+      } else if (event === 'done') {
+        return parsed;
+      } else if (event === 'error') {
+        throw new Error(parsed.error);
+      }
+    }
+  }
+  throw new Error('Chat stream ended without an answer');
+};
+
 function ChatWidget() {
   const bottomRef = useRef(null);
   const [isOpen, setIsOpen] = useState(false);
@@ -519,13 +570,21 @@ function ChatWidget() {
         chat_history: chatLog
       };
 
-      const res = await axios.post("https://nesbot-czf8e6dzgtbjgsgz.canadacentral-01.azurewebsites.net/chat/", payload);
-      // const res = await axios.post("http://localhost:8000/chat/", payload);
+      // Show the answer as it is generated, the final event replaces it with the post-processed version
+      const data = await streamChat(CHAT_STREAM_URL, payload, partialText => {
+        setChatLog(prev => {
+          const newLog = [...prev];
+          if (newLog.length && newLog[newLog.length - 1].sender === 'bot') {
+            newLog[newLog.length - 1] = { sender: 'bot', text: partialText, time: now };
+          }
+          return newLog;
+        });
+      });
       const botMessage = {
         sender: 'bot',
-        text: res.data.answer,
+        text: data.answer,
         time: now,
-        refs: res.data.sources || [],
+        refs: data.sources || [],
         canSpeak: true
       };
       setChatLog(prev => {
@@ -1,38 +1,20 @@
 from rest_framework.response import Response
 from langchain.chat_models import AzureChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
+import asyncio
 import math
 import os
 import re
 from urllib.parse import quote_plus
-import json
 from functools import lru_cache
 
-from rag.langchain.name_match import product_match
+from rag.langchain.name_match import product_match, aproduct_match
+from rag.langchain.product_catalog import get_catalog
 
-# Mock data for stores and products
-with open("./rag/mock_stores.json", 'r') as f:
-    mock_stores = json.load(f)
-
-@lru_cache()
 def load_brand_keywords():
-    with open("./rag/brand_products.json", 'r') as f:
-        data = json.load(f)
-
-    products_set = set()
-    product_to_brand = {}
-
-    for brand in data:
-        brand_name = brand.get('brand', '').strip().lower()
-        if brand_name:
-            products_set.add(brand_name)
-            for products in brand.get('products', []):
-                product_name = products.get('name', '').strip().lower()
-                if product_name:
-                    products_set.add(product_name)
-                    product_to_brand[product_name] = brand_name
-
-    return list(products_set), product_to_brand
+    """(brand and product names, lowercase product name -> lowercase brand) from the shared catalog"""
+    catalog = get_catalog()
+    return catalog.keywords, catalog.product_to_brand
 
 def extract_latest_product_from_history(chat_history):
     products = set()
@@ -69,27 +51,33 @@ def stores_to_context(store_results, product):
         return f"No stores found nearby for {product}."
     return "\n".join([f"{s['name']} ({s['distance_km']} km away)" for s in store_results])
 
-def location_query(question, lon, lat, chat_history):
-    product_keywords, product_to_brand = load_brand_keywords()
+NO_PRODUCT_ANSWER = "Sorry, I couldn't identify which product you're asking about.\n\nYou can find more information on [madewithnestle](https://www.madewithnestle.ca/)."
 
-    matched_product = product_match(question, product_keywords, chat_history)
+@lru_cache()
+def location_llm():
+    return AzureChatOpenAI(
+        openai_api_type="azure",
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+        temperature=0.3
+    )
+
+def _with_history_fallback(matched_product, chat_history):
     print("MATCHED PRODUCT:", matched_product)
     if not matched_product:
         matched_product = extract_latest_product_from_history(chat_history)
 
     print("HISTORY:", chat_history[-1] if chat_history else "No history")
     print("MATCHED:", matched_product)
+    return matched_product
 
-    if not matched_product:
-        return Response({"answer": "Sorry, I couldn't identify which product you're asking about.\n\nYou can find more information on [madewithnestle](https://www.madewithnestle.ca/)."}, status=200)
-
-    productlink_dict = {}
-    for product in matched_product:
-        brand = product_to_brand.get(product, product)
-        amazon_link = get_amazon_link(product, brand)
-        productlink_dict[product] = amazon_link
-
+def store_context(matched_product, lon, lat, product_to_brand):
+    """Nearby stores and Amazon link for every matched product, as (store_info, amazon_link) for the prompt"""
+    catalog = get_catalog()
     results = []
+    amazon_link = None
     for product in matched_product:
         print("\n\nPROCESSING PRODUCTS:", product)
         if '[' in product or ']' in product:
@@ -99,15 +87,14 @@ def location_query(question, lon, lat, chat_history):
         amazon_link = get_amazon_link(product, brand)
 
         store_results = []
-        for store in mock_stores:
-            if any(product.lower() in p.lower() for p in store["products"]):
-                print(f"Checking store: {store['name']} for product: {product}")
-                distance = haversine(lat, lon, store["lat"], store["lon"])
-                # if distance <= 90:
-                store_results.append({
-                    "name": store["name"],
-                    "distance_km": round(distance, 2)
-                })
+        for store in catalog.stores_for(product):
+            print(f"Checking store: {store.name} for product: {product}")
+            distance = haversine(lat, lon, store.lat, store.lon)
+            # if distance <= 90:
+            store_results.append({
+                "name": store.name,
+                "distance_km": round(distance, 2)
+            })
         results.append({
             "product": product,
             "brand": brand,
@@ -122,16 +109,10 @@ def location_query(question, lon, lat, chat_history):
         store_list = "\n".join([f"- {s['name']} ({s['distance_km']} km away)" for s in res['stores']])
         store_info += f"\n### {res['product']}\n{store_list}\nAmazon link: {res['amazon_link']}\n"
 
-    llm = AzureChatOpenAI(
-        openai_api_type="azure",
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-        temperature=0.3
-    )
+    return store_info, amazon_link
 
-    prompt = [
+def location_messages(question, chat_history, store_info, amazon_link):
+    return [
         SystemMessage(
             content=f"""Your home website is https://www.madewithnestle.ca/ and you must only use the provided context to answer the question no matter the question contains keywords such as nestle.
                     You need to mention all store info and distance away from the context.
@@ -158,10 +139,33 @@ def location_query(question, lon, lat, chat_history):
             content=f"The user asked: '{question}', the previous conversation history is: {chat_history}.")
     ]
 
-    answer = llm(prompt).content
+def location_query(question, lon, lat, chat_history):
+    product_keywords, product_to_brand = load_brand_keywords()
+
+    matched_product = _with_history_fallback(product_match(question, product_keywords, chat_history), chat_history)
+    if not matched_product:
+        return Response({"answer": NO_PRODUCT_ANSWER}, status=200)
+
+    store_info, amazon_link = store_context(matched_product, lon, lat, product_to_brand)
+    answer = location_llm()(location_messages(question, chat_history, store_info, amazon_link)).content
 
     return Response({"answer": answer}, status=200)
 
+async def alocation_query(question, lon, lat, chat_history):
+    """Async location_query, returns the payload dict instead of a DRF Response"""
+    # The catalog may be (re)loaded from disk, keep that and the store scan off the event loop
+    product_keywords, product_to_brand = await asyncio.to_thread(load_brand_keywords)
+
+    matched_product = await aproduct_match(question, product_keywords, chat_history)
+    matched_product = _with_history_fallback(matched_product, chat_history)
+    if not matched_product:
+        return {"answer": NO_PRODUCT_ANSWER}
+
+    store_info, amazon_link = await asyncio.to_thread(store_context, matched_product, lon, lat, product_to_brand)
+    response = await location_llm().ainvoke(location_messages(question, chat_history, store_info, amazon_link))
+
+    return {"answer": response.content}
+
 if __name__ == "__main__":
     # data = [{'sender': 'user', 'text': 'any recommendation?', 'time': '14:38'}, {'sender': 'bot',
     #                                                                       'text': "Hello! If you're looking for a delightful treat, I have a couple of recommendations that might just hit the spot:\n\n- [**KitKat MEGA (Kit Kat)**](https://www.madewithnestle.ca/kit-kat/kitkat-mega): This is the perfect treat for sharing with friends or family. It's Rainforest Alliance Certified, ensuring that you're enjoying a product made with sustainable practices. Loved worldwide, this KitKat is sure to bring a smile to anyone's face. It's great for gatherings or just a cozy night in with loved ones.\n\n- [**KITKAT Classic Tablet (Kit Kat)**](https://www.madewithnestle.ca/kit-kat/kitkat-classic-tablet): Experience a multisensory snacking delight with this classic treat. Made with quality ingredients and also Rainforest Alliance Certified, it's a snack you can feel good about enjoying. Perfect for a quick break during a busy day or as a sweet treat after dinner.\n\nWould you like to know more about these products, such as nutrition details or where you can find them nearby?",
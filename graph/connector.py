@@ -1,3 +1,4 @@
+import argparse
 import json
 import re
 from neo4j import GraphDatabase
@@ -10,6 +11,9 @@ graph_username = os.getenv("NEO4J_USERNAME")
 graph_password = os.getenv("NEO4J_PASSWORD")
 graph_uri = os.getenv("NEO4J_URI")
 
+# Every label this connector writes, anything else in the database is left alone
+GRAPH_LABELS = "Brand|Product|Nutrition|Feature|Ingredient|Category"
+
 class GraphConnector:
     def __init__(self, uri=graph_uri, user=graph_username, password=graph_password):
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
@@ -17,140 +21,206 @@ class GraphConnector:
     def close(self):
         self.driver.close()
 
-    def create_brand_product_graph(self, chunk):
+    def create_brand_product_graph(self, chunk, snapshot=None):
         with self.driver.session() as session:
-            meta = chunk["metadata"]
-            chunk_type = meta.get("chunk_type", "")
-            brand = meta.get("brand").lower() if meta.get("brand") else ""
-            product = meta.get("product_name").lower() if meta.get("product_name") else ""
-            brand_url = meta.get("brand_url", "")
-            product_url = meta.get("product_url", "")
-
-            # === Node 1: Brand ===
-            if chunk_type == "Brand metadata":
-                session.run(
-                    """
-                    MERGE (b:Brand {name: $brand})
-                    SET b.url = $brand_url,
-                        b.category = $category
-                    """,
-                    brand=brand,
-                    brand_url=brand_url,
-                    category=meta.get("category", "")
-                )
+            session.execute_write(self.write_chunk, chunk, snapshot)
 
-            # === Node 2: Product Introduction ===
-            elif chunk_type == "product_metadata":
-                session.run(
+    def ingest(self, chunks, snapshot):
+        """
+        Write every chunk tagged with the snapshot version and drop what older versions left behind, in one
+        transaction: readers keep seeing the previous graph until it commits, a failed import changes nothing.
+        """
+        with self.driver.session() as session:
+            return session.execute_write(self._ingest, chunks, snapshot)
+
+    def _ingest(self, tx, chunks, snapshot):
+        for chunk in chunks:
+            self.write_chunk(tx, chunk, snapshot)
+
+        # Relationships first: nodes kept by the new version may still hold links it no longer has
+        removed_relationships = tx.run(
+            f"""
+            MATCH (:{GRAPH_LABELS})-[r]->(:{GRAPH_LABELS})
+            WHERE coalesce(r.snapshot, '') <> $snapshot
+            DELETE r
+            RETURN count(r) AS removed
+            """,
+            snapshot=snapshot
+        ).single()["removed"]
+        removed_nodes = tx.run(
+            f"""
+            MATCH (n:{GRAPH_LABELS})
+            WHERE coalesce(n.snapshot, '') <> $snapshot
+            DETACH DELETE n
+            RETURN count(n) AS removed
+            """,
+            snapshot=snapshot
+        ).single()["removed"]
+        return removed_nodes, removed_relationships
+
+    @staticmethod
+    def write_chunk(tx, chunk, snapshot=None):
+        meta = chunk["metadata"]
+        chunk_type = meta.get("chunk_type", "")
+        brand = meta.get("brand").lower() if meta.get("brand") else ""
+        product = meta.get("product_name").lower() if meta.get("product_name") else ""
+        brand_url = meta.get("brand_url", "")
+        product_url = meta.get("product_url", "")
+
+        # === Node 1: Brand ===
+        if chunk_type == "Brand metadata":
+            tx.run(
+                """
+                MERGE (b:Brand {name: $brand})
+                SET b.url = $brand_url,
+                    b.category = $category,
+                    b.snapshot = $snapshot
+                """,
+                brand=brand,
+                brand_url=brand_url,
+                category=meta.get("category", ""),
+                snapshot=snapshot
+            )
+
+        # === Node 2: Product Introduction ===
+        elif chunk_type == "product_metadata":
+            tx.run(
+                """
+                MATCH (b:Brand {name: $brand})
+                MERGE (p:Product {name: $product})
+                SET p.category = $category,
+                    p.status = $status,
+                    p.snapshot = $snapshot
+                MERGE (b)-[r:OWNS]->(p)
+                SET r.snapshot = $snapshot
+                """,
+                brand=brand,
+                product=product,
+                category=meta.get("category").lower() if meta.get("category") else "",
+                status=meta.get("status").lower() if meta.get("status") else "regular product",
+                snapshot=snapshot
+            )
+
+        # === Node 3: Product Description ===
+        elif chunk_type == "core_desc":
+            tx.run(
+                """
+                MATCH (p:Product {name: $product})
+                SET p.specification = $specification,
+                    p.url = $product_url
+                """,
+                product=product,
+                specification=meta.get("specification").lower() if meta.get("specification") else "",
+                product_url=product_url
+            )
+
+        # === Node 4: Nutrition ===
+        elif chunk_type == "nutrition":
+            nutrition_name = meta.get("field").lower() if meta.get("field") else ""
+            value = meta.get("amount", "").strip()
+            dv = meta.get("dv", "").strip()
+
+            # Split the value into numeric and unit parts
+            match = re.match(r"([\d.]+)\s*([a-zA-Z]*)", value)
+            numeric_value = match.group(1) if match else value
+            unit = match.group(2) if match else ""
+
+            tx.run(
+                """
+                MATCH (p:Product {name: $product})
+                MERGE (n:Nutrition {name: $nutrition_name, value: $value, unit: $unit, daily_percent: $dv})
+                SET n.snapshot = $snapshot
+                MERGE (p)-[r:HAS_NUTRITION]->(n)
+                SET r.snapshot = $snapshot
+                """,
+                product=product,
+                nutrition_name=nutrition_name,
+                value=numeric_value,
+                unit=unit,
+                dv=dv,
+                snapshot=snapshot
+            )
+
+        # === Node 5: Product Features ===
+        elif chunk_type == "features":
+            feature = meta.get("field").lower() if meta.get("field") else ""
+            if feature:
+                tx.run(
                     """
-                    MATCH (b:Brand {name: $brand})
-                    MERGE (p:Product {name: $product})
-                    SET p.category = $category,
-                        p.status = $status
-                    MERGE (b)-[:OWNS]->(p)
+                    MATCH (p:Product {name: $product})
+                    MERGE (f:Feature {name: $feature})
+                    SET f.snapshot = $snapshot
+                    MERGE (p)-[r:HAS_FEATURE]->(f)
+                    SET r.snapshot = $snapshot
                     """,
-                    brand=brand,
                     product=product,
-                    category=meta.get("category").lower() if meta.get("category") else "",
-                    status=meta.get("status").lower() if meta.get("status") else "regular product"
+                    feature=feature,
+                    snapshot=snapshot
                 )
 
-            # === Node 3: Product Description ===
-            elif chunk_type == "core_desc":
-                session.run(
+        # === Node 6: Product Ingredients ===
+        elif chunk_type == "ingredients":
+            ingredient = meta.get("field").lower() if meta.get("field") else ""
+            if ingredient:
+                tx.run(
                     """
                     MATCH (p:Product {name: $product})
-                    SET p.specification = $specification,
-                        p.url = $product_url
+                    MERGE (i:Ingredient {name: $ingredient})
+                    SET i.snapshot = $snapshot
+                    MERGE (p)-[r:HAS_INGREDIENT]->(i)
+                    SET r.snapshot = $snapshot
                     """,
                     product=product,
-                    specification=meta.get("specification").lower() if meta.get("specification") else "",
-                    product_url=product_url
+                    ingredient=ingredient,
+                    snapshot=snapshot
                 )
 
-            # === Node 4: Nutrition ===
-            elif chunk_type == "nutrition":
-                nutrition_name = meta.get("field").lower() if meta.get("field") else ""
-                value = meta.get("amount", "").strip()
-                dv = meta.get("dv", "").strip()
-
-                # Split the value into numeric and unit parts
-                match = re.match(r"([\d.]+)\s*([a-zA-Z]*)", value)
-                numeric_value = match.group(1) if match else value
-                unit = match.group(2) if match else ""
-
-                session.run(
+        # === Node 7: Category ===
+        elif chunk_type == "category":
+            category = meta.get("field").lower() if meta.get("field") else ""
+            if category:
+                tx.run(
                     """
                     MATCH (p:Product {name: $product})
-                    MERGE (n:Nutrition {name: $nutrition_name, value: $value, unit: $unit, daily_percent: $dv})
-                    MERGE (p)-[:HAS_NUTRITION]->(n)
+                    MERGE (c:Category {name: $category})
+                    SET c.snapshot = $snapshot
+                    MERGE (p)-[r:BELONGS_TO]->(c)
+                    SET r.snapshot = $snapshot
                     """,
                     product=product,
-                    nutrition_name=nutrition_name,
-                    value=numeric_value,
-                    unit=unit,
-                    dv=dv
+                    category=category,
+                    snapshot=snapshot
                 )
 
-            # === Node 5: Product Features ===
-            elif chunk_type == "features":
-                feature = meta.get("field").lower() if meta.get("field") else ""
-                if feature:
-                    session.run(
-                        """
-                        MATCH (p:Product {name: $product})
-                        MERGE (f:Feature {name: $feature})
-                        MERGE (p)-[:HAS_FEATURE]->(f)
-                        """,
-                        product=product,
-                        feature=feature
-                    )
-
-            # === Node 6: Product Ingredients ===
-            elif chunk_type == "ingredients":
-                ingredient = meta.get("field").lower() if meta.get("field") else ""
-                if ingredient:
-                    session.run(
-                        """
-                        MATCH (p:Product {name: $product})
-                        MERGE (i:Ingredient {name: $ingredient})
-                        MERGE (p)-[:HAS_INGREDIENT]->(i)
-                        """,
-                        product=product,
-                        ingredient=ingredient
-                    )
-
-            # === Node 7: Category ===
-            elif chunk_type == "category":
-                category = meta.get("field").lower() if meta.get("field") else ""
-                if category:
-                    session.run(
-                        """
-                        MATCH (p:Product {name: $product})
-                        MERGE (c:Category {name: $category})
-                        MERGE (p)-[:BELONGS_TO]->(c)
-                        """,
-                        product=product,
-                        category=category
-                    )
-
-            else:
-                print(f"Unknown chunk type: {chunk_type} for product {product}")
-
-def load_and_ingest_optimized(filepath):
+        else:
+            print(f"Unknown chunk type: {chunk_type} for product {product}")
+
+def load_and_ingest_optimized(filepath, snapshot=None):
+    from rag.langchain.snapshots import new_version
+
     with open(filepath, "r", encoding="utf-8") as f:
         raw_data = json.load(f)
 
     brands_data = [raw_data] if isinstance(raw_data, dict) else raw_data
+    snapshot = snapshot or new_version()
 
     connector = GraphConnector()
-    for brand in brands_data:
-        try:
-            connector.create_brand_product_graph(brand)
-        except Exception as e:
-            print(f"FAILED to import: {e}")
-    connector.close()
-    print(f"SUCCESS: {len(brands_data)} records imported.")
+    try:
+        removed_nodes, removed_relationships = connector.ingest(brands_data, snapshot)
+    except Exception as e:
+        # The transaction rolled back, the live graph still holds the previous version
+        print(f"FAILED to import, graph left unchanged: {e}")
+        raise
+    finally:
+        connector.close()
+    print(f"SUCCESS: {len(brands_data)} records imported as snapshot {snapshot} "
+          f"({removed_nodes} stale nodes, {removed_relationships} stale relationships removed).")
+    return snapshot
 
 if __name__ == "__main__":
-    load_and_ingest_optimized("rag/chunks.json")
+    parser = argparse.ArgumentParser(description="Load the chunks into Neo4j in a single transaction")
+    parser.add_argument("--chunks", default="rag/chunks.json")
+    parser.add_argument("--snapshot", help="version tag of the written nodes (default: a new timestamp)")
+    args = parser.parse_args()
+
+    load_and_ingest_optimized(args.chunks, args.snapshot)
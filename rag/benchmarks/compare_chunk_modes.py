@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUTS
+from rag.langchain.context_builder import build_context, count_tokens
+
+QUESTIONS_PATH = "rag/router/labeled_questions.json"
+
+
+def load_questions(path, limit):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [item["question"] for item in data if item["label"] == "rag"][:limit]
+
+
+def load_index(index_dir, embedding):
+    from rag.langchain.index_config import load_index_config, load_vectorstore
+    return load_vectorstore(index_dir, embedding, load_index_config(index_dir))
+
+
+def with_scores(results):
+    from langchain.schema import Document
+    return [Document(page_content=doc.page_content, metadata={**doc.metadata, "score": float(score)})
+            for doc, score in results]
+
+
+def benchmark_layout(mode, vectors, embedding, repeats):
+    layout = CHUNK_LAYOUTS[mode]
+    index_dir = layout["index_dir"]
+    if not os.path.exists(os.path.join(index_dir, "index.faiss")):
+        print(f"[WARNING] No index for the {mode} layout in {index_dir}, run: "
+              f"python -m rag.preprocessing.split_chunks --mode {mode} && python -m rag.preprocessing.embedder --mode {mode}")
+        return None
+
+    build_info = {}
+    if os.path.exists(os.path.join(index_dir, "build_info.json")):
+        with open(os.path.join(index_dir, "build_info.json"), "r", encoding="utf-8") as f:
+            build_info = json.load(f)
+
+    started = time.perf_counter()
+    vectorstore = load_index(index_dir, embedding)
+    load_seconds = time.perf_counter() - started
+
+    latencies, prompt_tokens, raw_tokens, products = [], [], [], []
+    for vector in vectors:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            results = vectorstore.similarity_search_with_score_by_vector(vector, k=layout["k"])
+            latencies.append(time.perf_counter() - started)
+
+        docs = with_scores(results)
+        _, tokens, _ = build_context(docs, budget=10 ** 9)
+        prompt_tokens.append(tokens)
+        raw_tokens.append(sum(count_tokens(doc.page_content) for doc in docs))
+        products.append(len({doc.metadata.get("product_name") for doc in docs if doc.metadata.get("product_name")}))
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "mode": mode,
+        "documents": vectorstore.index.ntotal,
+        "index_mb": sum(os.path.getsize(os.path.join(index_dir, name)) for name in ("index.faiss", "index.pkl", "docstore.sqlite3")
+                        if os.path.exists(os.path.join(index_dir, name))) / 2 ** 20,
+        "build_s": build_info.get("build_seconds"),
+        "load_s": load_seconds,
+        "k": layout["k"],
+        "search_mean_ms": latencies_ms.mean(),
+        "search_p95_ms": np.percentile(latencies_ms, 95),
+        "context_tokens": np.mean(prompt_tokens),
+        "retrieved_tokens": np.mean(raw_tokens),
+        "products_per_query": np.mean(products),
+    }
+
+
+def print_table(rows):
+    columns = list(rows[0].keys())
+    print(" | ".join(f"{column:>18}" for column in columns))
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row[column]
+            cells.append(f"{value:>18.2f}" if isinstance(value, (float, np.floating)) else f"{str(value):>18}")
+        print(" | ".join(cells))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Compare the fine and product chunk layouts of the RAG index")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=20, help="searches per question, for stable latencies")
+    args = parser.parse_args()
+
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    embedding = AzureOpenAIEmbeddings(
+        deployment=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+        openai_api_type="azure",
+        chunk_size=16
+    )
+
+    # Same query vectors for every layout, both indexes are built with the same embedding deployment
+    questions = load_questions(args.questions, args.limit)
+    vectors = embedding.embed_documents(questions)
+    print(f"Questions: {len(questions)}")
+
+    rows = [row for row in (benchmark_layout(mode, vectors, embedding, args.repeats) for mode in CHUNK_LAYOUTS) if row]
+    if rows:
+        print_table(rows)
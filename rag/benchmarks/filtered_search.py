@@ -0,0 +1,75 @@
+import argparse
+import time
+
+import numpy as np
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.index_config import load_index_config, load_vectorstore
+from rag.langchain.metadata_index import MetadataIndex
+
+
+def post_filter_search(index, ids, query, k):
+    """Search everything, discard hits outside ids, widen the search until k hits survive"""
+    allowed = set(ids.tolist())
+    width = k
+    while True:
+        _, positions = index.search(query, min(width, index.ntotal))
+        hits = [p for p in positions[0] if p in allowed][:k]
+        if len(hits) == k or width >= index.ntotal:
+            return hits
+        width *= 4
+
+
+def selector_search(index, metadata_index, filters, query, k):
+    params, candidates = metadata_index.search_params(filters)
+    _, positions = index.search(query, min(k, candidates), params=params)
+    return [p for p in positions[0] if p >= 0]
+
+
+def timed(fn, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - started) / repeats * 1000, result
+
+
+def sample_filters(metadata_index, field, count, rng):
+    values = sorted(metadata_index.postings[field])
+    return [{field: value} for value in rng.choice(values, size=min(count, len(values)), replace=False)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Id-selector filtered search vs search-then-discard")
+    parser.add_argument("--index-dir", default=CHUNK_LAYOUT["index_dir"])
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--filters", type=int, default=20, help="filter values sampled per field")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    # Query vectors are taken from the index itself, no embedding calls needed
+    vectorstore = load_vectorstore(args.index_dir, None, load_index_config(args.index_dir))
+    index = vectorstore.index
+    metadata_index = MetadataIndex(vectorstore)
+    rng = np.random.default_rng(0)
+    queries = index.reconstruct_n(0, index.ntotal)[rng.choice(index.ntotal, size=10, replace=False)]
+
+    print(f"Index: {args.index_dir} ({index.ntotal} vectors), k={args.k}")
+    print(f"{'filter':>12} | {'candidates':>10} | {'unfiltered ms':>13} | {'post-filter ms':>14} | "
+          f"{'selector ms':>11} | {'speedup':>7} | {'same hits':>9}")
+
+    for field in ("product_name", "brand", "chunk_type"):
+        unfiltered, post, selected, candidates, same = [], [], [], [], []
+        for filters in sample_filters(metadata_index, field, args.filters, rng):
+            ids = metadata_index.ids(filters)
+            candidates.append(len(ids))
+            for query in queries:
+                query = query.reshape(1, -1)
+                unfiltered.append(timed(lambda: index.search(query, args.k), args.repeats)[0])
+                post_ms, post_hits = timed(lambda: post_filter_search(index, ids, query, args.k), args.repeats)
+                sel_ms, sel_hits = timed(lambda: selector_search(index, metadata_index, filters, query, args.k), args.repeats)
+                post.append(post_ms)
+                selected.append(sel_ms)
+                same.append(list(post_hits) == list(sel_hits))
+
+        print(f"{field:>12} | {np.mean(candidates):>10.0f} | {np.mean(unfiltered):>13.3f} | {np.mean(post):>14.3f} | "
+              f"{np.mean(selected):>11.3f} | {np.mean(post) / np.mean(selected):>6.1f}x | {np.mean(same):>9.0%}")
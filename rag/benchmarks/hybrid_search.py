@@ -0,0 +1,109 @@
+import argparse
+import json
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.metadata_index import normalize_name
+
+QUESTIONS_PATH = "rag/benchmarks/retrieval_questions.json"
+
+
+def first_hit(docs, expected):
+    """Rank of the first document about the expected product or brand, None when none of them is"""
+    for rank, doc in enumerate(docs):
+        if all(normalize_name(doc.metadata.get(field) or "") == normalize_name(value) for field, value in expected.items()):
+            return rank
+    return None
+
+
+def run_mode(engine, name, search, questions, vectors, embed_ms, k, repeats):
+    ranks, latencies, embedded = [], [], 0
+    for item, vector, embed_time in zip(questions, vectors, embed_ms):
+        expected = {field: item[field] for field in ("product_name", "brand") if field in item}
+        filters, question_k = engine.question_filters(item["question"], k)
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            docs, used_vector = search(item["question"], vector, question_k, filters)
+        latency = (time.perf_counter() - started) / repeats * 1000
+        if used_vector:
+            # The query embedding is an API call in production, counted at its measured latency
+            latency += embed_time
+            embedded += 1
+
+        ranks.append(first_hit(docs, expected))
+        latencies.append(latency)
+
+    hits = [rank for rank in ranks if rank is not None]
+    return {
+        "mode": name,
+        f"hit@{k}": len(hits) / len(ranks),
+        "mrr": sum(1 / (rank + 1) for rank in hits) / len(ranks),
+        "embed_calls": embedded,
+        "mean_ms": np.mean(latencies),
+        "p95_ms": np.percentile(latencies, 95),
+    }
+
+
+def print_table(rows):
+    columns = list(rows[0].keys())
+    print(" | ".join(f"{column:>26}" if column == "mode" else f"{column:>11}" for column in columns))
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row[column]
+            width = 26 if column == "mode" else 11
+            cells.append(f"{value:>{width}.3f}" if isinstance(value, (float, np.floating)) else f"{str(value):>{width}}")
+        print(" | ".join(cells))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Vector-only vs hybrid BM25 + vector retrieval vs the lexical fast path")
+    parser.add_argument("--index-dir", default=CHUNK_LAYOUT["index_dir"])
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--k", type=int, default=CHUNK_LAYOUT["k"])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--confidence", type=float, help="lexical fast path threshold (default RAG_LEXICAL_CONFIDENCE)")
+    args = parser.parse_args()
+
+    from rag.langchain import rag_engine
+
+    if args.confidence is not None:
+        rag_engine.LEXICAL_CONFIDENCE = args.confidence
+    engine = rag_engine.RAGEngine(index_dir=args.index_dir)
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+
+    # Uncached embedding calls, their latency is added to the modes that need the vector
+    vectors, embed_ms = [], []
+    for item in questions:
+        started = time.perf_counter()
+        vectors.append(engine.embedding.embeddings.embed_query(item["question"]))
+        embed_ms.append((time.perf_counter() - started) * 1000)
+
+    def vector_only(question, vector, k, filters):
+        return engine.search_by_vector(vector, k=k, filters=filters), True
+
+    def hybrid(question, vector, k, filters):
+        return engine.hybrid_search(question, vector, k=k, filters=filters), True
+
+    def fast_path(question, vector, k, filters):
+        docs = engine.lexical_retrieve(question, k, filters)
+        if docs is not None:
+            return docs, False
+        return engine.hybrid_search(question, vector, k=k, filters=filters), True
+
+    rows = [
+        run_mode(engine, name, search, questions, vectors, embed_ms, args.k, args.repeats)
+        for name, search in (("vector only", vector_only), ("hybrid", hybrid), ("hybrid + lexical fast path", fast_path))
+    ]
+
+    print(f"Questions: {len(questions)}, index: {args.index_dir}, k={args.k}, "
+          f"embedding call mean {np.mean(embed_ms):.1f} ms, fast path confidence {rag_engine.LEXICAL_CONFIDENCE}")
+    print_table(rows)
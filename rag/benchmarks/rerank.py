@@ -0,0 +1,62 @@
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from rag.benchmarks.hybrid_search import QUESTIONS_PATH, first_hit
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.context_builder import build_context
+from rag.langchain.reranker import RERANK_KEEP, rerank
+
+
+def context_tokens(docs):
+    # build_context prints the product map of every context
+    with contextlib.redirect_stdout(io.StringIO()):
+        return build_context(docs)[1]
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Prompt context tokens and hit rate before and after the local reranker")
+    parser.add_argument("--index-dir", default=CHUNK_LAYOUT["index_dir"])
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--k", type=int, default=CHUNK_LAYOUT["k"], help="retrieved candidates")
+    parser.add_argument("--keep", type=int, default=RERANK_KEEP, help="chunks kept by the reranker")
+    args = parser.parse_args()
+
+    from rag.langchain.rag_engine import RAGEngine
+
+    engine = RAGEngine(index_dir=args.index_dir)
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+
+    columns = ("chunks", "tokens", "hit", "top1")
+    before, after, rerank_ms = {key: [] for key in columns}, {key: [] for key in columns}, []
+    for item in questions:
+        expected = {field: item[field] for field in ("product_name", "brand") if field in item}
+        docs = engine.retrieve(item["question"], k=args.k)
+
+        started = time.perf_counter()
+        reranked = rerank(item["question"], docs, keep=args.keep)
+        rerank_ms.append((time.perf_counter() - started) * 1000)
+
+        for result, selected in ((before, docs), (after, reranked)):
+            rank = first_hit(selected, expected)
+            result["chunks"].append(len(selected))
+            result["tokens"].append(context_tokens(selected))
+            result["hit"].append(rank is not None)
+            result["top1"].append(rank == 0)
+
+    print(f"Questions: {len(questions)}, index: {args.index_dir}, {args.k} candidates, keep {args.keep}")
+    print(f"{'':>16} | {'chunks':>7} | {'context tokens':>14} | {'hit':>6} | {'top-1':>6}")
+    for name, result in (("retrieved", before), ("reranked", after)):
+        print(f"{name:>16} | {np.mean(result['chunks']):>7.2f} | {np.mean(result['tokens']):>14.1f} | "
+              f"{np.mean(result['hit']):>6.2f} | {np.mean(result['top1']):>6.2f}")
+    saved = 1 - np.sum(after["tokens"]) / max(np.sum(before["tokens"]), 1)
+    print(f"Context tokens saved: {saved:.1%}, rerank time mean {np.mean(rerank_ms):.2f} ms, "
+          f"p95 {np.percentile(rerank_ms, 95):.2f} ms")
@@ -0,0 +1,65 @@
+import argparse
+import time
+
+import numpy as np
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.index_config import load_index_config, load_vectorstore
+from rag.langchain.metadata_index import MetadataIndex
+from rag.langchain.sharded_index import SHARD_WORKERS, ShardedIndex, load_shards_config
+
+
+def timed(fn, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - started) / repeats * 1000, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Single index vs shard fan-out vs searching only the named brand's shard")
+    parser.add_argument("--index-dir", default=CHUNK_LAYOUT["index_dir"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    config = load_shards_config(args.index_dir)
+    if config is None:
+        raise SystemExit(f"No shards in {args.index_dir}, run: python -m rag.preprocessing.build_shards --index-dir {args.index_dir}")
+
+    vectorstore = load_vectorstore(args.index_dir, None, load_index_config(args.index_dir))
+    index = vectorstore.index
+    metadata_index = MetadataIndex(vectorstore)
+    sharded = ShardedIndex(args.index_dir, config, index.ntotal)
+
+    # Query vectors are taken from the index itself, no embedding calls needed
+    rng = np.random.default_rng(0)
+    queries = index.reconstruct_n(0, index.ntotal)[rng.choice(index.ntotal, size=args.queries, replace=False)]
+    values = [shard["value"] for shard in config["shards"].values() if shard["value"]]
+
+    single, fanout, routed, routed_single, same = [], [], [], [], []
+    for query in queries:
+        filters = {config["field"]: str(rng.choice(values))}
+        ids = metadata_index.ids(filters)
+        params, _ = metadata_index.search_params(filters)
+
+        single_ms, (_, single_hits) = timed(lambda: index.search(query.reshape(1, -1), args.k), args.repeats)
+        fanout_ms, (_, fanout_hits) = timed(lambda: sharded.search(query, args.k), args.repeats)
+        routed_ms, _ = timed(lambda: sharded.search(query, args.k, ids), args.repeats)
+        filtered_ms, _ = timed(lambda: index.search(query.reshape(1, -1), args.k, params=params), args.repeats)
+
+        single.append(single_ms)
+        fanout.append(fanout_ms)
+        routed.append(routed_ms)
+        routed_single.append(filtered_ms)
+        same.append(list(single_hits[0]) == list(fanout_hits))
+
+    print(f"Index: {args.index_dir} ({index.ntotal} vectors, {len(sharded.shards)} {config['field']} shards, "
+          f"{SHARD_WORKERS} search threads), k={args.k}")
+    print(f"{'search':>34} | {'mean ms':>8} | {'p95 ms':>7}")
+    for name, times in (("single index", single), ("fan-out to every shard", fanout),
+                        (f"single index, {config['field']} selector", routed_single),
+                        (f"{config['field']} shard only", routed)):
+        print(f"{name:>34} | {np.mean(times):>8.3f} | {np.percentile(times, 95):>7.3f}")
+    print(f"Fan-out returns the single-index top-{args.k}: {np.mean(same):.0%}")
@@ -0,0 +1,126 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+from rag.benchmarks.worker_memory import memory_mb
+from rag.langchain.record_store import CatalogStore, ChunkStore, store_path
+
+# Records looked up per case, like the hits of a few requests
+LOOKUPS = 10
+
+
+def sample(json_path):
+    """LOOKUPS positions and (product, brand) names spread over a chunk file, read from its SQLite copy"""
+    store = ChunkStore(store_path(json_path))
+    positions = np.linspace(0, len(store) - 1, LOOKUPS).astype(int).tolist()
+    products = [(r["metadata"].get("product_name"), r["metadata"].get("brand")) for r in store.records_at(positions)]
+    return positions, [(name, brand) for name, brand in products if name]
+
+
+def json_records(json_path, positions, products):
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    return [records[position] for position in positions]
+
+
+def sqlite_by_position(json_path, positions, products):
+    return ChunkStore(store_path(json_path)).records_at(positions)
+
+
+def sqlite_by_product(json_path, positions, products):
+    store = ChunkStore(store_path(json_path))
+    return [store.by_product(name, brand) for name, brand in products]
+
+
+def sqlite_all_records(json_path, positions, products):
+    return list(ChunkStore(store_path(json_path)))
+
+
+def json_catalog(json_path, positions, products):
+    with open(json_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def sqlite_catalog_columns(json_path, positions, products):
+    # What the product catalog indexes read
+    return CatalogStore(store_path(json_path)).link_rows()
+
+
+def sqlite_catalog_products(json_path, positions, products):
+    store = CatalogStore(store_path(json_path))
+    return [store.product(name, brand) for name, brand in products]
+
+
+def sqlite_catalog_load(json_path, positions, products):
+    return CatalogStore(store_path(json_path)).load()
+
+
+CHUNK_CASES = {
+    "json.load + index": json_records,
+    "sqlite by position": sqlite_by_position,
+    "sqlite by product": sqlite_by_product,
+    "sqlite all records": sqlite_all_records,
+}
+CATALOG_CASES = {
+    "json.load": json_catalog,
+    "sqlite index columns": sqlite_catalog_columns,
+    "sqlite by product": sqlite_catalog_products,
+    "sqlite whole catalog": sqlite_catalog_load,
+}
+
+
+def worker(case, json_path, positions, products, results):
+    before = memory_mb()["VmRSS"]
+    started = time.perf_counter()
+    # Held until measured, like a module-level global
+    loaded = case(json_path, positions, products)
+    elapsed = (time.perf_counter() - started) * 1000
+    results.put((elapsed, memory_mb()["VmRSS"] - before, len(loaded)))
+
+
+def run(case, json_path, positions, products, repeats):
+    """Median (ms, RSS growth MB, records) of repeats runs, each in a fresh process"""
+    ctx = mp.get_context("spawn")
+    measured = []
+    for _ in range(repeats):
+        results = ctx.Queue()
+        process = ctx.Process(target=worker, args=(case, json_path, positions, products, results))
+        process.start()
+        measured.append(results.get())
+        process.join()
+    return np.median([m[0] for m in measured]), np.median([m[1] for m in measured]), measured[0][2]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load time and resident memory of the JSON files vs their SQLite copies")
+    parser.add_argument("--chunks", nargs="*", default=["rag/chunks.json", "rag/metadata.json"])
+    parser.add_argument("--catalog", default="rag/brand_products.json")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    catalog_products = []
+    for json_path in args.chunks + [args.catalog]:
+        if not os.path.exists(store_path(json_path)):
+            raise SystemExit(f"{store_path(json_path)} not found, run python -m rag.preprocessing.convert_storage first")
+
+    print(f"{LOOKUPS} lookups per case, median of {args.repeats} fresh processes")
+    print(f"{'file':>24} | {'case':>22} | {'records':>7} | {'ms':>7} | {'RSS MB':>7}")
+    for json_path in args.chunks:
+        positions, products = sample(json_path)
+        catalog_products += products
+        for name, case in CHUNK_CASES.items():
+            ms, rss, records = run(case, json_path, positions, products, args.repeats)
+            print(f"{os.path.basename(json_path):>24} | {name:>22} | {records:>7} | {ms:>7.2f} | {rss:>7.2f}")
+
+    products = catalog_products[:LOOKUPS]
+    for name, case in CATALOG_CASES.items():
+        ms, rss, records = run(case, args.catalog, [], products, args.repeats)
+        print(f"{os.path.basename(args.catalog):>24} | {name:>22} | {records:>7} | {ms:>7.2f} | {rss:>7.2f}")
+
+    for json_path in args.chunks + [args.catalog]:
+        print(f"{json_path}: {os.path.getsize(json_path) / 2 ** 20:.2f} MB, "
+              f"{store_path(json_path)}: {os.path.getsize(store_path(json_path)) / 2 ** 20:.2f} MB")
@@ -0,0 +1,73 @@
+import argparse
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.index_config import load_index_config, load_vectorstore
+
+
+def memory_mb():
+    """Resident memory of this process: total, private (anonymous), file-backed, and proportional share (PSS)"""
+    stats = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "RssAnon", "RssFile"):
+                stats[name] = int(value.split()[0]) / 1024
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    stats["Pss"] = int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        stats["Pss"] = float("nan")
+    return stats
+
+
+def worker(index_dir, mmap, barrier, results):
+    before = memory_mb()
+    vectorstore = load_vectorstore(index_dir, None, load_index_config(index_dir), mmap=mmap)
+
+    # Searching touches every vector of a flat index, like a worker that has served some traffic
+    index = vectorstore.index
+    queries = np.random.default_rng(0).random((8, index.d), dtype=np.float32)
+    index.search(queries, 10)
+
+    # Measure while every worker holds the index, so shared pages are split between them in PSS
+    barrier.wait()
+    after = memory_mb()
+    barrier.wait()
+    results.put((before, after))
+
+
+def run(index_dir, mmap, workers):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(index_dir, mmap, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return measured
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident memory per worker with a copied vs memory-mapped index")
+    parser.add_argument("--index-dir", default=os.getenv("RAG_INDEX_DIR", CHUNK_LAYOUT["index_dir"]))
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    config = load_index_config(args.index_dir)
+    print(f"Index: {args.index_dir} ({config['factory']}), {args.workers} workers, MB per worker")
+    print(f"{'loading':>8} | {'RSS before':>10} | {'RSS after':>9} | {'private':>7} | {'file':>7} | {'PSS':>7} | {'PSS total':>9}")
+
+    for mmap in (False, True):
+        measured = run(args.index_dir, mmap, args.workers)
+        before = np.mean([b["VmRSS"] for b, _ in measured])
+        after = {key: np.mean([a[key] for _, a in measured]) for key in ("VmRSS", "RssAnon", "RssFile", "Pss")}
+        print(f"{'mmap' if mmap else 'copy':>8} | {before:>10.1f} | {after['VmRSS']:>9.1f} | {after['RssAnon']:>7.1f} | "
+              f"{after['RssFile']:>7.1f} | {after['Pss']:>7.1f} | {after['Pss'] * args.workers:>9.1f}")
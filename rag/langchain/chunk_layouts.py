@@ -0,0 +1,28 @@
+import os
+
+# === Chunk layouts the RAG index can be built from ===
+# fine:    one chunk per fact (single nutrient, ingredient, feature), split_chunks.py default
+# product: one overview, nutrition table and ingredient list per product, fewer and larger documents
+CHUNK_LAYOUTS = {
+    "fine": {
+        "chunks": "rag/chunks.json",
+        "index_dir": "rag/faiss_index",
+        "k": 10,
+        "filtered_k": 6,
+        "rerank_keep": 5,
+    },
+    "product": {
+        "chunks": "rag/product_chunks.json",
+        "index_dir": "rag/faiss_index_product",
+        "k": 4,
+        "filtered_k": 3,
+        "rerank_keep": 2,
+    },
+}
+
+CHUNK_MODE = os.getenv("RAG_CHUNK_MODE", "fine")
+if CHUNK_MODE not in CHUNK_LAYOUTS:
+    print(f"[WARNING] Unknown RAG_CHUNK_MODE {CHUNK_MODE!r}, using the fine layout")
+    CHUNK_MODE = "fine"
+
+CHUNK_LAYOUT = CHUNK_LAYOUTS[CHUNK_MODE]
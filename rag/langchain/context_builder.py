@@ -0,0 +1,138 @@
+import os
+import re
+from functools import lru_cache
+
+# === Token budgets per request ===
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", "2000"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("RAG_HISTORY_TOKENS", "600"))
+# Longest a single past message may be in the prompt, long bot answers are cut to their beginning
+HISTORY_MESSAGE_TOKENS = int(os.getenv("RAG_HISTORY_MESSAGE_TOKENS", "200"))
+HISTORY_MESSAGES = 6
+
+# Tokenizer of the chat deployment: gpt-4o / gpt-4.1 family use o200k_base, gpt-4 / gpt-35-turbo use cl100k_base
+TOKENIZER_ENCODING = os.getenv("RAG_TOKENIZER_ENCODING", "o200k_base")
+
+# Multiplies the FAISS distance of a chunk (lower is better): descriptive chunks answer most RAG questions,
+# nutrition and ingredient lists are long and mostly useful to the GraphRAG route
+CHUNK_TYPE_WEIGHTS = {
+    "product_metadata": 0.9,
+    "core_desc": 0.9,
+    "features": 1.0,
+    "category": 1.05,
+    "Brand metadata": 1.05,
+    "ingredients": 1.1,
+    "nutrition": 1.15,
+    # product layout (RAG_CHUNK_MODE=product)
+    "product_overview": 0.9,
+    "ingredients_list": 1.05,
+    "nutrition_table": 1.05,
+}
+
+TRUNCATION_MARK = " …"
+
+
+@lru_cache()
+def get_tokenizer():
+    """tiktoken encoding, or None (character estimate) when the encoding files can't be loaded"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        print(f"[WARNING] Tokenizer {TOKENIZER_ENCODING} unavailable, estimating tokens from length: {e}")
+        return None
+
+
+def count_tokens(text):
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return (len(text) + 3) // 4
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens):
+    """First max_tokens tokens of text, marked when something was cut"""
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text[:max_tokens * 4].rstrip() + TRUNCATION_MARK
+    return tokenizer.decode(tokenizer.encode(text, disallowed_special=())[:max_tokens]).rstrip() + TRUNCATION_MARK
+
+
+def chunk_priority(doc, rank):
+    """
+    Sort key of a retrieved chunk: distance weighted by chunk type, its rank when there is no score or the
+    chunks were reranked already
+    """
+    score = doc.metadata.get("score")
+    if score is None or "rerank" in doc.metadata:
+        return rank
+    return score * CHUNK_TYPE_WEIGHTS.get(doc.metadata.get("chunk_type"), 1.0)
+
+
+def _strip_bot_extras(text):
+    # Images and the "Related Links" block are appended to answers by us, the model doesn't need them back
+    text = text.split("\n\n**Related Links**")[0]
+    return re.sub(r"!\[[^\]]*\]\([^)]*\)", "", text).strip()
+
+
+def build_history(chat_history, budget=HISTORY_TOKEN_BUDGET, message_tokens=HISTORY_MESSAGE_TOKENS):
+    """Recent messages, newest kept first, each capped to message_tokens and all of them to budget"""
+    lines = []
+    used = 0
+    for msg in reversed(chat_history[-HISTORY_MESSAGES:]):
+        role = "User" if msg["sender"] == "user" else "Assistant"
+        text = msg["text"] if msg["sender"] == "user" else _strip_bot_extras(msg["text"])
+        line = f"{role}: {truncate_tokens(text, message_tokens)}"
+
+        tokens = count_tokens(line)
+        if used + tokens > budget:
+            break
+        lines.append(line)
+        used += tokens
+
+    return "\n".join(reversed(lines)), used
+
+
+def build_context(source_docs, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Product-grouped context under a token budget. Chunks are admitted by chunk_priority until the
+    budget is spent, then printed grouped by product in retrieval order, like the unbudgeted context.
+    Returns (context, tokens, dropped_chunks).
+    """
+    candidates = [
+        (chunk_priority(doc, rank), rank, doc) for rank, doc in enumerate(source_docs)
+        if doc.metadata.get("product_name") and doc.metadata.get("product_url")
+    ]
+
+    selected = []
+    headers = set()
+    used = 0
+    for _, rank, doc in sorted(candidates, key=lambda item: (item[0], item[1])):
+        pname = doc.metadata["product_name"]
+        cost = count_tokens(doc.page_content) + 1
+        if pname not in headers:
+            cost += count_tokens(f"=== {pname} ===\nURL: {doc.metadata['product_url']}\n\n")
+
+        if used + cost > budget:
+            # Smaller chunks further down may still fit
+            continue
+        selected.append((rank, doc))
+        headers.add(pname)
+        used += cost
+
+    product_map = {}
+    for _, doc in sorted(selected, key=lambda item: item[0]):
+        pdata = product_map.setdefault(doc.metadata["product_name"], {"url": doc.metadata["product_url"], "chunks": []})
+        pdata["chunks"].append(doc.page_content)
+
+    print("[DEBUG] Product Map:", product_map)
+
+    context = ""
+    for pname, pdata in product_map.items():
+        context += f"=== {pname} ===\nURL: {pdata['url']}\n"
+        context += "\n".join(pdata["chunks"])
+        context += "\n\n"
+
+    return context, used, len(candidates) - len(selected)
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from rag.langchain.micro_batcher import EMBED_BATCH_MAX, EMBED_BATCH_WAIT_MS, MicroBatcher
+
+# === Cache configuration ===
+CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE_PATH", "rag/cache/query_embeddings.sqlite3")
+CACHE_TTL = float(os.getenv("RAG_EMBEDDING_CACHE_TTL", str(30 * 24 * 3600)))
+MEMORY_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_MEMORY_SIZE", "2048"))
+DISK_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_DISK_SIZE", "200000"))
+
+# Disk eviction is a full table scan, only run it every N writes
+EVICT_EVERY = 200
+
+
+def normalize_query(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivial variants share a key"""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+def cache_key(text, deployment):
+    return hashlib.sha1(f"{deployment}\0{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier (in-memory LRU + SQLite) cache of query embeddings with TTL and size-based eviction"""
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, memory_size=MEMORY_SIZE, disk_size=DISK_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        # Disk hits since the last flush, key -> access time
+        self._accessed = {}
+        self._local = threading.local()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            try:
+                self._db = self._open_db(path)
+            except (sqlite3.Error, OSError) as e:
+                print(f"[WARNING] Embedding cache disk tier disabled ({path}): {e}")
+
+    @staticmethod
+    def _open_db(path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Shared by every worker on the node, WAL lets readers proceed while one worker writes
+        db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                deployment TEXT,
+                vector BLOB,
+                created REAL,
+                accessed REAL
+            )
+            """
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_accessed ON embeddings (accessed)")
+        db.commit()
+        return db
+
+    def get(self, text, deployment):
+        key = cache_key(text, deployment)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                vector, created = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return vector
+                del self._memory[key]
+
+        # Read outside the lock, concurrent disk hits don't queue behind each other or behind a write
+        row = self._read(key)
+
+        with self._lock:
+            if row is not None and now - row[1] <= self.ttl:
+                vector = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, vector, row[1])
+                self.disk_hits += 1
+                # The access time only orders the size-based eviction, it is written in batches
+                self._accessed[key] = now
+                if len(self._accessed) >= EVICT_EVERY:
+                    self._flush_accessed()
+                return vector
+
+            self.misses += 1
+            return None
+
+    def _read(self, key):
+        """(vector, created) of key on disk, None if absent, read over this thread's connection"""
+        if self._db is None:
+            return None
+        try:
+            reader = getattr(self._local, "reader", None)
+            if reader is None:
+                reader = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+                self._local.reader = reader
+            return reader.execute("SELECT vector, created FROM embeddings WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"[WARNING] Embedding cache read failed: {e}")
+            return None
+
+    def _flush_accessed(self):
+        """Write the access times of the disk hits since the last flush, called with the lock held"""
+        accessed, self._accessed = self._accessed, {}
+        if not accessed:
+            return
+        try:
+            self._db.executemany("UPDATE embeddings SET accessed = ? WHERE key = ?",
+                                 [(when, key) for key, when in accessed.items()])
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"[WARNING] Embedding cache access time update failed: {e}")
+
+    def put(self, text, deployment, vector):
+        key = cache_key(text, deployment)
+        vector = np.asarray(vector, dtype=np.float32)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, vector, now)
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, deployment, vector, created, accessed) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, deployment, vector.tobytes(), now, now)
+                )
+                self._db.commit()
+                self._writes += 1
+                if self._writes % EVICT_EVERY == 0:
+                    self._flush_accessed()
+                    self._evict_disk(now)
+            except sqlite3.Error as e:
+                print(f"[WARNING] Embedding cache write failed: {e}")
+
+    def _remember(self, key, vector, created):
+        self._memory[key] = (vector, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        """Drop expired rows, then the least recently used ones beyond the size limit"""
+        self._db.execute("DELETE FROM embeddings WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            "  SELECT key FROM embeddings ORDER BY accessed DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self.disk_size,)
+        )
+        self._db.commit()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that answers repeated texts from an EmbeddingCache instead of the API"""
+
+    def __init__(self, embeddings, cache, deployment, batching=False):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.deployment = deployment
+        # Cache misses of concurrent requests share one embeddings request
+        self.batcher = MicroBatcher(self._embed_batch, EMBED_BATCH_MAX, EMBED_BATCH_WAIT_MS, "embed") if batching else None
+
+    def _embed_batch(self, texts):
+        unique = list(dict.fromkeys(texts))
+        try:
+            vectors = dict(zip(unique, self.embeddings.embed_documents(unique)))
+        except Exception as e:
+            if len(unique) == 1:
+                # Every caller of the batch asked for this text
+                return [e] * len(texts)
+            # One failing text must not fail the other requests of the batch
+            vectors = {}
+            for text in unique:
+                try:
+                    vectors[text] = self.embeddings.embed_query(text)
+                except Exception as text_error:
+                    vectors[text] = text_error
+        return [vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        vector = self.cache.get(text, self.deployment)
+        if vector is not None:
+            return vector.tolist()
+
+        vector = self.batcher.submit(text) if self.batcher else self.embeddings.embed_query(text)
+        self.cache.put(text, self.deployment, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        # The disk tier is a SQLite file, read and written off the event loop
+        vector = await asyncio.to_thread(self.cache.get, text, self.deployment)
+        if vector is not None:
+            return vector.tolist()
+
+        if self.batcher:
+            vector = await self.batcher.asubmit(text)
+        else:
+            vector = await self.embeddings.aembed_query(text)
+        await asyncio.to_thread(self.cache.put, text, self.deployment, vector)
+        return vector
+
+    def embed_documents(self, texts):
+        vectors = [self.cache.get(text, self.deployment) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        if missing:
+            fresh = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                self.cache.put(texts[i], self.deployment, vector)
+                vectors[i] = vector
+
+        return [vector.tolist() if isinstance(vector, np.ndarray) else vector for vector in vectors]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Process-wide embedding cache, it outlives engine reloads since query vectors don't depend on the index"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
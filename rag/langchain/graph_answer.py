@@ -3,28 +3,76 @@ from langchain.chat_models import AzureChatOpenAI
 from langchain.graphs import Neo4jGraph
 from langchain.schema import SystemMessage, HumanMessage
 from langchain.chains import GraphCypherQAChain
+import asyncio
 import os
 import re
 import json
+import time
+import weakref
 from dotenv import load_dotenv
 from typing import List, Dict, Optional, Tuple
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, AsyncGraphDatabase
+
+from rag.langchain.product_catalog import get_catalog
 
 # Initialize Azure OpenAI
 load_dotenv()
 
+# GET node labels and properties
+SCHEMA_NODE_QUERY = """
+CALL db.labels() YIELD label
+CALL {
+    WITH label
+    CALL apoc.cypher.run('MATCH (n:`' + label + '`) RETURN keys(n) as props', {}) YIELD value
+    RETURN label, value.props as properties
+}
+RETURN label, properties
+"""
+
+# GET relationship types
+SCHEMA_REL_QUERY = """
+CALL db.relationshipTypes() YIELD relationshipType
+RETURN relationshipType
+"""
+
+DEFAULT_SCHEMA = {
+    "nodes": [
+        {"label": "Brand", "properties": ["name", "category", "url"]},
+        {"label": "Product", "properties": ["name", "specification", "category", "url", "status"]},
+        {"label": "Nutrition", "properties": ["unit", "name", "daily_percent", "value"]},
+        {"label": "Feature", "properties": ["name"]},
+        {"label": "Ingredient", "properties": ["name"]},
+        {"label": "Category", "properties": ["name"]}
+    ],
+    "relationships": ["OWNS", "HAS_NUTRITION", "HAS_FEATURE", "HAS_INGREDIENT", "BELONGS_TO"]
+}
+
+DANGEROUS_KEYWORDS = ['CREATE', 'DELETE', 'MERGE', 'SET', 'REMOVE', 'DROP']
+
+# Brand names not in the catalog, which only lists the brands of the products
+COMPANY_KEYWORDS = ['nestle', 'nestlé']
+
+FALLBACK_CYPHER = "MATCH (p:Product) RETURN p.name, p.url LIMIT 10"
+BROAD_FALLBACK_CYPHER = "MATCH (p:Product) RETURN p.name, p.url, p.category LIMIT 20"
+
+NO_RESULTS_ANSWER = "I couldn't find any relevant information in our database for your question. Could you try rephrasing or asking about specific products or nutrition information?"
+
+
+def _make_llm():
+    return AzureChatOpenAI(
+        openai_api_type="azure",
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+        temperature=0,
+        n=1
+    )
+
 
 class EnhancedGraphRAG:
     def __init__(self):
-        self.llm = AzureChatOpenAI(
-            openai_api_type="azure",
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-            temperature=0,
-            n=1
-        )
+        self.llm = _make_llm()
 
         self.graph = Neo4jGraph(
             url=os.getenv("NEO4J_URI"),
@@ -46,37 +94,13 @@ class EnhancedGraphRAG:
         """Dynamically construct the schema from Neo4j"""
         try:
             with self.driver.session() as session:
-                # GET node labels and properties
-                node_query = """
-                CALL db.labels() YIELD label
-                CALL {
-                    WITH label
-                    CALL apoc.cypher.run('MATCH (n:`' + label + '`) RETURN keys(n) as props', {}) YIELD value
-                    RETURN label, value.props as properties
-                }
-                RETURN label, properties
-                """
-
-                # GET relationship types
-                rel_query = """
-                CALL db.relationshipTypes() YIELD relationshipType
-                RETURN relationshipType
-                """
-
                 try:
-                    nodes = session.run(node_query).data()
+                    nodes = session.run(SCHEMA_NODE_QUERY).data()
                 except:
                     # Use default schema if APOC dynamic query fails
-                    nodes = [
-                        {"label": "Brand", "properties": ["name", "category", "url"]},
-                        {"label": "Product", "properties": ["name", "specification", "category", "url", "status"]},
-                        {"label": "Nutrition", "properties": ["unit", "name", "daily_percent", "value"]},
-                        {"label": "Feature", "properties": ["name"]},
-                        {"label": "Ingredient", "properties": ["name"]},
-                        {"label": "Category", "properties": ["name"]}
-                    ]
+                    nodes = DEFAULT_SCHEMA["nodes"]
 
-                relationships = session.run(rel_query).data()
+                relationships = session.run(SCHEMA_REL_QUERY).data()
 
                 return {
                     "nodes": nodes,
@@ -85,17 +109,7 @@ class EnhancedGraphRAG:
         except Exception as e:
             print(f"[WARNING] Schema discovery failed: {e}")
             # Return a default schema if discovery fails
-            return {
-                "nodes": [
-                    {"label": "Brand", "properties": ["name", "category", "url"]},
-                    {"label": "Product", "properties": ["name", "specification", "category", "url", "status"]},
-                    {"label": "Nutrition", "properties": ["unit", "name", "daily_percent", "value"]},
-                    {"label": "Feature", "properties": ["name"]},
-                    {"label": "Ingredient", "properties": ["name"]},
-                    {"label": "Category", "properties": ["name"]}
-                ],
-                "relationships": ["OWNS", "HAS_NUTRITION", "HAS_FEATURE", "HAS_INGREDIENT", "BELONGS_TO"]
-            }
+            return DEFAULT_SCHEMA
 
     def _load_query_examples(self):
         """Load predefined query examples"""
@@ -158,30 +172,45 @@ class EnhancedGraphRAG:
             if keyword in question.lower():
                 entities["nutrition_names"].append(keyword)
 
-        # Brand keywords
-        brand_keywords = ['nestle', 'nestlé', 'aero', 'coffee crisp', 'after eight', 'big turk', 'kit kat',]
-        for keyword in brand_keywords:
+        # Company names, then the brand and product names of the catalog
+        for keyword in COMPANY_KEYWORDS:
             if keyword in question.lower():
                 entities["brand_names"].append(keyword)
+        brand_names, product_names = get_catalog().mentions(question)
+        entities["brand_names"] += brand_names
+        entities["product_names"] = product_names
 
-        # Extract product names
         numbers = re.findall(r'\d+', question)
         entities["numbers"] = [int(n) for n in numbers]
 
         return entities
 
+    @staticmethod
+    def _check_read_only(cypher):
+        """Basic validation: non-empty query without write operations"""
+        if not cypher.strip():
+            return False, "Empty query"
+
+        # Check for dangerous operations
+        for keyword in DANGEROUS_KEYWORDS:
+            if keyword.upper() in cypher.upper():
+                return False, f"Dangerous operation detected: {keyword}"
+
+        return True, "Valid"
+
+    @staticmethod
+    def _limited(cypher):
+        # Add LIMIT to avoid long-running queries
+        if "LIMIT" not in cypher.upper():
+            return cypher + " LIMIT 5"
+        return cypher
+
     def _validate_cypher_syntax(self, cypher):
         """Validate Cypher syntax and check for dangerous operations"""
         try:
-            # Basic validation
-            if not cypher.strip():
-                return False, "Empty query"
-
-            # Check for dangerous operations
-            dangerous_keywords = ['CREATE', 'DELETE', 'MERGE', 'SET', 'REMOVE', 'DROP']
-            for keyword in dangerous_keywords:
-                if keyword.upper() in cypher.upper():
-                    return False, f"Dangerous operation detected: {keyword}"
+            is_read_only, message = self._check_read_only(cypher)
+            if not is_read_only:
+                return False, message
 
             # Try to explain the query to check syntax
             with self.driver.session() as session:
@@ -196,12 +225,7 @@ class EnhancedGraphRAG:
         """Test Cypher execution"""
         try:
             with self.driver.session() as session:
-                # Add LIMIT to avoid long-running queries
-                test_cypher = cypher
-                if "LIMIT" not in cypher.upper():
-                    test_cypher += " LIMIT 5"
-
-                result = session.run(test_cypher)
+                result = session.run(self._limited(cypher))
                 data = result.data()
                 return True, data
         except Exception as e:
@@ -250,26 +274,33 @@ class EnhancedGraphRAG:
                 Cypher:
                 """
 
-    def _generate_multiple_candidates(self, question):
-        """Generate multiple Cypher query candidates"""
+    def _candidate_prompts(self, question):
+        """LLM prompts (enhanced, then the simple backup) and the template-based query for a question"""
         entities = self._extract_entities(question)
         intent = self._classify_query_intent(question)
 
-        candidates = []
-
-        # Method 1: Enhanced prompt with LLM
         enhanced_prompt = self._build_enhanced_prompt(question, entities, intent)
-        messages = [HumanMessage(content=enhanced_prompt)]
-        response1 = self.llm.invoke(messages)
-        candidates.append(response1.content.strip())
-
-        # Method 2: Template-based generation
         template_cypher = self._template_based_generation(question, entities, intent)
+        return [enhanced_prompt, self._simple_prompt(question)], template_cypher
+
+    @staticmethod
+    def _order_candidates(llm_candidates, template_cypher):
+        # Enhanced prompt first, then the template query, the simple prompt is the backup
+        candidates = [llm_candidates[0]]
         if template_cypher:
             candidates.append(template_cypher)
+        candidates.append(llm_candidates[1])
+        return candidates
 
-        # Method 3: Simple prompt for fallback (Backup)
-        simple_prompt = f"""
+    def _generate_multiple_candidates(self, question):
+        """Generate multiple Cypher query candidates"""
+        prompts, template_cypher = self._candidate_prompts(question)
+        responses = [self.llm.invoke([HumanMessage(content=prompt)]) for prompt in prompts]
+        return self._order_candidates([r.content.strip() for r in responses], template_cypher)
+
+    @staticmethod
+    def _simple_prompt(question):
+        return f"""
                         Generate a Neo4j Cypher query for: {question}
                 
                         Schema: Brand-[:OWNS]->Product-[:HAS_NUTRITION]->Nutrition
@@ -281,11 +312,6 @@ class EnhancedGraphRAG:
                 
                         Cypher:
                         """
-        messages = [HumanMessage(content=simple_prompt)]
-        response2 = self.llm.invoke(messages)
-        candidates.append(response2.content.strip())
-
-        return candidates
 
     def _template_based_generation(self, question, entities, intent):
         """Generate Cypher using predefined templates based on intent and entities"""
@@ -314,70 +340,87 @@ class EnhancedGraphRAG:
 
         return cypher.strip()
 
-    def generate_robust_cypher(self, question, chat_history=None):
-        """Construct a robust Cypher query with validation and fallback"""
-        print(f"[DEBUG] Generating Cypher for: {question}")
-
-        # Step 0: Check if chat history is provided
-        if chat_history:
-            mentioned_products = self.resolve_product_coreference(question, chat_history)
-            if mentioned_products:
-                product_hint = ", ".join(mentioned_products)
-                question = f"User mentioned products:{product_hint}。\nUser question:{question}"
-
-        # Step 1: Generate multiple candidates based on combined questions if chat history is provided
-        candidates = self._generate_multiple_candidates(question)
-        print(f"[DEBUG] Generated {len(candidates)} candidates")
-
+    @staticmethod
+    def _with_product_hint(question, mentioned_products):
+        if not mentioned_products:
+            return question
+        product_hint = ", ".join(mentioned_products)
+        return f"User mentioned products:{product_hint}。\nUser question:{question}"
+
+    def _check_candidate(self, i, cypher):
+        """Fix, validate and test-run one candidate, returns (fixed_cypher, score or None, validation entry)"""
+        print(f"[DEBUG] Testing candidate {i + 1}: {cypher[:100]}...")
+
+        # Fix common Cypher errors
+        fixed_cypher = self._fix_common_cypher_errors(cypher)
+
+        # Syntax validation
+        is_valid, error_msg = self._validate_cypher_syntax(fixed_cypher)
+        if not is_valid:
+            return self._scored(i, fixed_cypher, is_valid, error_msg)
+
+        # Execute the Cypher query to test if it runs correctly
+        can_execute, result = self._test_cypher_execution(fixed_cypher)
+        return self._scored(i, fixed_cypher, is_valid, error_msg, can_execute, result)
+
+    @staticmethod
+    def _scored(i, fixed_cypher, is_valid, error_msg, can_execute=None, result=None):
+        validation = {
+            "cypher": fixed_cypher,
+            "syntax_valid": is_valid,
+            "error": error_msg
+        }
+        if not is_valid:
+            print(f"[DEBUG] Candidate {i + 1} syntax error: {error_msg}")
+            return fixed_cypher, None, validation
+
+        validation["can_execute"] = can_execute
+        validation["result_preview"] = result if can_execute else str(result)
+        if not can_execute:
+            print(f"[DEBUG] Candidate {i + 1} execution error: {result}")
+            return fixed_cypher, None, validation
+
+        # Calculate a score based on the result
+        score = len(result) if isinstance(result, list) else 1
+        print(f"[DEBUG] Candidate {i + 1} score: {score}")
+        return fixed_cypher, score, validation
+
+    @staticmethod
+    def _select_best(checked):
+        """Highest scoring candidate (first one wins ties), or the fallback query"""
         best_cypher = None
         best_score = -1
         validation_results = {}
 
-        for i, cypher in enumerate(candidates):
-            if not cypher:
-                continue
-
-            print(f"[DEBUG] Testing candidate {i + 1}: {cypher[:100]}...")
-
-            # Fix common Cypher errors
-            fixed_cypher = self._fix_common_cypher_errors(cypher)
-
-            # Syntax validation
-            is_valid, error_msg = self._validate_cypher_syntax(fixed_cypher)
-            validation_results[f"candidate_{i + 1}"] = {
-                "cypher": fixed_cypher,
-                "syntax_valid": is_valid,
-                "error": error_msg
-            }
-
-            if not is_valid:
-                print(f"[DEBUG] Candidate {i + 1} syntax error: {error_msg}")
-                continue
-
-            # Execute the Cypher query to test if it runs correctly
-            can_execute, result = self._test_cypher_execution(fixed_cypher)
-            validation_results[f"candidate_{i + 1}"]["can_execute"] = can_execute
-            validation_results[f"candidate_{i + 1}"]["result_preview"] = result if can_execute else str(result)
-
-            if can_execute:
-                # Calculate a score based on the result
-                score = len(result) if isinstance(result, list) else 1
-                print(f"[DEBUG] Candidate {i + 1} score: {score}")
-
-                if score > best_score:
-                    best_score = score
-                    best_cypher = fixed_cypher
-            else:
-                print(f"[DEBUG] Candidate {i + 1} execution error: {result}")
+        for i, (fixed_cypher, score, validation) in checked:
+            validation_results[f"candidate_{i + 1}"] = validation
+            if score is not None and score > best_score:
+                best_score = score
+                best_cypher = fixed_cypher
 
         if not best_cypher:
             # All candidates failed, use a fallback query
             print("[DEBUG] All candidates failed, using fallback")
-            best_cypher = "MATCH (p:Product) RETURN p.name, p.url LIMIT 10"
+            best_cypher = FALLBACK_CYPHER
             validation_results["fallback"] = {"cypher": best_cypher, "reason": "All candidates failed"}
 
         return best_cypher, validation_results
 
+    def generate_robust_cypher(self, question, chat_history=None):
+        """Construct a robust Cypher query with validation and fallback"""
+        print(f"[DEBUG] Generating Cypher for: {question}")
+
+        # Step 0: Check if chat history is provided
+        if chat_history:
+            question = self._with_product_hint(question, self.resolve_product_coreference(question, chat_history))
+
+        # Step 1: Generate multiple candidates based on combined questions if chat history is provided
+        candidates = self._generate_multiple_candidates(question)
+        print(f"[DEBUG] Generated {len(candidates)} candidates")
+
+        checked = [(i, self._check_candidate(i, cypher)) for i, cypher in enumerate(candidates) if cypher]
+        return self._select_best(checked)
+
     def query_with_fallback(self, question, chat_history):
         """Cypher query with fallback mechanism"""
         try:
@@ -392,10 +435,9 @@ class EnhancedGraphRAG:
 
                 if not data:
                     # Use broad fallback if no results
-                    fallback_cypher = "MATCH (p:Product) RETURN p.name, p.url, p.category LIMIT 20"
-                    result = session.run(fallback_cypher)
+                    result = session.run(BROAD_FALLBACK_CYPHER)
                     data = result.data()
-                    cypher_query = fallback_cypher
+                    cypher_query = BROAD_FALLBACK_CYPHER
 
                 return {
                     "success": True,
@@ -414,10 +456,38 @@ class EnhancedGraphRAG:
                 "validation_info": validation_info if 'validation_info' in locals() else {}
             }
 
-    def resolve_product_coreference(self, question, chat_history):
-        def build_prompt(q, history):
-            history_text = "\n".join([f"{item['sender']}: {item['text']}" for item in history])
-            return f"""You're an intelligent assistant, and you're asked to determine, based on a user's history of conversations, which product they're referring to when they mention pronouns like “it”, “this”, "first one", "last one", "them", "th one" in their latest question.
+    def answer_messages(self, question, cypher_answer):
+        """Messages for the final generation over the Cypher results"""
+        system_prompt = """
+                        Your home website is https://www.madewithnestle.ca/ and you must only use the provided context to answer the question.
+                        Do not rely on your own knowledge or assumptions.
+                        If the user asks for your name, respond with: "My name is Nestle Assistant, I'm your personal MadeWithNestle assistant."
+                        Be concise, factual, and in English. **Do not say 'based on the context'**.
+                        Only use content that is clearly relevant to the question.
+                        Ignore irrelevant products or content even if they are nearby in the context.
+                        
+                        If the answer contains product recommendations, format each product as a markdown hyperlink: [**Product Name**](product_url)
+                        """
+
+        user_prompt = f"""
+                        User asked: {question}
+                
+                        Results from Neo4j graph database:
+                        {json.dumps(cypher_answer, indent=2)}
+                
+                        Respond conversationally like a helpful assistant. Use appropriate emojis when suitable.
+                        Focus on the most relevant results and present them clearly.
+                        """
+
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+
+    @staticmethod
+    def _coreference_prompt(q, history):
+        history_text = "\n".join([f"{item['sender']}: {item['text']}" for item in history])
+        return f"""You're an intelligent assistant, and you're asked to determine, based on a user's history of conversations, which product they're referring to when they mention pronouns like “it”, “this”, "first one", "last one", "them", "th one" in their latest question.
 
                     Conversation history:
                     {history_text}
@@ -428,13 +498,85 @@ class EnhancedGraphRAG:
                     Please return only a list of the product name mentioned, no extra explanation or additional description is needed, if no specific product is mentioned, then return "None".
                     """
 
-        prompt = build_prompt(question, chat_history)
-        response = self.llm([HumanMessage(content=prompt)])
-        answer = response.content.strip()
+    @staticmethod
+    def _parse_coreference(answer):
+        answer = answer.strip()
         if answer.lower() == "none":
             return None
         return answer.split(", ")
 
+    def resolve_product_coreference(self, question, chat_history):
+        prompt = self._coreference_prompt(question, chat_history)
+        response = self.llm([HumanMessage(content=prompt)])
+        return self._parse_coreference(response.content)
+
+def _early_payload(query_result):
+    """(payload, status) when there is nothing to generate from: failed query or no results"""
+    if not query_result["success"]:
+        return {
+            "error": query_result["error"],
+            "debug_info": query_result.get("validation_info", {})
+        }, 500
+
+    print(f"[DEBUG] Query successful. Found {query_result['result_count']} results")
+    print(f"[DEBUG] Used Cypher: {query_result['cypher_used']}")
+
+    # Return error message if no results found
+    if not query_result["data"]:
+        return {
+            "answer": NO_RESULTS_ANSWER,
+            "debug_info": {
+                "cypher_used": query_result["cypher_used"],
+                "result_count": 0
+            }
+        }, 200
+
+    return None
+
+
+def _answer_payload(answer, query_result):
+    return {
+        "answer": answer,
+        "debug_info": {
+            "cypher_used": query_result["cypher_used"],
+            "result_count": query_result["result_count"],
+            "validation_info": query_result.get("validation_info", {})
+        }
+    }
+
+
+def _error_payload(e):
+    return {
+        "error": "I'm having trouble processing your question right now. Please try again later.",
+        "debug_error": str(e)
+    }
+
+
+def _fallback_chain_answer(question):
+    """LAST RESORT: the original GraphCypherQAChain"""
+    print("[DEBUG] Falling back to original method")
+
+    llm = _make_llm()
+
+    graph = Neo4jGraph(
+        url=os.getenv("NEO4J_URI"),
+        username=os.getenv("NEO4J_USERNAME"),
+        password=os.getenv("NEO4J_PASSWORD")
+    )
+
+    # Construct the basic Cypher chain
+    cypher_chain = GraphCypherQAChain.from_llm(
+        llm=llm,
+        graph=graph,
+        verbose=True,
+        return_intermediate_steps=True,
+        allow_dangerous_requests=True
+    )
+
+    result = cypher_chain.invoke(question)
+    return result["result"]
+
+
 def grag_view(question, chat_history):
     if not question:
         return Response({"error": "Missing question."}, status=400)
@@ -446,105 +588,251 @@ def grag_view(question, chat_history):
         # Utilize the enhanced query method
         query_result = enhanced_rag.query_with_fallback(question, chat_history)
 
-        if not query_result["success"]:
-            return Response({
-                "error": query_result["error"],
-                "debug_info": query_result.get("validation_info", {})
-            }, status=500)
+        early = _early_payload(query_result)
+        if early:
+            payload, status = early
+            return Response(payload, status=status)
+
+        # Generate the final response using the LLM
+        messages = enhanced_rag.answer_messages(question, query_result["data"])
 
-        # Retrieve the results
-        cypher_answer = query_result["data"]
-        cypher_query = query_result["cypher_used"]
+        final_response = enhanced_rag.llm.invoke(messages)
 
-        print(f"[DEBUG] Query successful. Found {query_result['result_count']} results")
-        print(f"[DEBUG] Used Cypher: {cypher_query}")
+        return Response(_answer_payload(final_response.content, query_result), status=200)
 
-        # Return error message if no results found
-        if not cypher_answer:
-            return Response({
-                "answer": "I couldn't find any relevant information in our database for your question. Could you try rephrasing or asking about specific products or nutrition information?",
-                "debug_info": {
-                    "cypher_used": cypher_query,
-                    "result_count": 0
+    except Exception as e:
+        print(f"[ERROR] Enhanced GraphRAG failed: {e}")
+
+        try:
+            return Response({"answer": _fallback_chain_answer(question)}, status=200)
+
+        except Exception as fallback_error:
+            print(f"[ERROR] Fallback also failed: {fallback_error}")
+            return Response(_error_payload(e), status=500)
+
+
+def stream_grag(question, chat_history):
+    """
+    Streaming variant of grag_view. The Cypher stages run as usual, then the final generation is
+    yielded as ("token", {"text"}) events followed by one ("done", {"answer", "debug_info"}) event.
+    Like grag_view, a failure falls back to GraphCypherQAChain, whose answer is sent as the "done" event
+    (it replaces any tokens already sent); an ("error", ...) event is sent when the fallback fails too.
+    """
+    try:
+        yield from _stream_enhanced_grag(question, chat_history)
+
+    except Exception as e:
+        print(f"[ERROR] Enhanced GraphRAG failed: {e}")
+
+        try:
+            yield "done", {"answer": _fallback_chain_answer(question)}
+
+        except Exception as fallback_error:
+            print(f"[ERROR] Fallback also failed: {fallback_error}")
+            yield "error", _error_payload(e)
+
+
+def _stream_enhanced_grag(question, chat_history):
+    enhanced_rag = EnhancedGraphRAG()
+    query_result = enhanced_rag.query_with_fallback(question, chat_history)
+
+    early = _early_payload(query_result)
+    if early:
+        payload, status = early
+        yield ("done" if status == 200 else "error"), payload
+        return
+
+    parts = []
+    for chunk in enhanced_rag.llm.stream(enhanced_rag.answer_messages(question, query_result["data"])):
+        if chunk.content:
+            parts.append(chunk.content)
+            yield "token", {"text": chunk.content}
+
+    yield "done", _answer_payload("".join(parts), query_result)
+
+
+# === Async variant for the ASGI views ===
+# Async drivers and HTTP pools are bound to the event loop that created them, keep one set per loop
+_async_clients = weakref.WeakKeyDictionary()
+# Only a discovered schema is kept, after a failure DEFAULT_SCHEMA is used until discovery is retried
+_async_schema_info = None
+_async_schema_retry_at = 0.0
+SCHEMA_RETRY_INTERVAL = float(os.getenv("GRAPH_SCHEMA_RETRY_INTERVAL", "30"))
+
+
+def _get_async_clients():
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.get(loop)
+    if clients is None:
+        driver = AsyncGraphDatabase.driver(
+            os.getenv("NEO4J_URI"),
+            auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD"))
+        )
+        clients = _async_clients[loop] = (driver, _make_llm())
+    return clients
+
+
+class AsyncEnhancedGraphRAG(EnhancedGraphRAG):
+    """
+    EnhancedGraphRAG on neo4j.AsyncGraphDatabase and the async LLM calls. The driver, the LLM client
+    and the discovered schema are shared across requests, so building one per request is cheap.
+    """
+
+    def __init__(self, driver, llm, schema_info):
+        self.driver = driver
+        self.llm = llm
+        self.schema_info = schema_info
+        self.query_examples = self._load_query_examples()
+
+    @classmethod
+    async def create(cls):
+        global _async_schema_info, _async_schema_retry_at
+        driver, llm = _get_async_clients()
+        schema_info = _async_schema_info
+        if schema_info is None:
+            if time.monotonic() < _async_schema_retry_at:
+                schema_info = DEFAULT_SCHEMA
+            else:
+                schema_info = await cls._abuild_dynamic_schema(driver)
+                if schema_info is DEFAULT_SCHEMA:
+                    # Neo4j unreachable, try again in a while instead of keeping the fallback for good
+                    _async_schema_retry_at = time.monotonic() + SCHEMA_RETRY_INTERVAL
+                else:
+                    _async_schema_info = schema_info
+        return cls(driver, llm, schema_info)
+
+    @staticmethod
+    async def _abuild_dynamic_schema(driver):
+        try:
+            async with driver.session() as session:
+                try:
+                    nodes = await (await session.run(SCHEMA_NODE_QUERY)).data()
+                except Exception:
+                    # Use default schema if APOC dynamic query fails
+                    nodes = DEFAULT_SCHEMA["nodes"]
+
+                relationships = await (await session.run(SCHEMA_REL_QUERY)).data()
+
+                return {
+                    "nodes": nodes,
+                    "relationships": [r["relationshipType"] for r in relationships]
                 }
-            }, status=200)
+        except Exception as e:
+            print(f"[WARNING] Schema discovery failed: {e}")
+            return DEFAULT_SCHEMA
 
-        # Generate the final response using the LLM
-        system_prompt = """
-                        Your home website is https://www.madewithnestle.ca/ and you must only use the provided context to answer the question.
-                        Do not rely on your own knowledge or assumptions.
-                        If the user asks for your name, respond with: "My name is Nestle Assistant, I'm your personal MadeWithNestle assistant."
-                        Be concise, factual, and in English. **Do not say 'based on the context'**.
-                        Only use content that is clearly relevant to the question.
-                        Ignore irrelevant products or content even if they are nearby in the context.
-                        
-                        If the answer contains product recommendations, format each product as a markdown hyperlink: [**Product Name**](product_url)
-                        """
+    async def _avalidate_cypher_syntax(self, cypher):
+        try:
+            is_read_only, message = self._check_read_only(cypher)
+            if not is_read_only:
+                return False, message
 
-        user_prompt = f"""
-                        User asked: {question}
-                
-                        Results from Neo4j graph database:
-                        {json.dumps(cypher_answer, indent=2)}
-                
-                        Respond conversationally like a helpful assistant. Use appropriate emojis when suitable.
-                        Focus on the most relevant results and present them clearly.
-                        """
+            async with self.driver.session() as session:
+                await (await session.run(f"EXPLAIN {cypher}")).consume()
+                return True, "Valid"
 
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=user_prompt)
-        ]
+        except Exception as e:
+            return False, str(e)
 
-        final_response = enhanced_rag.llm.invoke(messages)
+    async def _atest_cypher_execution(self, cypher):
+        try:
+            async with self.driver.session() as session:
+                data = await (await session.run(self._limited(cypher))).data()
+                return True, data
+        except Exception as e:
+            return False, str(e)
 
-        return Response({
-            "answer": final_response.content,
-            "debug_info": {
+    async def _acheck_candidate(self, i, cypher):
+        print(f"[DEBUG] Testing candidate {i + 1}: {cypher[:100]}...")
+        fixed_cypher = self._fix_common_cypher_errors(cypher)
+
+        is_valid, error_msg = await self._avalidate_cypher_syntax(fixed_cypher)
+        if not is_valid:
+            return self._scored(i, fixed_cypher, is_valid, error_msg)
+
+        can_execute, result = await self._atest_cypher_execution(fixed_cypher)
+        return self._scored(i, fixed_cypher, is_valid, error_msg, can_execute, result)
+
+    async def _agenerate_multiple_candidates(self, question):
+        # Entity extraction reads the catalog, off the event loop. Both LLM prompts are independent, send them together
+        prompts, template_cypher = await asyncio.to_thread(self._candidate_prompts, question)
+        responses = await asyncio.gather(*[self.llm.ainvoke([HumanMessage(content=prompt)]) for prompt in prompts])
+        return self._order_candidates([r.content.strip() for r in responses], template_cypher)
+
+    async def aresolve_product_coreference(self, question, chat_history):
+        prompt = self._coreference_prompt(question, chat_history)
+        response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        return self._parse_coreference(response.content)
+
+    async def agenerate_robust_cypher(self, question, chat_history=None):
+        print(f"[DEBUG] Generating Cypher for: {question}")
+
+        if chat_history:
+            question = self._with_product_hint(question, await self.aresolve_product_coreference(question, chat_history))
+
+        candidates = await self._agenerate_multiple_candidates(question)
+        print(f"[DEBUG] Generated {len(candidates)} candidates")
+
+        # Candidates are validated and test-run concurrently, selection keeps the sequential tie-breaking
+        indexed = [(i, cypher) for i, cypher in enumerate(candidates) if cypher]
+        results = await asyncio.gather(*[self._acheck_candidate(i, cypher) for i, cypher in indexed])
+        return self._select_best([(i, result) for (i, _), result in zip(indexed, results)])
+
+    async def aquery_with_fallback(self, question, chat_history):
+        cypher_query, validation_info = None, {}
+        try:
+            cypher_query, validation_info = await self.agenerate_robust_cypher(question, chat_history)
+            print(f"[DEBUG] Selected Cypher: {cypher_query}")
+
+            async with self.driver.session() as session:
+                data = await (await session.run(cypher_query)).data()
+
+                if not data:
+                    # Use broad fallback if no results
+                    data = await (await session.run(BROAD_FALLBACK_CYPHER)).data()
+                    cypher_query = BROAD_FALLBACK_CYPHER
+
+                return {
+                    "success": True,
+                    "data": data,
+                    "cypher_used": cypher_query,
+                    "validation_info": validation_info,
+                    "result_count": len(data)
+                }
+
+        except Exception as e:
+            print(f"[ERROR] Query execution failed: {e}")
+            return {
+                "success": False,
+                "error": str(e),
                 "cypher_used": cypher_query,
-                "result_count": query_result["result_count"],
-                "validation_info": query_result.get("validation_info", {})
+                "validation_info": validation_info
             }
-        }, status=200)
+
+
+async def agrag_answer(question, chat_history):
+    """Async grag_view, returns (payload, status) for the ASGI view to wrap"""
+    if not question:
+        return {"error": "Missing question."}, 400
+
+    try:
+        enhanced_rag = await AsyncEnhancedGraphRAG.create()
+        query_result = await enhanced_rag.aquery_with_fallback(question, chat_history)
+
+        early = _early_payload(query_result)
+        if early:
+            return early
+
+        final_response = await enhanced_rag.llm.ainvoke(enhanced_rag.answer_messages(question, query_result["data"]))
+        return _answer_payload(final_response.content, query_result), 200
 
     except Exception as e:
         print(f"[ERROR] Enhanced GraphRAG failed: {e}")
 
-        # LAST RESORT: Fallback to original method
         try:
-            print("[DEBUG] Falling back to original method")
-
-            llm = AzureChatOpenAI(
-                openai_api_type="azure",
-                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-                temperature=0,
-                n=1
-            )
-
-            graph = Neo4jGraph(
-                url=os.getenv("NEO4J_URI"),
-                username=os.getenv("NEO4J_USERNAME"),
-                password=os.getenv("NEO4J_PASSWORD")
-            )
-
-            # Construct the basic Cypher chain
-            cypher_chain = GraphCypherQAChain.from_llm(
-                llm=llm,
-                graph=graph,
-                verbose=True,
-                return_intermediate_steps=True,
-                allow_dangerous_requests=True
-            )
-
-            result = cypher_chain.invoke(question)
-            return Response({"answer": result["result"]}, status=200)
+            # The legacy chain is sync only, keep it off the event loop
+            return {"answer": await asyncio.to_thread(_fallback_chain_answer, question)}, 200
 
         except Exception as fallback_error:
             print(f"[ERROR] Fallback also failed: {fallback_error}")
-            return Response({
-                "error": "I'm having trouble processing your question right now. Please try again later.",
-                "debug_error": str(e)
-            }, status=500)
+            return _error_payload(e), 500
@@ -0,0 +1,75 @@
+import json
+import os
+import pickle
+
+import faiss
+
+from rag.langchain.sqlite_docstore import DOCSTORE_FILE, SQLiteDocstore
+
+# Written next to index.faiss by rag/preprocessing/build_index.py, a missing file means the flat embedder output
+INDEX_CONFIG_FILE = "index_config.json"
+FLAT_CONFIG = {"type": "flat", "factory": "Flat", "search_params": {}}
+
+
+def load_index_config(index_dir):
+    path = os.path.join(index_dir, INDEX_CONFIG_FILE)
+    if not os.path.exists(path):
+        return dict(FLAT_CONFIG)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def apply_search_params(index, params):
+    """Search-time parameters (nprobe, efSearch, ...) aren't stored in index.faiss, set them after loading"""
+    space = faiss.ParameterSpace()
+    for name, value in params.items():
+        space.set_index_parameter(index, name, value)
+
+
+def selector_params(index, selector):
+    """SearchParameters carrying an id selector, of the subclass the index type requires"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def mmap_flags(factory):
+    """
+    FAISS IO flags that map the index file instead of copying it: the flat codes of Flat / SQ / PQ / HNSW
+    indexes (IO_FLAG_MMAP_IFC) or the inverted lists of IVF indexes (IO_FLAG_MMAP). Workers mapping the
+    same file share one copy in the page cache.
+    """
+    if factory.startswith("IVF"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def load_vectorstore(index_dir, embedding, config, mmap=True):
+    """
+    LangChain FAISS store of index_dir, the index optionally memory-mapped read-only. Documents are read on
+    demand from docstore.sqlite3, the pickled index.pkl is only loaded when no SQLite docstore exists.
+    """
+    from langchain.vectorstores import FAISS
+
+    index = faiss.read_index(os.path.join(index_dir, "index.faiss"), mmap_flags(config["factory"]) if mmap else 0)
+
+    sqlite_path = os.path.join(index_dir, DOCSTORE_FILE)
+    if os.path.exists(sqlite_path):
+        docstore = SQLiteDocstore(sqlite_path)
+        index_to_docstore_id = docstore.position_ids()
+    else:
+        print(f"[WARNING] No {DOCSTORE_FILE} in {index_dir}, unpickling index.pkl "
+              f"(convert it with: python -m rag.preprocessing.convert_docstore --index-dir {index_dir})")
+        with open(os.path.join(index_dir, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embedding, index, docstore, index_to_docstore_id)
+
+
+def write_index_atomic(index, path):
+    # Running workers may have the old file mapped: write a new file and swap it in, never rewrite in place
+    tmp_path = f"{path}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
@@ -0,0 +1,134 @@
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from rag.langchain.metadata_index import normalize_name
+from rag.langchain.sqlite_docstore import SQLiteDocstore
+
+# Fuse BM25 with the vector search, and answer confident lexical matches without an embedding call
+HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "1") != "0"
+LEXICAL_FAST_PATH = os.getenv("RAG_LEXICAL_FAST_PATH", "1") != "0"
+# Share of the question's BM25 weight the best document must match for the fast path
+LEXICAL_CONFIDENCE = float(os.getenv("RAG_LEXICAL_CONFIDENCE", "0.85"))
+# Weight of the BM25 ranking against the vector ranking in the fusion
+LEXICAL_WEIGHT = float(os.getenv("RAG_LEXICAL_WEIGHT", "1.0"))
+
+# Metadata indexed with the content, so "kitkat mega" also finds the chunks that only say "it"
+LEXICAL_FIELDS = ("product_name", "brand", "category")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Damping of reciprocal rank fusion, 60 as in the original RRF paper
+RRF_K = 60
+
+STOPWORDS = {
+    "a", "an", "and", "any", "are", "as", "at", "be", "by", "can", "could", "do", "does", "for", "from", "has",
+    "have", "how", "i", "in", "is", "it", "its", "me", "my", "of", "on", "or", "please", "tell", "that", "the",
+    "there", "this", "to", "what", "whats", "which", "with", "you", "your",
+}
+
+
+def _stem(token):
+    # Plurals only: "peanuts" -> "peanut", "sugars" -> "sugar", "glass" stays
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [_stem(token) for token in re.findall(r"[a-z0-9]+", normalize_name(text).replace("'", ""))
+            if token not in STOPWORDS]
+
+
+def document_text(doc):
+    fields = [doc.metadata[field] for field in LEXICAL_FIELDS if doc.metadata.get(field)]
+    # Brands are also written as one word ("kitkat", "coffeecrisp")
+    if doc.metadata.get("brand"):
+        fields.append(re.sub(r"[^a-z0-9]", "", normalize_name(doc.metadata["brand"])))
+    return " ".join([doc.page_content] + fields)
+
+
+def position_documents(vectorstore):
+    """(FAISS position, Document) of every document, a SQLite docstore reads them in one query"""
+    if isinstance(vectorstore.docstore, SQLiteDocstore):
+        return vectorstore.docstore.iter_documents()
+    return (
+        (position, vectorstore.docstore.search(docstore_id))
+        for position, docstore_id in vectorstore.index_to_docstore_id.items()
+    )
+
+
+def reciprocal_rank_fusion(rankings, weights, k):
+    """[(position, fused score)] of the k best positions over several rankings (lists of positions, best first)"""
+    fused = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        for rank, position in enumerate(ranking):
+            fused[position] += weight / (RRF_K + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class LexicalIndex:
+    """
+    In-memory BM25 inverted index over the content and metadata of the documents of a LangChain FAISS
+    store, keyed by FAISS position like the vectors, so both rankings can be fused.
+    """
+
+    def __init__(self, vectorstore):
+        self.ntotal = vectorstore.index.ntotal
+        self.lengths = np.zeros(self.ntotal, dtype=np.float32)
+        postings = defaultdict(list)
+
+        for position, doc in position_documents(vectorstore):
+            terms = Counter(tokenize(document_text(doc)))
+            self.lengths[position] = sum(terms.values())
+            for term, count in terms.items():
+                postings[term].append((position, count))
+
+        average = float(self.lengths.mean()) if self.ntotal else 1.0
+        # Document length part of the BM25 denominator, the same for every term
+        self.norms = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / max(average, 1.0))
+
+        self.postings = {}
+        self.idf = {}
+        for term, entries in postings.items():
+            positions, counts = zip(*entries)
+            self.postings[term] = (np.array(positions, dtype=np.int64), np.array(counts, dtype=np.float32))
+            self.idf[term] = math.log(1 + (self.ntotal - len(entries) + 0.5) / (len(entries) + 0.5))
+        # Weight of a question term no document contains
+        self.unknown_idf = math.log(1 + (self.ntotal + 0.5) / 0.5)
+
+    def search(self, question, k, ids=None):
+        """
+        (scores, positions, confidence) of the k best BM25 matches, restricted to ids (FAISS positions) if
+        given. confidence is the share of the question's term weight the best match contains.
+        """
+        terms = list(dict.fromkeys(tokenize(question)))
+        known = [term for term in terms if term in self.postings]
+        if not known:
+            return [], [], 0.0
+
+        scores = np.zeros(self.ntotal, dtype=np.float32)
+        for term in known:
+            positions, counts = self.postings[term]
+            scores[positions] += self.idf[term] * counts * (BM25_K1 + 1) / (counts + self.norms[positions])
+
+        if ids is not None:
+            allowed = np.zeros(self.ntotal, dtype=bool)
+            allowed[ids] = True
+            scores[~allowed] = 0.0
+
+        k = min(k, self.ntotal)
+        best = np.argpartition(-scores, k - 1)[:k] if k < self.ntotal else np.arange(self.ntotal)
+        best = best[np.argsort(-scores[best], kind="stable")]
+        best = best[scores[best] > 0]
+        if not len(best):
+            return [], [], 0.0
+
+        top = int(best[0])
+        weights = {term: self.idf.get(term, self.unknown_idf) for term in terms}
+        matched = sum(weight for term, weight in weights.items()
+                      if term in self.postings and np.any(self.postings[term][0] == top))
+        return scores[best].tolist(), best.tolist(), matched / sum(weights.values())
@@ -0,0 +1,166 @@
+import re
+from collections import deque
+
+# Markdown links the prompt asks for, [**Product (Brand)**](url), and the **[Product](url)** variant
+LINK_PATTERN = re.compile(r"\[\*\*(.*?)\*\*\]\((.*?)\)|\*\*\[([^\]]+)\]\(([^)]+)\)\*\*")
+
+# An image goes after the punctuation that directly follows its link
+PUNCTUATION = ",.;:!? "
+
+
+class AhoCorasick:
+    """Finds every pattern occurring in a text in a single scan, whatever the number of patterns"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+        for pattern in patterns:
+            node = 0
+            for char in pattern:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = child
+            self.out[node].append(pattern)
+
+        # Breadth first, so the fallback of a node is always computed before its children need it
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def find(self, text):
+        """Patterns occurring in text, in the order their occurrences end"""
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            yield from self.out[node]
+
+
+def related_links(source_docs):
+    """The "Related Links" lines of the product (or else brand) pages of the source documents"""
+    lines = []
+    seen_urls = set()
+    for doc in source_docs:
+        meta = doc.metadata
+        if "product_name" in meta and "product_url" in meta:
+            title, url = f"{meta['product_name']} | Made with Nestlé Canada", meta["product_url"]
+        elif "brand" in meta and "brand_url" in meta:
+            title, url = f"{meta['brand']} Brands' Products | Made With Nestlé Canada", meta["brand_url"]
+        else:
+            continue
+        if url not in seen_urls:
+            seen_urls.add(url)
+            lines.append(f"- [{title}]({url})")
+    return lines
+
+
+class LinkPostprocessor:
+    """
+    Link validation, product images and related links for a generated answer, built once from the catalog
+    of a ProductLinkManager. Links are looked up by hash, images by exact key, by the product part of
+    "Product (Brand)", then by the longest image key inside the link text (Aho-Corasick). The answer is
+    scanned once and assembled in a buffer.
+    """
+
+    def __init__(self, link_manager, min_partial_share=0.5):
+        self.link_manager = link_manager
+        self.image_map = link_manager.image_map
+        self.min_partial_share = min_partial_share
+        self.matcher = AhoCorasick([key for key in self.image_map if len(key) > 3])
+
+    def find_image(self, link_text):
+        """(image key, image url) for the text of a link, or (None, None)"""
+        text = link_text.lower()
+        if text in self.image_map:
+            return text, self.image_map[text]
+
+        if "(" in text:
+            product_part = text.split("(")[0].strip()
+            if product_part in self.image_map:
+                return product_part, self.image_map[product_part]
+
+        # Only keys making up a significant part of the link text
+        partial = [key for key in set(self.matcher.find(text)) if len(key) / len(text) > self.min_partial_share]
+        if partial:
+            key = max(partial, key=len)
+            return key, self.image_map[key]
+        return None, None
+
+    def validated_link(self, display_text, url):
+        """(display text, url) of a link, corrected from the catalog when the product is known"""
+        if "(" in display_text and ")" in display_text:
+            product_part = display_text.split("(")[0].strip()
+            brand_part = display_text.split("(")[1].replace(")", "").strip()
+        else:
+            product_part = display_text.strip()
+            brand_part = ""
+
+        product_info = self.link_manager.get_product_link(product_part, brand_part)
+        if product_info is None:
+            print(f"WARNING: Could not find link for product: {display_text}")
+            return None
+        return product_info["display_name"], product_info["url"]
+
+    def process(self, answer, source_docs=None, validate=True, images=True):
+        """
+        The answer with its product links corrected, an image after the first link of each product, and
+        the "Related Links" of source_docs appended
+        """
+        parts = []
+        position = 0
+        inserted = set()
+        links = corrected = 0
+
+        for match in LINK_PATTERN.finditer(answer):
+            parts.append(answer[position:match.start()])
+            position = match.end()
+            links += 1
+
+            display_text = match.group(1) if match.group(1) is not None else match.group(3)
+            url = match.group(2) if match.group(1) is not None else match.group(4)
+            link = match.group(0)
+            if validate:
+                validated = self.validated_link(display_text, url)
+                if validated is not None:
+                    display_text, url = validated
+                    link = f"[**{display_text}**]({url})"
+                    corrected += 1
+            parts.append(link)
+
+            if not images:
+                continue
+            key, image = self.find_image(display_text.strip())
+            # Images already in the answer or inserted after an earlier link are not repeated
+            if image is None or image in inserted or image in answer:
+                continue
+            if position < len(answer) and answer[position] in PUNCTUATION:
+                parts.append(answer[position])
+                position += 1
+            parts.append(f"\n\n![{key}]({image})")
+            inserted.add(image)
+
+        parts.append(answer[position:])
+
+        lines = related_links(source_docs or [])
+        if lines:
+            parts.append("\n\n**Related Links**\n")
+            parts.append("\n".join(lines))
+
+        print(f"[DEBUG] Post-processed answer: {links} links, {corrected} validated, {len(inserted)} images, "
+              f"{len(lines)} related links")
+        return "".join(parts)
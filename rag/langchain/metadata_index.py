@@ -0,0 +1,131 @@
+import re
+from collections import defaultdict
+
+import faiss
+import numpy as np
+
+from rag.langchain.index_config import selector_params
+from rag.langchain.sqlite_docstore import SQLiteDocstore
+
+# Metadata fields that can be used as search filters
+FILTER_FIELDS = ("product_name", "brand", "chunk_type")
+
+
+def normalize_name(text):
+    """Lowercase, straight quotes, no trademark signs, single spaces"""
+    text = text.lower().replace("’", "'").replace("‘", "'")
+    text = re.sub(r"[®™©‡*]", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _compact(text):
+    return re.sub(r"[^a-z0-9]", "", text)
+
+
+def _words(text):
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+
+def compact_ngrams(words):
+    """Runs of consecutive words joined without spaces: "kit kat bar" -> kit, kitkat, kitkatbar, kat, katbar, bar"""
+    words = words.split()
+    return {"".join(words[i:j]) for i in range(len(words)) for j in range(i + 1, len(words) + 1)}
+
+
+def position_metadata(vectorstore):
+    """(FAISS position, metadata) of every document, a SQLite docstore reads them in one query"""
+    if isinstance(vectorstore.docstore, SQLiteDocstore):
+        return vectorstore.docstore.iter_metadata()
+    return (
+        (position, vectorstore.docstore.search(docstore_id).metadata)
+        for position, docstore_id in vectorstore.index_to_docstore_id.items()
+    )
+
+
+class MetadataIndex:
+    """
+    Postings from product_name / brand / chunk_type values to FAISS positions of a LangChain FAISS store,
+    so a search can be restricted to the matching vectors with a FAISS id selector.
+    """
+
+    def __init__(self, vectorstore):
+        self.index = vectorstore.index
+        self.ntotal = vectorstore.index.ntotal
+        self.postings = {field: defaultdict(list) for field in FILTER_FIELDS}
+        self.display_names = {field: {} for field in FILTER_FIELDS}
+        self.product_brand = {}
+
+        for position, metadata in position_metadata(vectorstore):
+            for field in FILTER_FIELDS:
+                value = metadata.get(field)
+                if value:
+                    key = normalize_name(value)
+                    self.postings[field][key].append(position)
+                    self.display_names[field][key] = value
+            if metadata.get("product_name") and metadata.get("brand"):
+                self.product_brand[metadata["product_name"]] = metadata["brand"]
+
+        self.postings = {
+            field: {value: np.array(ids, dtype=np.int64) for value, ids in values.items()}
+            for field, values in self.postings.items()
+        }
+
+        # Longest names first so "kitkat mega" wins over "kitkat"
+        self._products = sorted(
+            ((_words(key), value) for key, value in self.display_names["product_name"].items() if _words(key)),
+            key=lambda item: len(item[0]), reverse=True
+        )
+        self._brands = sorted(
+            ((_compact(key), value) for key, value in self.display_names["brand"].items() if _compact(key)),
+            key=lambda item: len(item[0]), reverse=True
+        )
+        self._brand_keys = {key for key, _ in self._brands}
+
+    def ids(self, filters):
+        """
+        FAISS positions matching every field of filters ({field: value or [values]}), values of one field are
+        alternatives. Returns None when filters is empty.
+        """
+        matched = None
+        for field, values in filters.items():
+            if isinstance(values, str):
+                values = [values]
+            postings = [self.postings[field].get(normalize_name(value)) for value in values]
+            ids = np.unique(np.concatenate([p for p in postings if p is not None] or [np.empty(0, dtype=np.int64)]))
+            matched = ids if matched is None else np.intersect1d(matched, ids, assume_unique=True)
+        return matched
+
+    def search_params(self, filters):
+        """(faiss.SearchParameters restricted to the filters, number of candidate vectors), or (None, 0)"""
+        ids = self.ids(filters)
+        if ids is None or not len(ids):
+            return None, 0
+        return selector_params(self.index, faiss.IDSelectorBatch(ids)), len(ids)
+
+    def detect(self, question):
+        """
+        Filters for the products (or, failing that, brands) the question names, None when it names neither.
+        Brands also match without spaces ("kitkat" for "Kit Kat"), but only as whole words of the question
+        ("aeroplane" doesn't name Aero).
+        """
+        text = normalize_name(question)
+        padded = f" {_words(text)} "
+
+        products = []
+        for words, name in self._products:
+            # A product called like its brand ("AFTER EIGHT") is read as the brand
+            if words.replace(" ", "") in self._brand_keys:
+                continue
+            if f" {words} " in padded and not any(words in longer for longer, _ in products):
+                products.append((words, name))
+
+        ngrams = compact_ngrams(padded)
+        brands = [name for key, name in self._brands if key in ngrams]
+        product_brands = [self.product_brand.get(name) for _, name in products]
+
+        # A brand named besides the products ("kitkat mega or coffee crisp"): widen to all the brands involved
+        if products and all(brand in product_brands for brand in brands):
+            return {"product_name": [name for _, name in products]}
+        if brands:
+            return {"brand": list(dict.fromkeys(brands + [b for b in product_brands if b]))}
+        return None
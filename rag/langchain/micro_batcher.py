@@ -0,0 +1,126 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+# Batch concurrent embedding calls and FAISS searches across requests
+MICRO_BATCHING = os.getenv("RAG_MICRO_BATCH", "1") != "0"
+EMBED_BATCH_MAX = int(os.getenv("RAG_EMBED_BATCH_MAX", "16"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("RAG_EMBED_BATCH_WAIT_MS", "5"))
+SEARCH_BATCH_MAX = int(os.getenv("RAG_SEARCH_BATCH_MAX", "32"))
+SEARCH_BATCH_WAIT_MS = float(os.getenv("RAG_SEARCH_BATCH_WAIT_MS", "1"))
+# FAISS only scores a batch with one BLAS matrix product from this many queries on (its default is 20)
+FAISS_BLAS_THRESHOLD = int(os.getenv("RAG_FAISS_BLAS_THRESHOLD", "4"))
+
+# Seconds without work before the batching thread exits, it is restarted by the next submit
+IDLE_TIMEOUT = 60
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent callers until max_batch items are waiting or max_wait_ms passed
+    since the first one, then runs fn(items) once on a background thread. fn returns one result per item,
+    an Exception instance fails only that item's caller.
+    """
+
+    def __init__(self, fn, max_batch, max_wait_ms, name="batch"):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.batches = 0
+        self.items = 0
+        self.sizes = Counter()
+
+    def submit(self, item):
+        """fn's result for item, computed in a batch with the items of other callers"""
+        return self._submit(item).result()
+
+    async def asubmit(self, item):
+        return await asyncio.wrap_future(self._submit(item))
+
+    def _submit(self, item):
+        future = Future()
+        with self._lock:
+            self._queue.put((item, future))
+            if self._thread is None:
+                self._start()
+        return future
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name=f"rag-{self.name}-batcher", daemon=True)
+        self._thread.start()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=IDLE_TIMEOUT)]
+        except queue.Empty:
+            return None
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        try:
+            self._process()
+        finally:
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    # Left on an error: hand the waiting items to a new thread, or let the next submit start one
+                    self._thread = None
+                    if not self._queue.empty():
+                        self._start()
+
+    def _process(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                with self._lock:
+                    # A submit may have raced the timeout, keep going if so
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+
+            # Callers that gave up (a cancelled asubmit) are dropped, a running future can't be cancelled anymore
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.fn(items)
+            except Exception as e:
+                results = [e] * len(items)
+
+            self.batches += 1
+            self.items += len(items)
+            self.sizes[len(items)] += 1
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_size": max(self.sizes) if self.sizes else 0,
+            "sizes": dict(sorted(self.sizes.items())),
+        }
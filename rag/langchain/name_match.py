@@ -22,7 +22,7 @@ llm = AzureChatOpenAI(
 )
 
 # 3. Match product with LLM
-def product_match(question, product_keywords, chat_history):
+def _match_messages(question, product_keywords, chat_history):
     recent_bot_messages = [msg["text"] for msg in reversed(chat_history) if msg["sender"] == "bot"]
     context_text = "\n\n".join(recent_bot_messages[:1])
 
@@ -45,13 +45,14 @@ def product_match(question, product_keywords, chat_history):
             Matched Name:
             """
 
-    messages = [
+    return [
         SystemMessage(content="You resolve vague product references using context."),
         HumanMessage(content=prompt)
     ]
 
-    response = llm(messages)
-    answer = response.content.strip()
+
+def _parse_match(answer, product_keywords):
+    answer = answer.strip()
 
     if answer.lower() == "none":
         return None
@@ -63,6 +64,16 @@ def product_match(question, product_keywords, chat_history):
     return None
 
 
+def product_match(question, product_keywords, chat_history):
+    response = llm(_match_messages(question, product_keywords, chat_history))
+    return _parse_match(response.content, product_keywords)
+
+
+async def aproduct_match(question, product_keywords, chat_history):
+    response = await llm.ainvoke(_match_messages(question, product_keywords, chat_history))
+    return _parse_match(response.content, product_keywords)
+
+
 
 # TEST CASE
 if __name__ == "__main__":
@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+
+from rag.langchain.link_postprocessor import AhoCorasick
+from rag.langchain.metadata_index import normalize_name
+from rag.langchain.record_store import CatalogStore, fresh_store, store_path
+
+# One catalog per process, shared by the RAG links, the store locator and the graph entity extraction
+CATALOG_PATH = os.getenv("RAG_CATALOG_PATH", "rag/brand_products.json")
+STORES_PATH = os.getenv("RAG_STORES_PATH", "rag/mock_stores.json")
+
+Product = namedtuple("Product", "name brand category url image_url")
+Store = namedtuple("Store", "name lat lon")
+
+
+class ProductCatalog:
+    """
+    brand_products.json (and the store list) parsed once into lookup tables: product by name or alias,
+    products by brand, url and image by product, and stores by product. Products are kept in a list and
+    the indexes hold their positions.
+    """
+
+    def __init__(self, path=CATALOG_PATH, stores_path=STORES_PATH):
+        self.path = path
+        self.stores_path = stores_path
+        self.signature = _files_signature(path, store_path(path), stores_path)
+
+        # The SQLite copy of the catalog gives the indexed columns without parsing the product records
+        source = fresh_store(path)
+        rows = CatalogStore(source).link_rows() if source else _json_link_rows(path)
+
+        self.products = []
+        self.by_alias = {}
+        self.by_brand = {}
+        self.brands = {}
+        self.product_to_brand = {}
+        # The tables ProductLinkManager validates links and inserts images with
+        self.product_links = {}
+        self.brand_links = {}
+        self.image_map = {}
+
+        keywords = {}
+        for brand, category, brand_url, name, product_url, image_url in rows:
+            brand = (brand or "").strip()
+            brand_key = brand.lower()
+            if brand_key and brand_key not in self.by_brand:
+                keywords[brand_key] = None
+                self.brands[brand_key] = brand
+                self.brand_links[brand_key] = brand_url or ""
+                self.by_brand[brand_key] = []
+
+            name = (name or "").strip()
+            if not name:
+                continue
+            product = Product(name, brand, category or "", product_url or "", (image_url or "").strip())
+            position = len(self.products)
+            self.products.append(product)
+            if brand_key:
+                self.by_brand[brand_key].append(position)
+
+            name_key = name.lower()
+            keywords[name_key] = None
+            if brand_key:
+                self.product_to_brand[name_key] = brand_key
+            for alias in self._aliases(name, brand):
+                self.by_alias[alias] = position
+
+            if product.url:
+                link = {"url": product.url, "display_name": f"{name} ({brand})" if brand else name, "brand": brand}
+                self.product_links[f"{name_key}_{brand_key}".strip("_")] = link
+                self.product_links[name_key] = link
+            if product.image_url:
+                self.image_map[name_key] = product.image_url
+                if brand:
+                    self.image_map[f"{name} ({brand})".lower()] = product.image_url
+                    self.image_map[f"{brand} {name}".lower()] = product.image_url
+
+        self.by_brand = {brand_key: tuple(positions) for brand_key, positions in self.by_brand.items()}
+        # Brand and product names in file order, for the product matching prompt
+        self.keywords = list(keywords)
+        self._load_stores()
+        self._matcher = None
+
+        print(f"[DEBUG] Catalog loaded from {source or path}: {len(self.brands)} brands, {len(self.products)} products, "
+              f"{len(self.stores)} stores")
+
+    @staticmethod
+    def _aliases(name, brand):
+        aliases = [name.lower(), normalize_name(name)]
+        if brand:
+            aliases += [f"{name} ({brand})".lower(), f"{brand} {name}".lower(), normalize_name(f"{brand} {name}")]
+        return aliases
+
+    def _load_stores(self):
+        self.stores = []
+        self.store_products = []
+        try:
+            with open(self.stores_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            print(f"[WARNING] Store list {self.stores_path} not found, the store locator will find no stores")
+            data = []
+
+        for store in data:
+            self.stores.append(Store(store["name"], store["lat"], store["lon"]))
+            self.store_products.append(tuple(product.lower() for product in store["products"]))
+
+        # A store carries a product when one of its product entries contains the name, precomputed for every
+        # brand and product name of the catalog
+        self._stores_by_name = {name: self._scan_stores(name) for name in self.keywords}
+
+    def _scan_stores(self, name):
+        return tuple(i for i, products in enumerate(self.store_products) if any(name in p for p in products))
+
+    def product(self, name, brand=""):
+        """The Product named name (or any of its aliases), preferring the one of brand, None if unknown"""
+        if brand:
+            position = self.by_alias.get(f"{name} ({brand})".lower())
+            if position is not None:
+                return self.products[position]
+        position = self.by_alias.get(name.lower())
+        if position is None:
+            position = self.by_alias.get(normalize_name(name))
+        return self.products[position] if position is not None else None
+
+    def brand_products(self, brand):
+        """Products of a brand, in catalog order"""
+        return [self.products[position] for position in self.by_brand.get(brand.lower(), ())]
+
+    def brand_of(self, name):
+        """Lowercase brand of a lowercase product name, the name itself when it is not a catalog product"""
+        return self.product_to_brand.get(name.lower(), name)
+
+    def stores_for(self, name):
+        """Stores carrying a product or brand, names outside the catalog are matched against every store"""
+        key = name.lower()
+        positions = self._stores_by_name.get(key)
+        if positions is None:
+            positions = self._scan_stores(key)
+        return [self.stores[i] for i in positions]
+
+    def mentions(self, text):
+        """(brand names, product names) occurring in text, lowercase and in order of first occurrence"""
+        if self._matcher is None:
+            self._matcher = AhoCorasick(self.keywords)
+        found = list(dict.fromkeys(self._matcher.find(text.lower())))
+        return [name for name in found if name in self.brands], [name for name in found if name not in self.brands]
+
+
+def _json_link_rows(path):
+    """CatalogStore.link_rows read from brand_products.json"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for entry in data:
+        brand = (entry.get("brand", ""), entry.get("category", ""), entry.get("url", ""))
+        if not entry.get("products"):
+            yield (*brand, None, None, None)
+        for item in entry.get("products", []):
+            yield (*brand, item.get("name", ""), item.get("product_url", ""), item.get("image_url", ""))
+
+
+def _files_signature(*paths):
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            signature.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(path=CATALOG_PATH, stores_path=STORES_PATH):
+    """
+    The process-wide catalog of path, parsed on first use and again whenever the catalog (or its SQLite
+    copy) or the store file changes on disk (one stat per file per call). Snapshots each have their own
+    catalog path.
+    """
+    key = (path, stores_path)
+    catalog = _catalogs.get(key)
+    if catalog is not None and catalog.signature == _files_signature(path, store_path(path), stores_path):
+        return catalog
+
+    with _catalogs_lock:
+        current = _catalogs.get(key)
+        if current is not catalog and current is not None:
+            # Reloaded by another thread while we were waiting for the lock
+            return current
+        try:
+            _catalogs[key] = ProductCatalog(path, stores_path)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            if catalog is None:
+                raise
+            # The file may be half written, keep the previous catalog and retry on the next call
+            print(f"[WARNING] Catalog reload failed, keeping the previous one: {e}")
+            return catalog
+        return _catalogs[key]
@@ -0,0 +1,192 @@
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+
+ROUTES = ["store", "graphrag", "rag"]
+
+MODEL_PATH = os.getenv("RAG_ROUTER_MODEL_PATH", "rag/router/router_model.npz")
+# Below this confidence the router asks the LLM classifier instead of deciding locally
+CONFIDENCE_THRESHOLD = float(os.getenv("RAG_ROUTER_CONFIDENCE", "0.6"))
+
+# Dimension of the hashed bag-of-words features used by the lexical model
+FEATURE_DIM = 4096
+
+# === Keyword rules, in the spirit of EnhancedGraphRAG._classify_query_intent ===
+STORE_PATTERNS = [
+    r"\bwhere (can|could|do|should|to|is)\b.*\b(buy|find|get|purchase|order|pick up|sold|sell)",
+    r"\bwhere to (buy|get|find)\b",
+    r"\b(near|nearby|nearest|closest|close to|around) (me|here|by)\b",
+    r"\b(nearby|nearest|closest)\b.*\b(store|shop|place)",
+    r"\bstores?\b.*\b(sell|sells|carry|stock|has|have|with)\b",
+    r"\b(which|what|any) (stores?|shops?|supermarkets?)\b",
+    r"\bstore locator\b",
+    r"\b(walmart|loblaws|costco|shoppers|metro|sobeys)\b",
+]
+NUTRITION_WORDS = [
+    "calorie", "calories", "protein", "fat", "sodium", "sugar", "sugars", "cholesterol", "carbohydrate",
+    "carbohydrates", "carbs", "fibre", "fiber", "vitamin", "iron", "potassium", "calcium", "nutrition",
+    "nutrient", "daily value",
+]
+QUANTITY_PATTERNS = [
+    r"\bhow (many|much)\b",
+    r"\b(most|least|highest|lowest|more than|less than|under|over|rank|compare|count)\b",
+    r"\b\d+\s*(g|mg|grams?|kcal)\b",
+]
+
+# Weight of each signal when they are blended into one distribution
+SIGNAL_WEIGHTS = {"rules": 1.0, "model": 1.0, "centroid": 0.8}
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def hashed_features(question, dim=FEATURE_DIM):
+    """L2-normalised counts of hashed unigrams and bigrams"""
+    tokens = tokenize(question)
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    vector = np.zeros(dim, dtype=np.float32)
+    for gram in grams:
+        vector[zlib.crc32(gram.encode("utf-8")) % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def keyword_scores(question):
+    """Route distribution from the keyword rules, or None when no rule fires"""
+    text = question.lower()
+
+    if any(re.search(pattern, text) for pattern in STORE_PATTERNS):
+        return np.array([0.9, 0.02, 0.08], dtype=np.float32)
+
+    mentions_nutrition = any(re.search(rf"\b{re.escape(word)}\b", text) for word in NUTRITION_WORDS)
+    asks_quantity = any(re.search(pattern, text) for pattern in QUANTITY_PATTERNS)
+    if mentions_nutrition and asks_quantity:
+        return np.array([0.02, 0.9, 0.08], dtype=np.float32)
+    if mentions_nutrition or re.search(r"\bhow many\b", text):
+        return np.array([0.05, 0.7, 0.25], dtype=np.float32)
+
+    return None
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class QuestionRouter:
+    """Local store/graphrag/rag router: keyword rules + hashed logistic regression + embedding centroids"""
+
+    def __init__(self, model_path=MODEL_PATH, threshold=CONFIDENCE_THRESHOLD):
+        self.threshold = threshold
+        self.weights = None
+        self.bias = None
+        self.centroids = None
+        self.centroid_temperature = 0.05
+
+        if model_path is None:
+            return
+        try:
+            model = np.load(model_path)
+            self.weights = model["weights"]
+            self.bias = model["bias"]
+            if "centroids" in model.files:
+                self.centroids = model["centroids"]
+                self.centroid_temperature = float(model["centroid_temperature"])
+            else:
+                print(f"[WARNING] {model_path} has no centroids, the nearest-centroid signal is off until the "
+                      f"router is retrained with --with-embeddings")
+        except FileNotFoundError:
+            print(f"[WARNING] Router model not found at {model_path}, using keyword rules only")
+
+    def model_scores(self, question):
+        if self.weights is None:
+            return None
+        return softmax(self.weights @ hashed_features(question) + self.bias)
+
+    def centroid_scores(self, vector):
+        if self.centroids is None or vector is None:
+            return None
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        return softmax((self.centroids @ query) / self.centroid_temperature)
+
+    def _blend(self, signals):
+        total = sum(SIGNAL_WEIGHTS[name] * scores for name, scores in signals.items())
+        return total / sum(SIGNAL_WEIGHTS[name] for name in signals)
+
+    def classify(self, question, embed=None):
+        """
+        Local decision only, returns {"route", "confidence", "signals"}.
+        `embed` is an optional callable returning the question embedding, it is only called
+        when the cheap lexical signals are not confident enough on their own.
+        """
+        signals = {}
+        for name, scores in (("rules", keyword_scores(question)), ("model", self.model_scores(question))):
+            if scores is not None:
+                signals[name] = scores
+
+        blended = self._blend(signals) if signals else None
+        if (blended is None or blended.max() < self.threshold) and embed is not None and self.centroids is not None:
+            scores = self.centroid_scores(embed())
+            if scores is not None:
+                signals["centroid"] = scores
+                blended = self._blend(signals)
+
+        if blended is None:
+            return {"route": "rag", "confidence": 0.0, "signals": []}
+
+        best = int(np.argmax(blended))
+        return {"route": ROUTES[best], "confidence": float(blended[best]), "signals": list(signals)}
+
+    def route(self, question, embed=None):
+        """Route locally, falling back to the LLM classifier only below the confidence threshold"""
+        started = time.perf_counter()
+        decision = self.classify(question, embed=embed)
+        decision["source"] = "local"
+
+        if decision["confidence"] < self.threshold:
+            # Imported here so the Azure client is only created when the fallback is actually used
+            from rag.langchain.response_selector import question_classifier
+            decision["route"] = question_classifier(question)
+            decision["source"] = "llm"
+
+        decision["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        print(f"[DEBUG] Routed to {decision['route']} ({decision['source']}, "
+              f"confidence {decision['confidence']:.2f}, {decision['elapsed_ms']} ms)")
+        return decision
+
+    async def aroute(self, question, aembed=None):
+        """route() for the async views, `aembed` is an optional coroutine function returning the embedding"""
+        started = time.perf_counter()
+        decision = self.classify(question)
+        decision["source"] = "local"
+
+        if decision["confidence"] < self.threshold and aembed is not None and self.centroids is not None:
+            vector = await aembed()
+            decision = self.classify(question, embed=lambda: vector)
+            decision["source"] = "local"
+
+        if decision["confidence"] < self.threshold:
+            from rag.langchain.response_selector import aquestion_classifier
+            decision["route"] = await aquestion_classifier(question)
+            decision["source"] = "llm"
+
+        decision["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        print(f"[DEBUG] Routed to {decision['route']} ({decision['source']}, "
+              f"confidence {decision['confidence']:.2f}, {decision['elapsed_ms']} ms)")
+        return decision
+
+
+_router = None
+
+
+def get_question_router():
+    global _router
+    if _router is None:
+        _router = QuestionRouter()
+    return _router
@@ -1,15 +1,17 @@
 from langchain.chains import LLMChain
-from langchain.vectorstores import FAISS
-from langchain_openai import AzureOpenAIEmbeddings
-from langchain.chat_models import AzureChatOpenAI
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from urllib.parse import quote_plus
-import json
+import asyncio
 import re
-from collections import defaultdict
+import time
 from typing import Dict, List, Tuple
 
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.context_builder import build_context, build_history, count_tokens
+from rag.langchain.link_postprocessor import LinkPostprocessor
+from rag.langchain.product_catalog import get_catalog
+from rag.langchain.reranker import RERANK_ENABLED, rerank
+
 # === Azure OpenAI Configure ===
 from dotenv import load_dotenv
 import os
@@ -22,196 +24,27 @@ AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT
 AZURE_OPENAI_MODEL_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
 AZURE_OPENAI_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
 
+# Number of chunks retrieved for the RAG prompt, product-level documents are larger so fewer are needed
+RETRIEVAL_K = CHUNK_LAYOUT["k"]
+
 
 class ProductLinkManager:
     def __init__(self, chunks_json_path="rag/chunks.json", product_info_path="rag/brand_products.json"):
+        # Links and images come from the shared product catalog, chunks.json carries the same urls
         self.chunks_json_path = chunks_json_path
         self.product_info_path = product_info_path
-        self.product_links = {}
-        self.brand_links = {}
-        self.image_map = {}
-        self._load_links()
-        self._load_images()
-
-    def _load_images(self):
-        """
-        More robust image loading with better error handling and normalization.
-        """
-        try:
-            with open(self.product_info_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            print(f"[DEBUG] Loading images from {self.product_info_path}")
-
-            for brand_entry in data:
-                brand_name = brand_entry.get("brand", "").strip()
-                # print(f"[DEBUG] Processing brand: {brand_name}")
-
-                for product in brand_entry.get("products", []):
-                    name = product.get("name", "").strip()
-                    img = product.get("image_url", "").strip()
-
-                    if name and img:
-                        # Store multiple variations of the product name
-                        normalized_name = name.lower()
-                        self.image_map[normalized_name] = img
-
-                        # Also store with brand if available
-                        if brand_name:
-                            with_brand = f"{name} ({brand_name})".lower()
-                            self.image_map[with_brand] = img
-
-                            # Store brand + product format too
-                            brand_product = f"{brand_name} {name}".lower()
-                            self.image_map[brand_product] = img
-
-                        # print(f"[DEBUG] Loaded image for: {name} -> {img}")
-
-            print(f"[DEBUG] Total images loaded: {len(self.image_map)}")
-            # print(f"[DEBUG] Image keys: {list(self.image_map.keys())}")
-
-        except Exception as e:
-            print(f"[ImageLoader] Failed to load: {e}")
-            import traceback
-            traceback.print_exc()
+        self.catalog = get_catalog(product_info_path)
+        self.product_links = self.catalog.product_links
+        self.brand_links = self.catalog.brand_links
+        self.image_map = self.catalog.image_map
+        print(f"[DEBUG] Links for {len(self.catalog.products)} products, {len(self.image_map)} image keys "
+              f"from {product_info_path}")
+        # Lookup tables and name matcher built once, answers are post-processed in a single pass
+        self.postprocessor = LinkPostprocessor(self)
 
     def insert_product_images(self, answer_text):
-        """
-        Insert product images after Markdown links in the answer text.
-        Fixed version that prevents duplicates and handles proper matching.
-        """
-        print(f"[DEBUG] Original answer_text length: {len(answer_text)}")
-        # print(f"[DEBUG] Available images: {self.image_map.keys()}")
-
-        # Track processed images to prevent duplicates
-        processed_images = set()
-
-        # Find all Markdown links first
-        # Matching Markdown format: [**Product/Brand Name**](url)
-        link_pattern_1 = re.compile(r'\[\*\*(.*?)\*\*\]\((.*?)\)', re.IGNORECASE)
-        # Matching Markdown format: **[Product/Brand Name](url)**
-        link_pattern_2 = re.compile(r'\*\*\[([^\]]+)\]\(([^)]+)\)\*\*', re.IGNORECASE)
-
-        matches_1 = list(link_pattern_1.finditer(answer_text))
-        matches_2 = list(link_pattern_2.finditer(answer_text))
-
-        print(f"[DEBUG] Found format 1: {len(matches_1)} markdown links")
-        print(f"[DEBUG] Found format 2: {len(matches_2)} markdown links")
-
-        matches = matches_1 + matches_2
-
-        # Process matches in reverse order to avoid position shifts
-        for match in reversed(matches):
-            link_text = match.group(1).strip()
-            link_url = match.group(2).strip()
-            full_match = match.group(0)
-
-            print(f"[DEBUG] Processing link: '{link_text}' -> {link_url}")
-
-            # Find matching image
-            matched_image = None
-            matched_key = None
-
-            # Strategy 1: Exact match (case-insensitive)
-            for img_key in self.image_map.keys():
-                if link_text.lower() == img_key.lower():
-                    matched_image = self.image_map[img_key]
-                    matched_key = img_key
-                    print(f"[DEBUG] Exact match found: {img_key}, URL: {matched_image}")
-                    break
-
-            # Strategy 2: Handle product names with brand info like "Product (Brand)"
-            if not matched_image and '(' in link_text:
-                product_part = link_text.split('(')[0].strip()
-                for img_key in self.image_map.keys():
-                    if product_part.lower() == img_key.lower():
-                        matched_image = self.image_map[img_key]
-                        matched_key = img_key
-                        print(f"[DEBUG] Brand-aware exact match found: {img_key}")
-                        break
-
-            # Strategy 3: Partial match (be more selective)
-            if not matched_image:
-                for img_key in self.image_map.keys():
-                    # Only match if the image key is a significant part of the link text
-                    if (len(img_key) > 3 and img_key.lower() in link_text.lower() and
-                            len(img_key) / len(link_text) > 0.5):
-                        matched_image = self.image_map[img_key]
-                        matched_key = img_key
-                        print(f"[DEBUG] Selective partial match found: {img_key}")
-                        break
-
-            # Add image if found and not already processed
-            if matched_image and matched_image not in processed_images:
-                # Check if this exact image URL is already in the text
-                if matched_image not in answer_text:
-                    img_markdown = f"\n\n![{matched_key}]({matched_image})"
-                    # Insert image right after the current link
-                    insert_pos = match.end()
-
-                    # Check if there's punctuation right after the matched link
-                    if insert_pos < len(answer_text) and answer_text[insert_pos] in ",.;:!? ":
-                        print(f"[DEBUG] Found punctuation after link: '{answer_text[insert_pos]}'")
-                        insert_pos += 1  # move after punctuation
-
-                    answer_text = (
-                            answer_text[:insert_pos] +
-                            img_markdown +
-                            answer_text[insert_pos:]
-                    )
-
-                    processed_images.add(matched_image)
-                    print(f"[DEBUG] Added image for: {link_text}")
-                else:
-                    print(f"[DEBUG] Image already in text, skipping: {matched_image}")
-            elif matched_image:
-                print(f"[DEBUG] Image already processed, skipping: {matched_image}")
-            else:
-                print(f"[DEBUG] No image found for: '{link_text}'")
-
-        print("ANSWER TEXT AFTER IMAGE INSERTION:", answer_text)
-        return answer_text
-
-    def _load_links(self):
-        # Load all product and brand links from the chunks.json file
-        try:
-            with open(self.chunks_json_path, 'r', encoding='utf-8') as f:
-                chunks = json.load(f)
-
-            for chunk in chunks:
-                metadata = chunk.get("metadata", {})
-
-                # Store brand links
-                if "brand" in metadata and "brand_url" in metadata:
-                    brand = metadata["brand"]
-                    brand_url = metadata["brand_url"]
-                    self.brand_links[brand.lower()] = brand_url
-
-                # Store product links
-                if "product_name" in metadata and "product_url" in metadata:
-                    product = metadata["product_name"]
-                    product_url = metadata["product_url"]
-                    brand = metadata.get("brand", "")
-
-                    # Use both product and brand to create a unique key
-                    key = f"{product.lower()}_{brand.lower()}".strip("_")
-                    self.product_links[key] = {
-                        "url": product_url,
-                        "display_name": f"{product} ({brand})" if brand else product,
-                        "brand": brand
-                    }
-
-                    # Store the product name alone for cases where brand is not provided as well
-                    self.product_links[product.lower()] = {
-                        "url": product_url,
-                        "display_name": f"{product} ({brand})" if brand else product,
-                        "brand": brand
-                    }
-
-        except FileNotFoundError:
-            print(f"Warning: {self.chunks_json_path} not found")
-        except json.JSONDecodeError:
-            print(f"Warning: Invalid JSON in {self.chunks_json_path}")
+        """Insert product images after the Markdown links in the answer text, once per image"""
+        return self.postprocessor.process(answer_text, validate=False)
 
     def get_product_link(self, product_name, brand_name):
         keys_to_try = [
@@ -230,67 +63,15 @@ class ProductLinkManager:
         return self.brand_links.get(brand_name.lower(), "")
 
     def extract_and_validate_links(self, response_text):
-        # Extract the product name from the response and validate/replace the link
-        # Matching Markdown format: [**Product/Brand Name**](url)
-        link_pattern1 = r'\[\*\*(.*?)\*\*\]\((.*?)\)'
-
-        # Matching Markdown format: **[Product/Brand Name](url)**
-        link_pattern2 = r'\*\*\[([^\]]+)\]\(([^)]+)\)\*\*'
-
-        def replace_link(match):
-            display_text = match.group(1)
-            current_url = match.group(2)
-
-            # Try to extract product and brand from the display text
-            # Format: "Product Name (Brand)" or "Product Name"
-            if "(" in display_text and ")" in display_text:
-                product_part = display_text.split("(")[0].strip()
-                brand_part = display_text.split("(")[1].replace(")", "").strip()
-            else:
-                product_part = display_text.strip()
-                brand_part = ""
-
-            # Get the correct url
-            product_info = self.get_product_link(product_part, brand_part)
-
-            if product_info:
-                correct_url = product_info["url"]
-                correct_display = product_info["display_name"]
-                return f"[**{correct_display}**]({correct_url})"
-            else:
-                # Fallback: if no link found, return the original match with warning
-                print(f"WARNING: Could not find link for product: {display_text}")
-                return match.group(0)
-
-        # Substitute all links in the response text
-        corrected_response = re.sub(link_pattern1, replace_link, response_text)
-        corrected_response = re.sub(link_pattern2, replace_link, corrected_response)
-        print(f"[DEBUG] Corrected response: {corrected_response, len(corrected_response)}")
-        return corrected_response
-
-def query_with_langchain_rag(question, chatbot_name, chat_history):
-    # 0. Initialize the link manager if link validation is enabled
-    link_manager = ProductLinkManager()
-
-    # 1. Construct the embedding model
-    embedding = AzureOpenAIEmbeddings(
-        deployment=AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
-        openai_api_type="azure",
-        chunk_size=16
-    )
+        # Replace the url (and display name) of every product link with the one from the catalog
+        return self.postprocessor.process(response_text, images=False)
 
-    # 2. Load the FAISS index
-    vectorstore = FAISS.load_local("rag/faiss_index", embedding, allow_dangerous_deserialization=True)
+    def postprocess(self, answer, source_docs):
+        """Link validation, product images and the "Related Links" block in one pass over the answer"""
+        return self.postprocessor.process(answer, source_docs)
 
-    history_lines = []
-    for msg in chat_history[-6:]:
-        role = "User" if msg["sender"] == "user" else "Assistant"
-        history_lines.append(f"{role}: {msg['text']}")
-
-    history_str = "\\n".join(history_lines)
-
-    # 3. Construct the LLM with enhanced prompt template
-    prompt_template = PromptTemplate(
+def _rag_prompt_template(chatbot_name, history_str):
+    return PromptTemplate(
         input_variables=["context", "question", "history", "chatbot_name"],
         template="""
                     Your home website is https://www.madewithnestle.ca/ and you must only use the provided context to answer the question no matter the question contains keywords such as "nestle".
@@ -327,92 +108,154 @@ def query_with_langchain_rag(question, chatbot_name, chat_history):
                   """.replace("{chatbot_name}", chatbot_name).replace("{history}", history_str)
     )
 
-    llm = AzureChatOpenAI(
-        openai_api_type="azure",
-        api_key=AZURE_OPENAI_KEY,
-        api_version=AZURE_OPENAI_VERSION,
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        azure_deployment=AZURE_OPENAI_MODEL_DEPLOYMENT,
-        temperature=0.5
-    )
 
-    # 4. Encapsulate the LLM and vectorstore in a RetrievalQA chain
-    retrieval_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        retriever=vectorstore.as_retriever(search_kwargs={"k": 10}),
-        chain_type_kwargs={"prompt": prompt_template, "document_variable_name": "context"},
-        return_source_documents=True
-    )
+def prepare_rag_generation(question, chatbot_name, chat_history, engine, source_docs=None, timings=None, filters=None):
+    """Retrieval and prompt assembly under the token budgets, everything the single generation needs"""
+    history_str, history_tokens = build_history(chat_history)
 
-    # 5. Define the query function
-    res = retrieval_chain({"query": question})
-    source_docs = res["source_documents"]
+    # 3. Construct the LLM with enhanced prompt template
+    prompt_template = _rag_prompt_template(chatbot_name, history_str)
+
+    # 4. Retrieval only: take the top-k documents straight from the vectorstore (no LLM call here),
+    # unless the caller already retrieved them speculatively. filters restricts the search by metadata,
+    # e.g. {"brand": ["Aero"]}; None detects the products or brands the question names, {} searches everything
+    if source_docs is None:
+        started = time.perf_counter()
+        source_docs = engine.retrieve(question, k=RETRIEVAL_K, timings=timings, filters=filters)
+        timings["retrieve_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    # Only the chunks that answer the question go into the prompt (and the related links)
+    if RERANK_ENABLED:
+        source_docs = rerank(question, source_docs, timings=timings)
+
+    multi_context, context_tokens, dropped = build_context(source_docs)
+
+    if timings is not None:
+        instructions_tokens = count_tokens(_rag_prompt_template(chatbot_name, "").format(context="", question=""))
+        question_tokens = count_tokens(question)
+        timings["prompt_tokens"] = {
+            "instructions": instructions_tokens,
+            "history": history_tokens,
+            "context": context_tokens,
+            "question": question_tokens,
+            "total": instructions_tokens + history_tokens + context_tokens + question_tokens,
+            "dropped_chunks": dropped,
+        }
 
-    product_map = defaultdict(lambda: {"url": None, "chunks": []})
+    return {
+        "prompt": prompt_template,
+        "inputs": {
+            "context": multi_context,
+            "question": question,
+            "chatbot_name": chatbot_name,
+            "history": history_str
+        },
+        "source_docs": source_docs,
+    }
 
-    for doc in source_docs:
-        pname = doc.metadata.get("product_name")
-        purl = doc.metadata.get("product_url")
-        if pname and purl:
-            product_map[pname]["url"] = purl
-            product_map[pname]["chunks"].append(doc.page_content)
 
-    print("[DEBUG] Product Map:", product_map)
+def finalize_rag_answer(answer, source_docs, link_manager):
+    """Link validation, product images and related links applied to the raw generation"""
+    return link_manager.postprocess(answer, source_docs)
 
-    multi_context = ""
-    for pname, pdata in product_map.items():
-        multi_context += f"=== {pname} ===\nURL: {pdata['url']}\n"
-        multi_context += "\n".join(pdata["chunks"])
-        multi_context += "\n\n"
 
-    llm_chain = LLMChain(llm=llm, prompt=prompt_template)
+def _resolve_engine(engine):
+    if engine is None:
+        # Imported here because rag_engine imports ProductLinkManager from this module
+        from rag.langchain.rag_engine import get_rag_engine
+        engine = get_rag_engine()
+    return engine
 
-    answer = llm_chain.run(
-        context=multi_context,
-        question=question,
-        chatbot_name=chatbot_name,
-        history=history_str
-    )
 
-    # 6. Verify and fix the url
-    # answer = result["result"]
-    # if validate_links and link_manager:
-    answer = link_manager.extract_and_validate_links(answer)
-    print("[DEBUG] Final answer after link validation:", answer)
-    answer = link_manager.insert_product_images(answer)
-
-    # 7. Prepare the references
-    references = []
-    seen_urls = set()
-    for doc in source_docs:
-        meta = doc.metadata
-        if "product_name" in meta and "product_url" in meta:
-            if meta["product_url"] not in seen_urls:
-                references.append({
-                    "title": f"{meta['product_name']} | Made with Nestlé Canada",
-                    "url": meta["product_url"]
-                })
-                seen_urls.add(meta["product_url"])
-        elif "brand" in meta and "brand_url" in meta:
-            if meta["brand_url"] not in seen_urls:
-                references.append({
-                    "title": f"{meta['brand']} Brands' Products | Made With Nestlé Canada",
-                    "url": meta["brand_url"]
-                })
-                seen_urls.add(meta["brand_url"])
-
-    if references:
-        references_md = "\n\n**Related Links**\n" + "\n".join(
-            f"- [{ref['title']}]({ref['url']})" for ref in references
-        )
-        answer += references_md
+def query_with_langchain_rag(question, chatbot_name, chat_history, engine=None, source_docs=None, timings=None,
+                             filters=None):
+    # 0. Reuse the process-wide engine (link manager, clients and FAISS index are loaded once per worker)
+    engine = _resolve_engine(engine)
+    timings = dict(timings or {})
+
+    generation = prepare_rag_generation(question, chatbot_name, chat_history, engine, source_docs, timings, filters)
+
+    # 5. The single generation, over the context regrouped by product
+    started = time.perf_counter()
+    llm_chain = LLMChain(llm=engine.llm, prompt=generation["prompt"])
+    answer = llm_chain.run(**generation["inputs"])
+    timings["generate_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    started = time.perf_counter()
+    answer = finalize_rag_answer(answer, generation["source_docs"], engine.link_manager)
+    timings["postprocess_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    print("[TIMING] RAG stages:", timings)
 
     # 8. Format the sources
     return {
         "answer": answer,
+        "timings": timings,
         # "sources": references
     }
 
+
+async def aquery_with_langchain_rag(question, chatbot_name, chat_history, engine=None, source_docs=None, timings=None,
+                                    filters=None):
+    """
+    query_with_langchain_rag for the async views, the embedding and generation calls are awaited. Engine
+    loading, reranking, prompt assembly and link post-processing run in threads, off the event loop.
+    """
+    engine = await asyncio.to_thread(_resolve_engine, engine)
+    timings = dict(timings or {})
+
+    if source_docs is None:
+        started = time.perf_counter()
+        source_docs = await engine.aretrieve(question, k=RETRIEVAL_K, timings=timings, filters=filters)
+        timings["retrieve_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    generation = await asyncio.to_thread(prepare_rag_generation, question, chatbot_name, chat_history, engine,
+                                         source_docs, timings, filters)
+
+    started = time.perf_counter()
+    response = await engine.llm.ainvoke(generation["prompt"].format(**generation["inputs"]))
+    timings["generate_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    started = time.perf_counter()
+    answer = await asyncio.to_thread(finalize_rag_answer, response.content, generation["source_docs"],
+                                     engine.link_manager)
+    timings["postprocess_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    print("[TIMING] RAG stages:", timings)
+
+    return {
+        "answer": answer,
+        "timings": timings,
+    }
+
+
+def stream_langchain_rag(question, chatbot_name, chat_history, engine=None, source_docs=None, timings=None,
+                         filters=None):
+    """
+    Streaming variant of query_with_langchain_rag. Yields ("token", {"text"}) events as the model
+    produces them, then one ("done", {"answer", "timings"}) event carrying the post-processed answer
+    (validated links, product images and related links) that replaces the streamed text.
+    """
+    engine = _resolve_engine(engine)
+    timings = dict(timings or {})
+
+    generation = prepare_rag_generation(question, chatbot_name, chat_history, engine, source_docs, timings, filters)
+
+    started = time.perf_counter()
+    parts = []
+    for chunk in engine.llm.stream(generation["prompt"].format(**generation["inputs"])):
+        if not chunk.content:
+            continue
+        if not parts:
+            timings["first_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        parts.append(chunk.content)
+        yield "token", {"text": chunk.content}
+    timings["generate_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    started = time.perf_counter()
+    answer = finalize_rag_answer("".join(parts), generation["source_docs"], engine.link_manager)
+    timings["postprocess_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    print("[TIMING] RAG stages (streamed):", timings)
+
+    yield "done", {"answer": answer, "timings": timings}
+
 # === Test the function ===
 if __name__ == "__main__":
     res = query_with_langchain_rag("can you introduce s'mores products", "assistant", [])
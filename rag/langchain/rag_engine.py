@@ -0,0 +1,560 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+from langchain.schema import Document
+from langchain_openai import AzureOpenAIEmbeddings
+from langchain.chat_models import AzureChatOpenAI
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.embedding_cache import CachedEmbeddings, get_embedding_cache
+from rag.langchain.index_config import INDEX_CONFIG_FILE, apply_search_params, load_index_config, load_vectorstore
+from rag.langchain.lexical_index import (
+    HYBRID_SEARCH,
+    LEXICAL_CONFIDENCE,
+    LEXICAL_FAST_PATH,
+    LEXICAL_WEIGHT,
+    LexicalIndex,
+    reciprocal_rank_fusion,
+)
+from rag.langchain.metadata_index import MetadataIndex
+from rag.langchain.micro_batcher import (
+    EMBED_BATCH_MAX,
+    FAISS_BLAS_THRESHOLD,
+    MICRO_BATCHING,
+    SEARCH_BATCH_MAX,
+    SEARCH_BATCH_WAIT_MS,
+    MicroBatcher,
+)
+from rag.langchain.sharded_index import SHARDS_FILE, ShardedIndex, load_shards_config
+from rag.langchain.snapshots import CATALOG_FILE, CHUNKS_FILE, SNAPSHOT_DIR, current_snapshot
+from rag.langchain.sqlite_docstore import DOCSTORE_FILE, SQLiteDocstore
+from rag.langchain.rag_answer import (
+    ProductLinkManager,
+    AZURE_OPENAI_ENDPOINT,
+    AZURE_OPENAI_KEY,
+    AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+    AZURE_OPENAI_MODEL_DEPLOYMENT,
+    AZURE_OPENAI_VERSION,
+)
+
+# An index built by rag/preprocessing/build_index.py (IVF, HNSW, ...) can be served instead of the layout's flat one
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", CHUNK_LAYOUT["index_dir"])
+CHUNKS_PATH = CHUNK_LAYOUT["chunks"]
+PRODUCT_INFO_PATH = "rag/brand_products.json"
+
+# Seconds between two checks of the watched files, so a busy worker doesn't stat them on every request
+RELOAD_CHECK_INTERVAL = float(os.getenv("RAG_RELOAD_CHECK_INTERVAL", "5"))
+
+# Map index.faiss read-only instead of copying it, so the workers of a node share it through the page cache
+INDEX_MMAP = os.getenv("RAG_INDEX_MMAP", "1") != "0"
+
+# Restrict the search to the products or brands a question names, with a smaller k
+METADATA_FILTERING = os.getenv("RAG_METADATA_FILTER", "1") != "0"
+FILTERED_K = int(os.getenv("RAG_FILTERED_K", str(CHUNK_LAYOUT["filtered_k"])))
+
+# Search the per-brand / per-category shards when the index directory has them
+SHARD_SEARCH = os.getenv("RAG_SHARD_SEARCH", "1") != "0"
+
+# Candidates taken from each of the vector and BM25 rankings before fusion, as a multiple of k
+HYBRID_DEPTH = 2
+
+# Retrieve through rag/retrieval_service.py instead of loading the index in every worker
+RETRIEVAL_SERVICE = os.getenv("RAG_RETRIEVAL_SERVICE", "0") == "1"
+
+if MICRO_BATCHING:
+    faiss.cvar.distance_compute_blas_threshold = FAISS_BLAS_THRESHOLD
+
+# Start the RAG retrieval while the question is still being routed
+SPECULATIVE_RETRIEVAL = os.getenv("RAG_SPECULATIVE_RETRIEVAL", "1") != "0"
+
+
+def _server_threads():
+    """
+    Request threads of this worker: gunicorn's --threads (exported as GUNICORN_THREADS), asgiref's
+    ASGI_THREADS, else the default size of a thread pool, which is also asgiref's
+    """
+    for name in ("GUNICORN_THREADS", "ASGI_THREADS"):
+        if os.getenv(name):
+            return int(os.getenv(name))
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+# One speculative task per request thread, so the pool never caps the requests a worker serves at once
+SPECULATIVE_WORKERS = int(os.getenv("RAG_SPECULATIVE_WORKERS") or _server_threads())
+_speculative_executor = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="rag-speculative")
+
+
+def make_chat_llm():
+    return AzureChatOpenAI(
+        openai_api_type="azure",
+        api_key=AZURE_OPENAI_KEY,
+        api_version=AZURE_OPENAI_VERSION,
+        azure_endpoint=AZURE_OPENAI_ENDPOINT,
+        azure_deployment=AZURE_OPENAI_MODEL_DEPLOYMENT,
+        temperature=0.5
+    )
+
+
+class RAGEngine:
+    """Long-lived holder of everything the RAG route needs: link manager, clients and FAISS index"""
+
+    def __init__(self, index_dir=INDEX_DIR, chunks_json_path=CHUNKS_PATH, product_info_path=PRODUCT_INFO_PATH,
+                 snapshot=None):
+        self.index_dir = index_dir
+        self.chunks_json_path = chunks_json_path
+        self.product_info_path = product_info_path
+        # Published snapshots are never modified, an engine serving one only watches the CURRENT pointer
+        self.snapshot = snapshot
+
+        started = time.perf_counter()
+
+        # Take the signature first so a write that lands while loading triggers another reload
+        self.signature = self._files_signature()
+        # Short id of the data this engine serves, caches keyed on it are dropped when it changes
+        if snapshot is not None:
+            self.version = os.path.basename(snapshot)
+        else:
+            self.version = hashlib.sha1(repr(self.signature).encode("utf-8")).hexdigest()[:12]
+        self._last_check = time.monotonic()
+
+        self.link_manager = ProductLinkManager(chunks_json_path, product_info_path)
+
+        # Repeated questions are answered from the query-embedding cache instead of another API round trip
+        self.embedding = CachedEmbeddings(
+            AzureOpenAIEmbeddings(
+                deployment=AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+                openai_api_type="azure",
+                chunk_size=max(16, EMBED_BATCH_MAX)
+            ),
+            get_embedding_cache(),
+            AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+            batching=MICRO_BATCHING
+        )
+
+        self.llm = make_chat_llm()
+
+        # faiss.read_index restores any index type, only its search-time parameters come from the config
+        self.index_config = load_index_config(self.index_dir)
+        self.vectorstore = load_vectorstore(self.index_dir, self.embedding, self.index_config, mmap=INDEX_MMAP)
+        apply_search_params(self.vectorstore.index, self.index_config.get("search_params", {}))
+        self.metadata_index = MetadataIndex(self.vectorstore)
+        # Unfiltered searches of concurrent requests run as one multi-query index.search
+        self.search_batcher = MicroBatcher(
+            self._search_batch, SEARCH_BATCH_MAX, SEARCH_BATCH_WAIT_MS, "search"
+        ) if MICRO_BATCHING else None
+
+        # Per-brand or per-category shards written by rag/preprocessing/build_shards.py, searched in parallel
+        shards_config = load_shards_config(self.index_dir) if SHARD_SEARCH else None
+        self.sharded = ShardedIndex(
+            self.index_dir, shards_config, self.vectorstore.index.ntotal, mmap=INDEX_MMAP
+        ) if shards_config else None
+        if self.sharded is not None:
+            print(f"[DEBUG] Searching {len(self.sharded.shards)} {self.sharded.field} shards")
+
+        # BM25 over the same documents, fused with the vector search and answering confident matches alone
+        self.lexical = LexicalIndex(self.vectorstore) if HYBRID_SEARCH or LEXICAL_FAST_PATH else None
+
+        print(f"[DEBUG] RAG engine loaded in {time.perf_counter() - started:.2f}s "
+              f"({self.vectorstore.index.ntotal} vectors, {self.index_config['factory']} index)")
+
+    def retrieve(self, question, k=10, timings=None, filters=None):
+        """
+        Top-k documents for the question, straight from the vectorstore (embed + search, no generation).
+        A confident lexical match is returned without the embedding call.
+        """
+        started = time.perf_counter()
+        filters, k = self.question_filters(question, k, filters, timings)
+        docs = self.lexical_retrieve(question, k, filters, timings)
+        embedded = None
+        if docs is None:
+            vector = self.embedding.embed_query(question)
+            embedded = time.perf_counter()
+            docs = self.search_for_question(question, vector, k=k, filters=filters, timings=timings)
+
+        if timings is not None:
+            self._retrieval_timings(timings, started, embedded)
+        return docs
+
+    async def aretrieve(self, question, k=10, timings=None, filters=None):
+        """
+        retrieve() for the async views: the embedding call and the batched FAISS search are awaited, BM25
+        and the docstore reads run in a thread so the event loop is never blocked
+        """
+        started = time.perf_counter()
+        filters, k = self.question_filters(question, k, filters, timings)
+        docs = await asyncio.to_thread(self.lexical_retrieve, question, k, filters, timings)
+        embedded = None
+        if docs is None:
+            vector = await self.embedding.aembed_query(question)
+            embedded = time.perf_counter()
+            docs = await self.asearch_for_question(question, vector, k=k, filters=filters, timings=timings)
+
+        if timings is not None:
+            self._retrieval_timings(timings, started, embedded)
+        return docs
+
+    def _retrieval_timings(self, timings, started, embedded):
+        if embedded is not None:
+            timings["embed_ms"] = round((embedded - started) * 1000, 1)
+            timings["embedding_cache"] = self.embedding.cache.stats()
+        if MICRO_BATCHING:
+            timings["micro_batching"] = self.batch_stats()
+        timings["search_ms"] = round((time.perf_counter() - (embedded or started)) * 1000, 1)
+
+    def question_filters(self, question, k, filters=None, timings=None):
+        """
+        (filters, k) for the question: filters=None detects the products or brands it names, {} searches
+        everything. A filtered search needs fewer documents, k is capped.
+        """
+        if filters is None and METADATA_FILTERING:
+            filters = self.metadata_index.detect(question)
+        if filters:
+            k = min(k, FILTERED_K)
+            if timings is not None:
+                timings["filters"] = filters
+        return filters or {}, k
+
+    def search_for_question(self, question, vector, k=10, filters=None, timings=None):
+        """search_by_vector restricted to the products or brands the question names, fused with BM25"""
+        filters, k = self.question_filters(question, k, filters, timings)
+        if self.lexical is not None and HYBRID_SEARCH:
+            return self.hybrid_search(question, vector, k=k, filters=filters)
+        return self.search_by_vector(vector, k=k, filters=filters)
+
+    async def asearch_for_question(self, question, vector, k=10, filters=None, timings=None):
+        """search_for_question for the async views, concurrent requests still share a batched index.search"""
+        filters, k = self.question_filters(question, k, filters, timings)
+        if self.lexical is not None and HYBRID_SEARCH:
+            positions, distances = await self._avector_hits(vector, k * HYBRID_DEPTH, filters)
+            return await asyncio.to_thread(self._fused_documents, question, k, filters, positions, distances)
+        positions, distances = await self._avector_hits(vector, k, filters)
+        return await asyncio.to_thread(self._scored_documents, positions, distances)
+
+    def lexical_retrieve(self, question, k=10, filters=None, timings=None):
+        """
+        BM25 top-k when the best match contains nearly all of the question's terms ("kitkat mega calories"),
+        None when the question needs the vector search
+        """
+        if self.lexical is None or not LEXICAL_FAST_PATH:
+            return None
+        scores, positions, confidence = self.lexical.search(question, k, self._filter_ids(filters))
+        if timings is not None:
+            timings["lexical_confidence"] = round(confidence, 3)
+        if confidence < LEXICAL_CONFIDENCE:
+            return None
+        if timings is not None:
+            timings["retrieval"] = "lexical"
+        return self._documents([(position, {"bm25": round(score, 3)}) for score, position in zip(scores, positions)])
+
+    def hybrid_search(self, question, vector, k=10, filters=None):
+        """
+        Vector and BM25 rankings fused with reciprocal rank fusion. Documents carry their fused score and,
+        when they were in that ranking, their FAISS distance and BM25 score. There is no metadata["score"],
+        the context builder keeps the fused order.
+        """
+        positions, distances = self._vector_hits(vector, k * HYBRID_DEPTH, filters)
+        return self._fused_documents(question, k, filters, positions, distances)
+
+    def _fused_documents(self, question, k, filters, positions, distances):
+        """hybrid_search once the vector hits are known: BM25 ranking, fusion and docstore reads"""
+        distance_of = {int(p): float(d) for d, p in zip(distances, positions) if p >= 0}
+        scores, lexical_positions, _ = self.lexical.search(question, k * HYBRID_DEPTH, self._filter_ids(filters))
+        bm25_of = dict(zip(lexical_positions, scores))
+
+        hits = []
+        for position, fused in reciprocal_rank_fusion([list(distance_of), lexical_positions], [1.0, LEXICAL_WEIGHT], k):
+            hit = {"fusion": round(fused, 5)}
+            if position in distance_of:
+                hit["distance"] = distance_of[position]
+            if position in bm25_of:
+                hit["bm25"] = round(bm25_of[position], 3)
+            hits.append((position, hit))
+        return self._documents(hits)
+
+    def search_by_vector(self, vector, k=10, filters=None):
+        """Top-k documents with their FAISS distance in metadata["score"] (lower is closer)"""
+        positions, distances = self._vector_hits(vector, k, filters)
+        return self._scored_documents(positions, distances)
+
+    def _scored_documents(self, positions, distances):
+        return self._documents([(int(p), {"score": float(d)}) for d, p in zip(distances, positions) if p >= 0])
+
+    def _filter_ids(self, filters):
+        # A filter matching nothing searches everything, like search_params
+        ids = self.metadata_index.ids(filters) if filters else None
+        return ids if ids is not None and len(ids) else None
+
+    def _vector_hits(self, vector, k, filters=None):
+        """(positions, distances) of the k nearest vectors, positions are -1 past the last hit"""
+        if self.sharded is not None:
+            # Shards without any of the filtered documents aren't searched at all
+            distances, positions = self.sharded.search(vector, k, self._filter_ids(filters))
+            return positions, distances
+
+        params, candidates = self.metadata_index.search_params(filters) if filters else (None, 0)
+        if params is not None:
+            # Only the vectors of the matching documents are ranked, the rest of the index is skipped
+            k = min(k, candidates)
+
+        if params is None and self.search_batcher is not None:
+            distances, positions = self.search_batcher.submit((vector, k))
+        else:
+            distances, positions = self.vectorstore.index.search(np.asarray([vector], dtype=np.float32), k, params=params)
+            distances, positions = distances[0], positions[0]
+        return positions, distances
+
+    async def _avector_hits(self, vector, k, filters=None):
+        """_vector_hits for the async views: an unfiltered search is awaited in the shared batch"""
+        if self.sharded is None and not filters and self.search_batcher is not None:
+            distances, positions = await self.search_batcher.asubmit((vector, k))
+            return positions, distances
+        return await asyncio.to_thread(self._vector_hits, vector, k, filters)
+
+    def _documents(self, hits):
+        """Documents at the (position, scores) hits, with the scores added to their metadata"""
+        docs = self._documents_at([position for position, _ in hits])
+        # Copies, the docstore documents themselves are shared by every request
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, **scores})
+            for doc, (_, scores) in zip(docs, hits)
+        ]
+
+    def _search_batch(self, items):
+        """(distances, positions) of each (vector, k), one index.search per distinct k"""
+        results = [None] * len(items)
+        by_k = {}
+        for i, (_, k) in enumerate(items):
+            by_k.setdefault(k, []).append(i)
+        for k, indices in by_k.items():
+            queries = np.asarray([items[i][0] for i in indices], dtype=np.float32)
+            distances, positions = self.vectorstore.index.search(queries, k)
+            for row, i in enumerate(indices):
+                results[i] = (distances[row], positions[row])
+        return results
+
+    def batch_stats(self):
+        stats = {}
+        if self.embedding.batcher is not None:
+            stats["embed"] = self.embedding.batcher.stats()
+        if self.search_batcher is not None:
+            stats["search"] = self.search_batcher.stats()
+        return stats
+
+    def _documents_at(self, positions):
+        docstore = self.vectorstore.docstore
+        if isinstance(docstore, SQLiteDocstore):
+            return docstore.documents_at(positions) if positions else []
+        return [docstore.search(self.vectorstore.index_to_docstore_id[position]) for position in positions]
+
+    def start_speculative_retrieval(self, question, k=10):
+        return SpeculativeRetrieval(self, question, k)
+
+    def warm_up(self):
+        """
+        Read the index and docstore files once and run a search, so the first requests served by a freshly
+        loaded engine don't pay for page faults into memory-mapped files
+        """
+        for name in ("index.faiss", DOCSTORE_FILE):
+            path = os.path.join(self.index_dir, name)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    while f.read(1 << 20):
+                        pass
+        self.search_by_vector(np.zeros(self.vectorstore.index.d, dtype=np.float32).tolist(), k=1)
+
+    def _watched_files(self):
+        if self.snapshot is not None:
+            return []
+        return [
+            os.path.join(self.index_dir, "index.faiss"),
+            os.path.join(self.index_dir, "index.pkl"),
+            os.path.join(self.index_dir, DOCSTORE_FILE),
+            os.path.join(self.index_dir, INDEX_CONFIG_FILE),
+            os.path.join(self.index_dir, SHARDS_FILE),
+            self.chunks_json_path,
+            self.product_info_path,
+        ]
+
+    def _files_signature(self):
+        """(path, mtime, size) of every watched file, missing files included as None"""
+        signature = []
+        for path in self._watched_files():
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def is_stale(self):
+        """Check whether another snapshot was published, or the index or catalog files changed on disk"""
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_INTERVAL:
+            return False
+        self._last_check = now
+        if serving_snapshot() != self.snapshot:
+            return True
+        return self._files_signature() != self.signature
+
+
+class SpeculativeRetrieval:
+    """Embedding + FAISS search for the RAG route, started in the background before routing is decided"""
+
+    def __init__(self, engine, question, k):
+        self.engine = engine
+        self.question = question
+        self.k = k
+        self.timings = {}
+        self.started = time.perf_counter()
+        self.finished = None
+        self._vector = Future()
+        self._docs = _speculative_executor.submit(self._run)
+
+    def _run(self):
+        try:
+            embed_started = time.perf_counter()
+            filters, k = self.engine.question_filters(self.question, self.k, timings=self.timings)
+            docs = self.engine.lexical_retrieve(self.question, k, filters, self.timings)
+            if docs is not None:
+                # Answered without an embedding, embedding() computes it if the router or the cache needs it
+                self._vector.set_result(None)
+                search_started = embed_started
+            else:
+                vector = self.engine.embedding.embed_query(self.question)
+                self._vector.set_result(vector)
+
+                search_started = time.perf_counter()
+                docs = self.engine.search_for_question(self.question, vector, k=k, filters=filters, timings=self.timings)
+                self.timings["embed_ms"] = round((search_started - embed_started) * 1000, 1)
+            self.finished = time.perf_counter()
+
+            self.timings["search_ms"] = round((self.finished - search_started) * 1000, 1)
+            self.timings["retrieve_ms"] = round((self.finished - self.started) * 1000, 1)
+            return docs
+        except Exception as e:
+            # Filters, BM25 or the embedding failed: embedding() raises instead of waiting forever
+            if not self._vector.done():
+                self._vector.set_exception(e)
+            raise
+        finally:
+            if not self._vector.done():
+                self._vector.set_result(None)
+
+    def embedding(self):
+        """Question embedding, shared with the router and the semantic cache so it is computed once"""
+        vector = self._vector.result()
+        if vector is None:
+            vector = self.engine.embedding.embed_query(self.question)
+        return vector
+
+    def computed_embedding(self, wait=True):
+        """
+        The embedding the retrieval computed, None when it answered on the lexical fast path. Without wait,
+        None as well while it is still being computed or when it failed.
+        """
+        if not wait and (not self._vector.done() or self._vector.exception() is not None):
+            return None
+        return self._vector.result()
+
+    def result(self):
+        return self._docs.result()
+
+    def discard(self):
+        """The router picked another route, drop the work (it may already be running and just gets ignored)"""
+        if self._docs.cancel():
+            # Cancelled before it ran, embedding() computes the vector itself instead of waiting for it
+            self._vector.set_result(None)
+
+    def overlap_saved_ms(self, routed_at):
+        """Wall time hidden by running retrieval alongside routing, compared to doing both one after the other"""
+        if self.finished is None:
+            return 0.0
+        sequential = (routed_at - self.started) + (self.finished - self.started)
+        overlapped = max(routed_at, self.finished) - self.started
+        return round((sequential - overlapped) * 1000, 1)
+
+
+def serving_snapshot():
+    """The current snapshot, or None to serve INDEX_DIR (nothing published, or RAG_INDEX_DIR set)"""
+    if os.getenv("RAG_INDEX_DIR"):
+        return None
+    return current_snapshot(SNAPSHOT_DIR)
+
+
+def build_engine():
+    if RETRIEVAL_SERVICE:
+        from rag.langchain.retrieval_client import RemoteRAGEngine
+        return RemoteRAGEngine()
+
+    snapshot = serving_snapshot()
+    if snapshot is None:
+        return RAGEngine()
+    return RAGEngine(
+        index_dir=snapshot,
+        chunks_json_path=os.path.join(snapshot, CHUNKS_FILE),
+        product_info_path=os.path.join(snapshot, CATALOG_FILE),
+        snapshot=snapshot
+    )
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_reload_thread = None
+
+
+def get_rag_engine():
+    """
+    Return the process-wide RAG engine, building it on first use. When a new snapshot is published or the
+    files change, the next engine is built in the background and swapped in once warm; requests keep
+    being served by the current one meanwhile.
+    """
+    global _engine
+
+    engine = _engine
+    if engine is not None:
+        if engine.is_stale():
+            _start_reload(engine)
+        return engine
+
+    with _engine_lock:
+        # Another thread may have built the engine while we were waiting for the lock
+        if _engine is None:
+            _engine = build_engine()
+        return _engine
+
+
+def _start_reload(stale):
+    global _reload_thread
+
+    with _engine_lock:
+        if _reload_thread is not None or _engine is not stale:
+            return
+        _reload_thread = threading.Thread(target=_reload, args=(stale,), name="rag-reload", daemon=True)
+        _reload_thread.start()
+
+
+def _reload(stale):
+    global _engine, _reload_thread
+
+    print("[DEBUG] RAG snapshot, index or catalog changed, building the new engine in the background")
+    try:
+        engine = build_engine()
+        engine.warm_up()
+    except Exception as e:
+        # Files may be half written, keep serving the previous engine and retry on the next check
+        print(f"[WARNING] RAG engine reload failed, keeping the previous one: {e}")
+        engine = None
+
+    with _engine_lock:
+        if engine is not None and _engine is stale:
+            # Requests already holding the previous engine finish with it
+            _engine = engine
+            print(f"[DEBUG] Now serving RAG engine version {engine.version}")
+        _reload_thread = None
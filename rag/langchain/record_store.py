@@ -0,0 +1,263 @@
+import json
+import os
+import sqlite3
+import threading
+
+from rag.langchain.metadata_index import normalize_name
+from rag.langchain.snapshots import file_sha256
+
+# SQLite copies of the chunk, metadata and catalog JSON files, written next to them (rag/chunks.sqlite3, ...).
+# Records are read by position, product or brand without parsing the whole file.
+CHUNK_SCHEMA = """
+CREATE TABLE records (
+    position INTEGER PRIMARY KEY,
+    chunk_id TEXT,
+    brand TEXT,
+    product TEXT,
+    chunk_type TEXT,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX records_brand ON records (brand);
+CREATE INDEX records_product ON records (product);
+"""
+
+CATALOG_SCHEMA = """
+CREATE TABLE brands (
+    position INTEGER PRIMARY KEY,
+    brand TEXT NOT NULL,
+    brand_key TEXT NOT NULL,
+    category TEXT,
+    url TEXT,
+    record TEXT NOT NULL
+);
+CREATE TABLE products (
+    position INTEGER PRIMARY KEY,
+    brand_position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    product_url TEXT,
+    image_url TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX brands_key ON brands (brand_key);
+CREATE INDEX products_name ON products (name_key);
+CREATE INDEX products_brand ON products (brand_position);
+"""
+
+# The JSON file a copy was written from, fresh_store compares it with the file on disk
+SOURCE_SCHEMA = """
+CREATE TABLE source (
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+
+# Copies already reported as stale, warned about once per process
+_stale_reported = set()
+
+
+def store_path(json_path):
+    """The SQLite copy of a JSON file, rag/chunks.json -> rag/chunks.sqlite3"""
+    return f"{os.path.splitext(json_path)[0]}.sqlite3"
+
+
+def _source_row(json_path):
+    st = os.stat(json_path)
+    return st.st_size, st.st_mtime_ns, file_sha256(json_path)
+
+
+def fresh_store(json_path):
+    """
+    The SQLite copy of json_path when it exists and was written from the JSON file as it is now, else None.
+    The copy records the size, mtime and sha256 of its source: a checkout or copy that only changes the
+    mtime is recognised by the hash.
+    """
+    path = store_path(json_path)
+    if not os.path.exists(path):
+        return None
+    if not os.path.exists(json_path):
+        return path
+
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            source = connection.execute("SELECT size, mtime_ns, sha256 FROM source").fetchone()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        # Written before the source was recorded
+        source = None
+
+    st = os.stat(json_path)
+    if source is not None and source[0] == st.st_size:
+        if source[1] == st.st_mtime_ns or source[2] == file_sha256(json_path):
+            return path
+    if path not in _stale_reported:
+        _stale_reported.add(path)
+        print(f"[WARNING] {path} was not written from the current {json_path}, reading the JSON file "
+              f"(rewrite it with: python -m rag.preprocessing.convert_storage)")
+    return None
+
+
+def _write(path, schema, tables, source=None):
+    """Write the rows of every table (and the source row of JSON file source) to a new SQLite file, swap it in atomically"""
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    if source:
+        schema += SOURCE_SCHEMA
+        tables = {**tables, "source": [_source_row(source)]}
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript(schema)
+        for table, rows in tables.items():
+            if rows:
+                connection.executemany(f"INSERT INTO {table} VALUES ({','.join('?' * len(rows[0]))})", rows)
+        connection.commit()
+    finally:
+        connection.close()
+
+    os.replace(tmp_path, path)
+
+
+def write_chunk_store(path, chunks, source=None):
+    """
+    Write chunks.json / metadata.json records ({"metadata", "content"[, "chunk_id"]}) in file order. source is
+    the JSON file they were read from, recorded for fresh_store.
+    """
+    rows = []
+    for position, chunk in enumerate(chunks):
+        metadata = chunk.get("metadata", {})
+        rows.append((position, chunk.get("chunk_id"), normalize_name(metadata.get("brand") or ""),
+                     normalize_name(metadata.get("product_name") or ""), metadata.get("chunk_type"),
+                     chunk.get("content", ""), json.dumps(metadata, ensure_ascii=False)))
+    _write(path, CHUNK_SCHEMA, {"records": rows}, source)
+    return len(rows)
+
+
+def write_catalog_store(path, brand_entries, source=None):
+    """Write the brands of brand_products.json and their products, in file order, source as in write_chunk_store"""
+    brands, products = [], []
+    for brand_position, entry in enumerate(brand_entries):
+        brand = entry.get("brand", "").strip()
+        record = {key: value for key, value in entry.items() if key != "products"}
+        brands.append((brand_position, brand, normalize_name(brand), entry.get("category"), entry.get("url"),
+                       json.dumps(record, ensure_ascii=False)))
+        for product in entry.get("products", []):
+            name = product.get("name", "").strip()
+            products.append((len(products), brand_position, name, normalize_name(name), product.get("product_url"),
+                             product.get("image_url"), json.dumps(product, ensure_ascii=False)))
+    _write(path, CATALOG_SCHEMA, {"brands": brands, "products": products}, source)
+    return len(brands), len(products)
+
+
+class _ReadOnlyStore:
+    """Read-only SQLite file, each thread gets its own connection"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def _query(self, sql, params=()):
+        return self._connection().execute(sql, params)
+
+
+def _chunk(chunk_id, content, metadata):
+    chunk = {"metadata": json.loads(metadata), "content": content}
+    if chunk_id is not None:
+        chunk["chunk_id"] = chunk_id
+    return chunk
+
+
+class ChunkStore(_ReadOnlyStore):
+    """
+    chunks.json / metadata.json records by position (the FAISS position of the documents built from them),
+    product or brand, shaped like the entries of the JSON file
+    """
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def __getitem__(self, position):
+        row = self._query("SELECT chunk_id, content, metadata FROM records WHERE position = ?", (int(position),)).fetchone()
+        if row is None:
+            raise IndexError(position)
+        return _chunk(*row)
+
+    def __iter__(self):
+        for row in self._query("SELECT chunk_id, content, metadata FROM records ORDER BY position"):
+            yield _chunk(*row)
+
+    def records_at(self, positions):
+        """Records at the given positions, in that order, read in one query; unknown positions are skipped"""
+        positions = [int(position) for position in positions]
+        rows = self._query(
+            f"SELECT position, chunk_id, content, metadata FROM records WHERE position IN ({','.join('?' * len(positions))})",
+            positions
+        ).fetchall()
+        records = {position: _chunk(*row) for position, *row in rows}
+        return [records[position] for position in positions if position in records]
+
+    def by_product(self, name, brand=None):
+        """Records of a product (optionally of one brand), in file order"""
+        sql, params = "SELECT chunk_id, content, metadata FROM records WHERE product = ?", [normalize_name(name)]
+        if brand:
+            sql += " AND brand = ?"
+            params.append(normalize_name(brand))
+        return [_chunk(*row) for row in self._query(f"{sql} ORDER BY position", params)]
+
+    def by_brand(self, brand):
+        """Records of a brand and its products, in file order"""
+        rows = self._query("SELECT chunk_id, content, metadata FROM records WHERE brand = ? ORDER BY position",
+                           (normalize_name(brand),))
+        return [_chunk(*row) for row in rows]
+
+
+class CatalogStore(_ReadOnlyStore):
+    """brand_products.json by brand and product, the columns the catalog indexes are read without the records"""
+
+    def brands(self):
+        """Brand entries without their products, in file order"""
+        return [json.loads(record) for (record,) in self._query("SELECT record FROM brands ORDER BY position")]
+
+    def brand_products(self, brand):
+        """Product records of a brand, in file order"""
+        rows = self._query(
+            "SELECT p.record FROM products p JOIN brands b ON b.position = p.brand_position "
+            "WHERE b.brand_key = ? ORDER BY p.position", (normalize_name(brand),)
+        )
+        return [json.loads(record) for (record,) in rows]
+
+    def product(self, name, brand=""):
+        """Product record by name, the one of brand when several brands list it, None if unknown"""
+        sql = ("SELECT p.record FROM products p JOIN brands b ON b.position = p.brand_position "
+               "WHERE p.name_key = ? ORDER BY b.brand_key = ? DESC, p.position DESC LIMIT 1")
+        row = self._query(sql, (normalize_name(name), normalize_name(brand))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def link_rows(self):
+        """(brand, category, brand url, product name, product url, image url) of every product, and
+        (brand, category, brand url, None, None, None) for brands without products, in file order"""
+        return self._query(
+            "SELECT b.brand, b.category, b.url, p.name, p.product_url, p.image_url FROM brands b "
+            "LEFT JOIN products p ON p.brand_position = b.position ORDER BY b.position, p.position"
+        ).fetchall()
+
+    def load(self):
+        """The whole catalog, shaped like brand_products.json"""
+        entries = self.brands()
+        for entry in entries:
+            entry["products"] = []
+        for brand_position, record in self._query("SELECT brand_position, record FROM products ORDER BY position"):
+            entries[brand_position]["products"].append(json.loads(record))
+        return entries
@@ -0,0 +1,114 @@
+import os
+import re
+import time
+
+import numpy as np
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.context_builder import CHUNK_TYPE_WEIGHTS, count_tokens
+from rag.langchain.lexical_index import tokenize
+from rag.langchain.metadata_index import compact_ngrams, normalize_name
+
+# Rerank the retrieved chunks on the CPU and keep only the best ones for the prompt
+RERANK_ENABLED = os.getenv("RAG_RERANK", "1") != "0"
+RERANK_KEEP = int(os.getenv("RAG_RERANK_KEEP", str(CHUNK_LAYOUT["rerank_keep"])))
+if RERANK_KEEP < 1:
+    raise ValueError(f"RAG_RERANK_KEEP must be at least 1, got {RERANK_KEEP}")
+# Chunks scoring below this share of the best chunk are dropped even when fewer than RERANK_KEEP remain
+RERANK_MIN_SHARE = float(os.getenv("RAG_RERANK_MIN_SHARE", "0.5"))
+
+# Weight of each signal in the rerank score, all signals are in [0, 1]
+RERANK_WEIGHTS = {"overlap": 1.0, "entity": 1.0, "chunk_type": 0.5, "retrieval": 0.5}
+
+# Chunk types a question is asking for, by its wording
+INTENT_PATTERNS = {
+    ("ingredients", "ingredients_list"): r"\b(ingredients?|contains?|made (with|of|from)|allergens?|peanuts?|nuts?"
+                                         r"|gluten|wheat|milk|dairy|soy|vegan|vegetarian|halal|kosher)\b",
+    ("nutrition", "nutrition_table"): r"\b(calories|sugars?|fat|protein|sodium|carbs?|carbohydrates?|fibre|fiber"
+                                      r"|nutrition|nutrients?|cholesterol|vitamins?|iron|calcium|potassium)\b",
+}
+
+
+def _words(text):
+    return f" {re.sub(r'[^a-z0-9]+', ' ', normalize_name(text)).strip()} "
+
+
+def _compact(text):
+    return re.sub(r"[^a-z0-9]", "", normalize_name(text))
+
+
+def overlap_scores(question, texts):
+    """Share of the question's terms each text contains, weighted by their rarity among the texts"""
+    terms = list(dict.fromkeys(tokenize(question)))
+    if not terms or not texts:
+        return np.zeros(len(texts), dtype=np.float32)
+    text_terms = [set(tokenize(text)) for text in texts]
+    present = np.array([[term in found for term in terms] for found in text_terms], dtype=np.float32)
+    idf = np.log1p(len(texts) / (present.sum(axis=0) + 0.5))
+    return present @ idf / idf.sum()
+
+
+def entity_scores(question, metadatas):
+    """1 for chunks of a product the question names, 0.5 for its brand only, 0 otherwise (all 0 if it names none)"""
+    # Brands match without spaces, as whole words of the question ("kitkat", "kit kat", not "aeroplane" for Aero)
+    padded, ngrams = _words(question), compact_ngrams(_words(question))
+    products = [metadata.get("product_name") or "" for metadata in metadatas]
+    brands = [metadata.get("brand") or "" for metadata in metadatas]
+    named_products = {name for name in set(products) if name and _words(name) in padded}
+    named_brands = {name for name in set(brands) if name and _compact(name) in ngrams}
+
+    scores = np.zeros(len(metadatas), dtype=np.float32)
+    scores[np.isin(brands, list(named_brands))] = 0.5
+    scores[np.isin(products, list(named_products))] = 1.0
+    return scores
+
+
+def chunk_type_scores(question, metadatas):
+    """Prior of each chunk type, the types the question asks for ("does it contain peanuts") score 1"""
+    wanted = {chunk_type for chunk_types, pattern in INTENT_PATTERNS.items()
+              if re.search(pattern, question.lower()) for chunk_type in chunk_types}
+    chunk_types = [metadata.get("chunk_type") for metadata in metadatas]
+    # CHUNK_TYPE_WEIGHTS multiply a distance (0.9 best, 1.15 worst), mapped here to 0.75 .. 0.5
+    scores = np.array([0.75 - (CHUNK_TYPE_WEIGHTS.get(chunk_type, 1.0) - 0.9) for chunk_type in chunk_types],
+                      dtype=np.float32)
+    if wanted:
+        scores[np.isin(chunk_types, list(wanted))] = 1.0
+    return scores
+
+
+def rerank_order(question, texts, metadatas, keep=RERANK_KEEP, min_share=RERANK_MIN_SHARE):
+    """(indices, scores) of the chunks to keep, best first; texts and metadatas are in retrieval order"""
+    if not texts:
+        return [], []
+    signals = {
+        "overlap": overlap_scores(question, texts),
+        "entity": entity_scores(question, metadatas),
+        "chunk_type": chunk_type_scores(question, metadatas),
+        "retrieval": 1 / np.sqrt(np.arange(1, len(texts) + 1, dtype=np.float32)),
+    }
+    scores = sum(RERANK_WEIGHTS[name] * values for name, values in signals.items())
+
+    order = np.argsort(-scores, kind="stable")[:keep]
+    if not len(order):
+        return [], []
+    order = order[scores[order] >= min_share * scores[order[0]]]
+    return order.tolist(), scores[order].tolist()
+
+
+def rerank(question, docs, keep=RERANK_KEEP, timings=None):
+    """The best keep of the retrieved documents, best first, with their rerank score in metadata["rerank"]"""
+    started = time.perf_counter()
+    indices, scores = rerank_order(question, [doc.page_content for doc in docs], [doc.metadata for doc in docs], keep)
+    reranked = [docs[i] for i in indices]
+    for doc, score in zip(reranked, scores):
+        doc.metadata["rerank"] = round(score, 4)
+
+    if timings is not None:
+        timings["rerank"] = {
+            "ms": round((time.perf_counter() - started) * 1000, 2),
+            "candidates": len(docs),
+            "kept": len(reranked),
+            "tokens_before": sum(count_tokens(doc.page_content) for doc in docs),
+            "tokens_after": sum(count_tokens(doc.page_content) for doc in reranked),
+        }
+    return reranked
@@ -1,5 +1,5 @@
 import os
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,10 +10,15 @@ client = AzureOpenAI(
     azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
 )
 
+async_client = AsyncAzureOpenAI(
+    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+)
+
 deployment_name = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
 
-def question_classifier(question):
-    system_prompt = """You are a smart assistant that classifies user questions into one of three categories:
+SYSTEM_PROMPT = """You are a smart assistant that classifies user questions into one of three categories:
                         1. "store" - if the question is about finding where to buy a product or locating nearby stores.
                         2. "graphrag" - if the question is about structured product information like nutrition facts, 'how many'/'how much'.
                         3. "rag" - if the question is general, features, category, ingredients, or asking about a product's description or brand info.
@@ -21,22 +26,36 @@ def question_classifier(question):
                         Respond ONLY with one of the following exact words: "store", "graphrag", or "rag".
                     """
 
-    response = client.chat.completions.create(
+
+def _classifier_request(question):
+    return dict(
         model=deployment_name,
         messages=[
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": question}
         ],
         temperature=0,
         max_tokens=10,
     )
 
+
+def _parse_classification(response):
     classification = response.choices[0].message.content.strip().lower()
     if classification not in ["store", "graphrag", "rag"]:
         return "rag"
     return classification
 
 
+def question_classifier(question):
+    response = client.chat.completions.create(**_classifier_request(question))
+    return _parse_classification(response)
+
+
+async def aquestion_classifier(question):
+    response = await async_client.chat.completions.create(**_classifier_request(question))
+    return _parse_classification(response)
+
+
 if __name__ == "__main__":
     question = input("Please enter your question: ")
     while question != "exit":
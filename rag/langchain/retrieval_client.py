@@ -0,0 +1,204 @@
+import asyncio
+import base64
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+from langchain.schema import Document
+
+SOCKET_PATH = os.getenv("RAG_RETRIEVAL_SOCKET", "/tmp/rag_retrieval.sock")
+CLIENT_TIMEOUT = float(os.getenv("RAG_RETRIEVAL_TIMEOUT", "30"))
+
+# Every message is a 4-byte big-endian length followed by that many bytes of JSON
+_HEADER = struct.Struct(">I")
+
+
+def send_message(sock, payload):
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def recv_message(sock):
+    """The next message, None when the peer closed the connection"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, _HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data)
+
+
+def encode_vector(vector):
+    # float32 bytes in base64, a quarter of the size of a JSON list of floats
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_vector(data):
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).tolist()
+
+
+def encode_docs(docs):
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+
+def decode_docs(items):
+    return [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in items]
+
+
+class RetrievalClient:
+    """Client of rag/retrieval_service.py, one persistent connection per thread"""
+
+    def __init__(self, path=SOCKET_PATH, timeout=CLIENT_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _socket(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def call(self, op, **fields):
+        # Requests are read-only, one retry on a fresh connection covers a restarted service
+        for attempt in range(2):
+            try:
+                sock = self._socket()
+                send_message(sock, {"op": op, **fields})
+                response = recv_message(sock)
+                if response is None:
+                    raise ConnectionError("retrieval service closed the connection")
+                break
+            except OSError:
+                self._close()
+                if attempt:
+                    raise
+        if "error" in response:
+            raise RuntimeError(f"Retrieval service error: {response['error']}")
+        return response
+
+    def info(self):
+        return self.call("info")
+
+    def embed_query(self, text):
+        return decode_vector(self.call("embed", text=text)["vector"])
+
+    def retrieve(self, question, k=10, timings=None, filters=None):
+        response = self.call("retrieve", question=question, k=k, filters=filters)
+        if timings is not None:
+            timings.update(response["timings"])
+        return decode_docs(response["docs"])
+
+    def lexical(self, question, k=10, filters=None, timings=None):
+        response = self.call("lexical", question=question, k=k, filters=filters)
+        if timings is not None:
+            timings.update(response["timings"])
+        return decode_docs(response["docs"]) if response["docs"] is not None else None
+
+    def search(self, question, vector, k=10, filters=None, timings=None):
+        response = self.call("search", question=question, vector=encode_vector(vector), k=k, filters=filters)
+        if timings is not None:
+            timings.update(response["timings"])
+        return decode_docs(response["docs"])
+
+
+class RemoteEmbeddings:
+    """Query embeddings computed (and cached) by the retrieval service"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def embed_query(self, text):
+        return self.client.embed_query(text)
+
+    async def aembed_query(self, text):
+        return await asyncio.to_thread(self.client.embed_query, text)
+
+
+class RemoteRAGEngine:
+    """
+    Stand-in for RAGEngine in web workers when RAG_RETRIEVAL_SERVICE=1: embedding and search go to the
+    retrieval service, only the LLM client and the link manager live in the worker.
+    """
+
+    def __init__(self, client=None):
+        from rag.langchain.rag_answer import ProductLinkManager
+        from rag.langchain.rag_engine import RELOAD_CHECK_INTERVAL, make_chat_llm
+
+        started = time.perf_counter()
+        self.client = client or RetrievalClient()
+        info = self.client.info()
+        self.version = info["version"]
+        self.reload_check_interval = RELOAD_CHECK_INTERVAL
+        self._last_check = time.monotonic()
+
+        self.embedding = RemoteEmbeddings(self.client)
+        self.llm = make_chat_llm()
+        # Same files as the service's engine, the worker shares the host's filesystem
+        self.link_manager = ProductLinkManager(info["chunks"], info["catalog"])
+
+        print(f"[DEBUG] Remote RAG engine ready in {time.perf_counter() - started:.2f}s "
+              f"(service {self.client.path}, version {self.version})")
+
+    def retrieve(self, question, k=10, timings=None, filters=None):
+        started = time.perf_counter()
+        docs = self.client.retrieve(question, k=k, timings=timings, filters=filters)
+        if timings is not None:
+            timings["service_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return docs
+
+    async def aretrieve(self, question, k=10, timings=None, filters=None):
+        return await asyncio.to_thread(self.retrieve, question, k, timings, filters)
+
+    def search_for_question(self, question, vector, k=10, filters=None, timings=None):
+        return self.client.search(question, vector, k=k, filters=filters, timings=timings)
+
+    def question_filters(self, question, k, filters=None, timings=None):
+        # Detected by the service along with the search
+        return filters, k
+
+    def lexical_retrieve(self, question, k=10, filters=None, timings=None):
+        return self.client.lexical(question, k=k, filters=filters, timings=timings)
+
+    def start_speculative_retrieval(self, question, k=10):
+        from rag.langchain.rag_engine import SpeculativeRetrieval
+        return SpeculativeRetrieval(self, question, k)
+
+    def warm_up(self):
+        self.client.info()
+
+    def is_stale(self):
+        """The service swapped to another index or snapshot"""
+        now = time.monotonic()
+        if now - self._last_check < self.reload_check_interval:
+            return False
+        self._last_check = now
+        try:
+            return self.client.info()["version"] != self.version
+        except (OSError, RuntimeError) as e:
+            print(f"[WARNING] Retrieval service unreachable: {e}")
+            return False
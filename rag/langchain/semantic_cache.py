@@ -0,0 +1,166 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+from rag.langchain.embedding_cache import normalize_query
+
+# === Cache configuration ===
+SEMANTIC_CACHE_ENABLED = os.getenv("RAG_SEMANTIC_CACHE", "1") != "0"
+SIMILARITY_THRESHOLD = float(os.getenv("RAG_SEMANTIC_CACHE_THRESHOLD", "0.93"))
+MAX_ENTRIES = int(os.getenv("RAG_SEMANTIC_CACHE_SIZE", "5000"))
+CACHE_TTL = float(os.getenv("RAG_SEMANTIC_CACHE_TTL", str(6 * 3600)))
+
+# Neighbours inspected per lookup, the closest one may belong to another chatbot name or history
+SEARCH_WIDTH = 8
+
+
+def history_fingerprint(chat_history, turns=2):
+    """Short hash of the last few messages, answers to follow-up questions depend on them"""
+    recent = [f"{msg.get('sender', '')}:{msg.get('text', '').strip().lower()}" for msg in chat_history[-turns:]]
+    return hashlib.sha1("\n".join(recent).encode("utf-8")).hexdigest()[:16]
+
+
+def question_key(question, route, chatbot_name, history_fp):
+    """Exact-wording key of a question in its context, for lookups without an embedding"""
+    text = f"{route}\0{chatbot_name}\0{history_fp}\0{normalize_query(question)}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Final answers of past questions, looked up by cosine similarity of the question embedding, or by the
+    exact wording of the question when the request has no embedding (the lexical fast path)
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_entries=MAX_ENTRIES, ttl=CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.index = None
+        self.entries = OrderedDict()
+        # question_key -> entry id
+        self.keys = {}
+        self.version = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _as_query(vector):
+        query = np.asarray(vector, dtype=np.float32).reshape(1, -1).copy()
+        faiss.normalize_L2(query)
+        return query
+
+    def _check_version(self, version):
+        # A new index or catalog can change any answer, so drop everything at once
+        if version != self.version:
+            if self.entries:
+                print("[DEBUG] Semantic cache invalidated, RAG data changed on disk")
+            self.index = None
+            self.entries.clear()
+            self.keys.clear()
+            self.version = version
+
+    def lookup(self, vector, route, chatbot_name, history_fp, version, question=None):
+        """Return (payload, similarity) of a cached answer for the same context, or None; vector may be None"""
+        with self._lock:
+            self._check_version(version)
+            now = time.time()
+
+            if question is not None:
+                entry_id = self.keys.get(question_key(question, route, chatbot_name, history_fp))
+                entry = self.entries.get(entry_id)
+                if entry is not None and now - entry["created"] <= self.ttl:
+                    self.entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry["payload"], 1.0
+
+            if vector is None or self.index is None or not self.index.ntotal:
+                self.misses += 1
+                return None
+
+            similarities, ids = self.index.search(self._as_query(vector), min(SEARCH_WIDTH, self.index.ntotal))
+
+            for similarity, entry_id in zip(similarities[0], ids[0]):
+                if entry_id < 0 or similarity < self.threshold:
+                    break
+                entry = self.entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                if now - entry["created"] > self.ttl:
+                    self._remove([int(entry_id)])
+                    continue
+                if (entry["route"], entry["chatbot_name"], entry["history_fp"]) != (route, chatbot_name, history_fp):
+                    continue
+
+                self.entries.move_to_end(int(entry_id))
+                self.hits += 1
+                return entry["payload"], float(similarity)
+
+            self.misses += 1
+            return None
+
+    def store(self, vector, route, chatbot_name, history_fp, payload, version, question=None):
+        """Cache an answer under its embedding and/or its question's exact wording, vector may be None"""
+        with self._lock:
+            self._check_version(version)
+            entry_id = self._next_id
+            self._next_id += 1
+
+            if vector is not None:
+                query = self._as_query(vector)
+                if self.index is None:
+                    self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(query.shape[1]))
+                self.index.add_with_ids(query, np.array([entry_id], dtype=np.int64))
+            key = None
+            if question is not None:
+                key = question_key(question, route, chatbot_name, history_fp)
+                if key in self.keys:
+                    # The newer answer replaces the one cached for the same wording
+                    self._remove([self.keys[key]])
+                self.keys[key] = entry_id
+            self.entries[entry_id] = {
+                "route": route,
+                "chatbot_name": chatbot_name,
+                "history_fp": history_fp,
+                "payload": payload,
+                "created": time.time(),
+                "key": key,
+            }
+
+            # Least recently used entries go first once the cache is full
+            if len(self.entries) > self.max_entries:
+                overflow = len(self.entries) - self.max_entries
+                self._remove(list(self.entries.keys())[:overflow])
+
+    def _remove(self, entry_ids):
+        for entry_id in entry_ids:
+            entry = self.entries.pop(entry_id, None)
+            if entry is not None and entry["key"] is not None:
+                self.keys.pop(entry["key"], None)
+        if self.index is not None and entry_ids:
+            self.index.remove_ids(np.array(entry_ids, dtype=np.int64))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticAnswerCache()
+    return _cache
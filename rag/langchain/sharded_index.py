@@ -0,0 +1,75 @@
+import heapq
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+from rag.langchain.index_config import mmap_flags, selector_params
+from rag.langchain.metadata_index import normalize_name
+
+# Written next to index.faiss by rag/preprocessing/build_shards.py
+SHARDS_FILE = "shards.json"
+
+# Threads searching shards in parallel, FAISS releases the GIL while it scans
+SHARD_WORKERS = int(os.getenv("RAG_SHARD_WORKERS", str(os.cpu_count() or 4)))
+_shard_executor = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="rag-shard")
+
+
+def shard_slug(value):
+    return re.sub(r"[^a-z0-9]+", "_", normalize_name(value or "")).strip("_") or "_none"
+
+
+def shard_file(slug):
+    return f"shard_{slug}.faiss"
+
+
+def load_shards_config(index_dir):
+    path = os.path.join(index_dir, SHARDS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ShardedIndex:
+    """
+    One FAISS index per brand or category value. Shards keep the global FAISS positions as ids, so hits
+    resolve through the single docstore. A search fans out to the shards in a thread pool and merges the
+    per-shard top-k in a heap; shards holding none of the allowed ids are skipped.
+    """
+
+    def __init__(self, index_dir, config, ntotal, mmap=True):
+        self.field = config["field"]
+        self.shards = {}
+        # FAISS position -> shard slug, to find the shards a filter touches
+        self.shard_of = np.empty(ntotal, dtype=object)
+
+        for slug, shard in config["shards"].items():
+            index = faiss.read_index(os.path.join(index_dir, shard_file(slug)), mmap_flags("Flat") if mmap else 0)
+            self.shards[slug] = index
+            self.shard_of[faiss.vector_to_array(index.id_map)] = slug
+
+    def shards_for(self, ids):
+        if ids is None:
+            return list(self.shards)
+        return sorted(slug for slug in set(self.shard_of[ids]) if slug is not None)
+
+    def _search_shard(self, slug, query, k, ids):
+        index = self.shards[slug]
+        params = selector_params(index, faiss.IDSelectorBatch(ids)) if ids is not None else None
+        distances, positions = index.search(query, min(k, index.ntotal), params=params)
+        return [(float(d), int(p)) for d, p in zip(distances[0], positions[0]) if p >= 0]
+
+    def search(self, vector, k, ids=None):
+        """(distances, positions) of the k nearest vectors, restricted to ids (FAISS positions) if given"""
+        query = np.asarray([vector], dtype=np.float32)
+        slugs = self.shards_for(ids)
+        if len(slugs) == 1:
+            hits = self._search_shard(slugs[0], query, k, ids)
+        else:
+            futures = [_shard_executor.submit(self._search_shard, slug, query, k, ids) for slug in slugs]
+            hits = heapq.nsmallest(k, (hit for future in futures for hit in future.result()))
+        return [d for d, _ in hits], [p for _, p in hits]
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+# Published versions of the index, docstore and catalog, one immutable directory each
+SNAPSHOT_DIR = os.getenv("RAG_SNAPSHOT_DIR", "rag/snapshots")
+# Holds the name of the snapshot the app serves, replaced atomically to switch versions
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+# Names of the chunks and catalog files inside a snapshot
+CHUNKS_FILE = "chunks.json"
+CATALOG_FILE = "brand_products.json"
+
+
+def current_snapshot(root=SNAPSHOT_DIR):
+    """Directory of the current snapshot, None when nothing was published yet"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(root, name)
+    return path if name and os.path.isdir(path) else None
+
+
+def set_current(root, version):
+    if not os.path.isfile(os.path.join(root, version, MANIFEST_FILE)):
+        raise ValueError(f"{version} is not a published snapshot in {root}")
+    tmp_path = os.path.join(root, f"{CURRENT_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def list_snapshots(root=SNAPSHOT_DIR):
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name, MANIFEST_FILE)))
+
+
+def load_manifest(snapshot):
+    with open(os.path.join(snapshot, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def new_version():
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def create_snapshot(root, files, manifest, version=None):
+    """
+    Copy files ({name in the snapshot: source path}) into a new snapshot directory with its manifest.
+    The directory is filled under a temporary name and renamed, it never appears half written.
+    """
+    version = version or new_version()
+    tmp_dir = os.path.join(root, f".{version}.tmp")
+    os.makedirs(tmp_dir)
+
+    entries = {}
+    for name, source in files.items():
+        shutil.copy2(source, os.path.join(tmp_dir, name))
+        entries[name] = {"bytes": os.path.getsize(source), "sha256": file_sha256(os.path.join(tmp_dir, name))}
+
+    manifest = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **manifest,
+        "files": entries,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    os.rename(tmp_dir, os.path.join(root, version))
+    return version
+
+
+def prune_snapshots(root, keep):
+    """Delete all but the newest keep snapshots, never the current one"""
+    current = current_snapshot(root)
+    removed = []
+    for name in list_snapshots(root)[:-keep] if keep > 0 else []:
+        path = os.path.join(root, name)
+        if current and os.path.samefile(path, current):
+            continue
+        # Workers still serving it keep their mapped files, unlinked files live until they are unmapped
+        shutil.rmtree(path)
+        removed.append(name)
+    return removed
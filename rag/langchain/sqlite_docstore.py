@@ -0,0 +1,140 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+
+# Written next to index.faiss in place of LangChain's pickled docstore (index.pkl)
+DOCSTORE_FILE = "docstore.sqlite3"
+
+SCHEMA = """
+CREATE TABLE documents (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+)
+"""
+
+
+class SQLiteDocstore(Docstore):
+    """
+    Read-only LangChain docstore over docstore.sqlite3. Nothing is loaded up front, a search reads the one
+    row FAISS asked for. Each thread gets its own connection, to the file that was at path when the docstore
+    was opened: once the file is replaced, threads connecting later share the connection opened with it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._file_id = _file_id(path)
+        self._pinned = self._connect()
+
+    def _connect(self):
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        # Reads the schema, so the file is opened before it is compared with the one the docstore was opened on
+        connection.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        return connection
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            if _file_id(self.path) != self._file_id:
+                # A newer build was swapped in, its documents don't match the FAISS index this docstore serves
+                connection.close()
+                connection = self._pinned
+            self._local.connection = connection
+        return connection
+
+    def search(self, search):
+        row = self._connection().execute(
+            "SELECT content, metadata FROM documents WHERE id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def documents_at(self, positions):
+        """Documents at the given FAISS positions, in that order, read in one query"""
+        positions = [int(position) for position in positions]
+        rows = self._connection().execute(
+            f"SELECT position, content, metadata FROM documents WHERE position IN ({','.join('?' * len(positions))})",
+            positions
+        ).fetchall()
+        documents = {position: Document(page_content=content, metadata=json.loads(metadata))
+                     for position, content, metadata in rows}
+        return [documents[position] for position in positions]
+
+    def position_ids(self):
+        return PositionIds(self)
+
+    def iter_metadata(self):
+        """(FAISS position, metadata) of every document, in one query"""
+        rows = self._connection().execute("SELECT position, metadata FROM documents ORDER BY position")
+        for position, metadata in rows:
+            yield position, json.loads(metadata)
+
+    def iter_documents(self):
+        """(FAISS position, Document) of every document, in one query"""
+        rows = self._connection().execute("SELECT position, content, metadata FROM documents ORDER BY position")
+        for position, content, metadata in rows:
+            yield position, Document(page_content=content, metadata=json.loads(metadata))
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def _file_id(path):
+    st = os.stat(path)
+    return st.st_dev, st.st_ino
+
+
+class PositionIds(Mapping):
+    """index_to_docstore_id of a SQLiteDocstore, FAISS position -> docstore id read on lookup"""
+
+    def __init__(self, docstore):
+        self.docstore = docstore
+
+    def __getitem__(self, position):
+        row = self.docstore._connection().execute(
+            "SELECT id FROM documents WHERE position = ?", (int(position),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self):
+        for (position,) in self.docstore._connection().execute("SELECT position FROM documents ORDER BY position"):
+            yield position
+
+    def __len__(self):
+        return len(self.docstore)
+
+    def items(self):
+        return iter(self.docstore._connection().execute("SELECT position, id FROM documents ORDER BY position"))
+
+
+def write_docstore(path, docstore, index_to_docstore_id):
+    """Write the documents of a LangChain docstore to a new SQLite file and swap it in atomically"""
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute(SCHEMA)
+        rows = []
+        for position, docstore_id in sorted(index_to_docstore_id.items()):
+            doc = docstore.search(docstore_id)
+            rows.append((int(position), docstore_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)))
+        connection.executemany("INSERT INTO documents VALUES (?, ?, ?, ?)", rows)
+        connection.commit()
+    finally:
+        connection.close()
+
+    os.replace(tmp_path, path)
+    return len(rows)
@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+import faiss
+import numpy as np
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.index_config import INDEX_CONFIG_FILE, apply_search_params, write_index_atomic
+from rag.langchain.sqlite_docstore import DOCSTORE_FILE
+
+# Factory string and search-time parameters of every index type, built from the parsed arguments
+INDEX_TYPES = {
+    "flat": lambda a, n, d: ("Flat", {}),
+    "ivf_flat": lambda a, n, d: (f"IVF{nlist(a, n)},Flat", {"nprobe": a.nprobe}),
+    "ivf_pq": lambda a, n, d: (f"IVF{nlist(a, n)},PQ{a.pq_m}x{a.pq_nbits}", {"nprobe": a.nprobe}),
+    "hnsw": lambda a, n, d: (f"HNSW{a.hnsw_m},Flat", {"efSearch": a.ef_search}),
+    # Quantized codes: 1 byte (sq8), 2 bytes (fp16) or pq_m * pq_nbits bits (pq) per vector instead of 4 bytes per dimension
+    "sq8": lambda a, n, d: ("SQ8", {}),
+    "fp16": lambda a, n, d: ("SQfp16", {}),
+    # A single inverted list: an exhaustive PQ scan, unlike a bare IndexPQ it accepts the id selectors of filtered search
+    "pq": lambda a, n, d: (f"IVF1,PQ{a.pq_m}x{a.pq_nbits}", {"nprobe": 1}),
+    "ivf_sq8": lambda a, n, d: (f"IVF{nlist(a, n)},SQ8", {"nprobe": a.nprobe}),
+}
+
+
+def nlist(args, ntotal):
+    # About sqrt(n) inverted lists, each list then holds ~sqrt(n) vectors
+    return args.nlist or max(1, int(np.sqrt(ntotal)))
+
+
+def load_flat_vectors(index_dir):
+    """Vectors of the exact index embedder.py writes, in FAISS position order (same order as the docstore)"""
+    index = faiss.read_index(os.path.join(index_dir, "index.faiss"))
+    if not isinstance(index, faiss.IndexFlat):
+        raise SystemExit(f"{index_dir} does not hold a flat index, build from the embedder output")
+    return index, index.reconstruct_n(0, index.ntotal)
+
+
+def build(factory, params, vectors, args):
+    index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_L2)
+    if args.type == "hnsw":
+        index.hnsw.efConstruction = args.ef_construction
+
+    started = time.perf_counter()
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    build_seconds = time.perf_counter() - started
+
+    apply_search_params(index, params)
+    return index, build_seconds
+
+
+def recall_at_k(exact, index, queries, k, repeats=3):
+    """Share of the exact top-k found by the index, and the mean search time per query"""
+    _, truth = exact.search(queries, k)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        _, found = index.search(queries, k)
+    search_ms = (time.perf_counter() - started) / repeats / len(queries) * 1000
+
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size, search_ms
+
+
+def query_sample(vectors, count, seed=0):
+    # Stored vectors with a little noise, so queries don't sit exactly on an indexed point
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)]
+    noise = rng.normal(scale=sample.std() * 0.5, size=sample.shape).astype(np.float32)
+    return np.ascontiguousarray(sample + noise)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a FAISS index of another type from the flat embedder output")
+    parser.add_argument("--type", choices=list(INDEX_TYPES), default="flat")
+    parser.add_argument("--source", default=CHUNK_LAYOUT["index_dir"], help="directory of the flat index")
+    parser.add_argument("--out", help="output directory (default: <source>_<type>)")
+    parser.add_argument("--nlist", type=int, help="IVF inverted lists (default: sqrt(n))")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF lists visited per query")
+    parser.add_argument("--pq-m", type=int, default=48, help="PQ sub-quantizers, must divide the dimension")
+    parser.add_argument("--pq-nbits", type=int, default=6, help="bits per PQ code (8 needs ~10k training vectors)")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbours per node")
+    parser.add_argument("--ef-construction", type=int, default=80)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--k", type=int, default=10, help="k of the recall@k report")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    out_dir = args.out or f"{args.source.rstrip('/')}_{args.type}"
+    exact, vectors = load_flat_vectors(args.source)
+    factory, params = INDEX_TYPES[args.type](args, len(vectors), vectors.shape[1])
+
+    print(f"Building {factory} over {len(vectors)} vectors of dimension {vectors.shape[1]}...")
+    index, build_seconds = build(factory, params, vectors, args)
+    index_bytes = faiss.serialize_index(index).nbytes
+    recall, search_ms = recall_at_k(exact, index, query_sample(vectors, args.queries), args.k)
+    _, exact_ms = recall_at_k(exact, exact, query_sample(vectors, args.queries), args.k)
+
+    # The docstore maps FAISS positions to documents, vectors were added in the same order
+    os.makedirs(out_dir, exist_ok=True)
+    write_index_atomic(index, os.path.join(out_dir, "index.faiss"))
+    if os.path.abspath(out_dir) != os.path.abspath(args.source):
+        for name in (DOCSTORE_FILE, "index.pkl"):
+            if os.path.exists(os.path.join(args.source, name)):
+                shutil.copy2(os.path.join(args.source, name), os.path.join(out_dir, f"{name}.tmp"))
+                os.replace(os.path.join(out_dir, f"{name}.tmp"), os.path.join(out_dir, name))
+
+    config = {
+        "type": args.type,
+        "factory": factory,
+        "metric": "L2",
+        "search_params": params,
+        "ntotal": index.ntotal,
+        "dimension": index.d,
+        "build_seconds": round(build_seconds, 2),
+        "index_bytes": index_bytes,
+        f"recall_at_{args.k}": round(recall, 4),
+        "search_ms_per_query": round(search_ms, 4),
+        "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(out_dir, INDEX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    print(f"Build time:     {build_seconds:.2f}s")
+    print(f"Index memory:   {index_bytes / 2 ** 20:.2f} MB (flat: {faiss.serialize_index(exact).nbytes / 2 ** 20:.2f} MB)")
+    print(f"Recall@{args.k}:      {recall:.4f}")
+    print(f"Search / query: {search_ms:.4f} ms (flat: {exact_ms:.4f} ms)")
+    print(f"Saved to {out_dir}/ (set RAG_INDEX_DIR={out_dir} to serve it)")
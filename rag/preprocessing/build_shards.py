@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import faiss
+import numpy as np
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.index_config import load_index_config, load_vectorstore, write_index_atomic
+from rag.langchain.metadata_index import position_metadata
+from rag.langchain.sharded_index import SHARDS_FILE, load_shards_config, shard_file, shard_slug
+from rag.preprocessing.build_index import load_flat_vectors
+
+
+def group_positions(vectorstore, field):
+    """{shard slug: (display value, FAISS positions)} of the documents, by metadata field"""
+    groups = defaultdict(list)
+    values = {}
+    for position, metadata in position_metadata(vectorstore):
+        slug = shard_slug(metadata.get(field))
+        groups[slug].append(position)
+        values.setdefault(slug, metadata.get(field))
+    return {slug: (values[slug], np.array(positions, dtype=np.int64)) for slug, positions in groups.items()}
+
+
+def build_shard(vectors, positions):
+    # Global positions as ids: hits map straight to the docstore shared by every shard
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+    index.add_with_ids(vectors[positions], positions)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split the flat index into one FAISS index per brand or category")
+    parser.add_argument("--index-dir", default=CHUNK_LAYOUT["index_dir"], help="flat index, shards are written next to it")
+    parser.add_argument("--field", choices=["brand", "category"], default="brand")
+    parser.add_argument("--only", action="append", metavar="VALUE",
+                        help="rebuild only the shard of this brand / category (repeatable)")
+    args = parser.parse_args()
+
+    _, vectors = load_flat_vectors(args.index_dir)
+    vectorstore = load_vectorstore(args.index_dir, None, load_index_config(args.index_dir))
+    groups = group_positions(vectorstore, args.field)
+
+    config = load_shards_config(args.index_dir)
+    if args.only:
+        if config is None or config["field"] != args.field:
+            raise SystemExit(f"No {args.field} shards in {args.index_dir} yet, build them all first")
+        wanted = {shard_slug(value) for value in args.only}
+        unknown = wanted - set(groups)
+        if unknown:
+            raise SystemExit(f"No documents with {args.field} {', '.join(sorted(unknown))}")
+    else:
+        config = {"field": args.field, "shards": {}}
+        wanted = set(groups)
+
+    started = time.perf_counter()
+    for slug in sorted(wanted):
+        value, positions = groups[slug]
+        write_index_atomic(build_shard(vectors, positions), os.path.join(args.index_dir, shard_file(slug)))
+        config["shards"][slug] = {
+            "value": value,
+            "documents": len(positions),
+            "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        print(f"  {slug:<40} {len(positions):>6} documents")
+
+    # Shards of values no longer in the index
+    for slug in set(config["shards"]) - set(groups):
+        del config["shards"][slug]
+        if os.path.exists(os.path.join(args.index_dir, shard_file(slug))):
+            os.remove(os.path.join(args.index_dir, shard_file(slug)))
+
+    # Written last and atomically, the app reloads when it changes
+    config_path = os.path.join(args.index_dir, SHARDS_FILE)
+    with open(f"{config_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    os.replace(f"{config_path}.tmp", config_path)
+
+    print(f"Built {len(wanted)} of {len(config['shards'])} {args.field} shards in {time.perf_counter() - started:.2f}s")
+    print(f"Saved to {args.index_dir}/ (RAG_SHARD_SEARCH=0 searches the single index instead)")
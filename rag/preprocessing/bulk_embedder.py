@@ -0,0 +1,148 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import openai
+from openai import AzureOpenAI
+
+# Texts per embeddings request (Azure accepts up to 2048 inputs per request)
+BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "256"))
+# Upper bound of concurrent requests, the actual number adapts to rate limiting
+MAX_CONCURRENCY = int(os.getenv("RAG_EMBED_CONCURRENCY", "8"))
+MAX_RETRIES = int(os.getenv("RAG_EMBED_MAX_RETRIES", "8"))
+# Seconds between two checkpoints of the embedding store
+CHECKPOINT_INTERVAL = float(os.getenv("RAG_EMBED_CHECKPOINT_INTERVAL", "30"))
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit that grows by one per round of successful requests and halves on a rate-limit
+    response (additive increase, multiplicative decrease), between 1 and maximum.
+    """
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.active = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.active >= int(self.limit):
+                self._condition.wait()
+            self.active += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self.active -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+def retry_after(error, attempt):
+    """Seconds to wait before retrying: the server's retry-after if it sent one, else jittered exponential backoff"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+class BulkEmbedder:
+    """Embeds many texts in large batches on a thread pool, backing off and lowering concurrency when throttled"""
+
+    def __init__(self, deployment, client=None, batch_size=BATCH_SIZE, max_concurrency=MAX_CONCURRENCY,
+                 max_retries=MAX_RETRIES):
+        # Retries are handled here, so a throttled request also lowers the concurrency
+        self.client = client or AzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            max_retries=0,
+        )
+        self.deployment = deployment
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+        self.requests = 0
+        self.throttled = 0
+        self.retried = 0
+
+    def _embed_batch(self, texts, limit):
+        for attempt in range(self.max_retries + 1):
+            limit.acquire()
+            try:
+                response = self.client.embeddings.create(input=texts, model=self.deployment)
+            except openai.RateLimitError as e:
+                limit.release(throttled=True)
+                self.throttled += 1
+                error = e
+            except (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError) as e:
+                limit.release()
+                error = e
+            else:
+                limit.release()
+                self.requests += 1
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+            if attempt == self.max_retries:
+                raise error
+            self.retried += 1
+            delay = retry_after(error, attempt)
+            print(f"[WARNING] Embedding batch failed ({type(error).__name__}), retrying in {delay:.1f}s "
+                  f"(concurrency now {int(limit.limit)})")
+            time.sleep(delay)
+
+    def embed(self, texts, on_batch=None, checkpoint=None, checkpoint_interval=CHECKPOINT_INTERVAL):
+        """
+        Embeddings of texts, in order. on_batch(start, vectors) is called from this thread as each batch
+        completes, checkpoint() every checkpoint_interval seconds, so an interrupted run can resume.
+        """
+        batches = [(start, texts[start:start + self.batch_size]) for start in range(0, len(texts), self.batch_size)]
+        vectors = [None] * len(texts)
+        limit = AdaptiveLimit(self.max_concurrency)
+
+        started = last_checkpoint = time.perf_counter()
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="rag-embed") as executor:
+            pending = {executor.submit(self._embed_batch, batch, limit): (start, batch) for start, batch in batches}
+            try:
+                while pending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        start, batch = pending.pop(future)
+                        batch_vectors = future.result()
+                        vectors[start:start + len(batch)] = batch_vectors
+                        if on_batch is not None:
+                            on_batch(start, batch_vectors)
+                        done += len(batch)
+
+                    elapsed = time.perf_counter() - started
+                    if checkpoint is not None and time.perf_counter() - last_checkpoint >= checkpoint_interval:
+                        checkpoint()
+                        last_checkpoint = time.perf_counter()
+                        print(f"[DEBUG] Embedded {done}/{len(texts)} texts, {done / elapsed:.1f} texts/s, "
+                              f"concurrency {int(limit.limit)}")
+            except BaseException:
+                # Keep what was embedded so far, the next run resumes from it
+                for future in pending:
+                    future.cancel()
+                if checkpoint is not None:
+                    checkpoint()
+                raise
+
+        elapsed = time.perf_counter() - started
+        if texts:
+            print(f"[TIMING] Embedded {len(texts)} texts in {elapsed:.1f}s ({len(texts) / elapsed:.1f} texts/s, "
+                  f"{self.requests} requests, {self.throttled} throttled, {self.retried} retries)")
+        return vectors
@@ -0,0 +1,31 @@
+import argparse
+import os
+import pickle
+import time
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUT
+from rag.langchain.sqlite_docstore import DOCSTORE_FILE, write_docstore
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the pickled LangChain docstore (index.pkl) to docstore.sqlite3")
+    parser.add_argument("--index-dir", default=os.getenv("RAG_INDEX_DIR", CHUNK_LAYOUT["index_dir"]))
+    parser.add_argument("--remove-pickle", action="store_true", help="delete index.pkl once converted")
+    args = parser.parse_args()
+
+    pickle_path = os.path.join(args.index_dir, "index.pkl")
+    sqlite_path = os.path.join(args.index_dir, DOCSTORE_FILE)
+
+    started = time.perf_counter()
+    with open(pickle_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    unpickle_seconds = time.perf_counter() - started
+
+    count = write_docstore(sqlite_path, docstore, index_to_docstore_id)
+    print(f"Converted {count} documents from {pickle_path} (unpickled in {unpickle_seconds:.2f}s)")
+    print(f"index.pkl: {os.path.getsize(pickle_path) / 2 ** 20:.2f} MB, "
+          f"{DOCSTORE_FILE}: {os.path.getsize(sqlite_path) / 2 ** 20:.2f} MB")
+
+    if args.remove_pickle:
+        os.remove(pickle_path)
+        print(f"Removed {pickle_path}")
+    print(f"Saved to {sqlite_path}")
@@ -0,0 +1,36 @@
+import argparse
+import json
+import os
+import time
+
+from rag.langchain.record_store import store_path, write_catalog_store, write_chunk_store
+
+# JSON record files and the writer of their SQLite copy
+CHUNK_FILES = ("rag/chunks.json", "rag/product_chunks.json", "rag/metadata.json")
+CATALOG_FILES = ("rag/brand_products.json",)
+
+
+def convert(json_path, writer):
+    started = time.perf_counter()
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    load_seconds = time.perf_counter() - started
+
+    sqlite_path = store_path(json_path)
+    written = writer(sqlite_path, records, source=json_path)
+    print(f"Converted {json_path} -> {sqlite_path}: {written} records (JSON loaded in {load_seconds * 1000:.0f} ms), "
+          f"{os.path.getsize(json_path) / 2 ** 20:.2f} MB -> {os.path.getsize(sqlite_path) / 2 ** 20:.2f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the SQLite copies of the chunk, metadata and catalog JSON files")
+    parser.add_argument("--chunks", nargs="*", default=list(CHUNK_FILES), help="chunks.json / metadata.json files")
+    parser.add_argument("--catalog", nargs="*", default=list(CATALOG_FILES), help="brand_products.json files")
+    args = parser.parse_args()
+
+    for paths, writer in ((args.chunks, write_chunk_store), (args.catalog, write_catalog_store)):
+        for path in paths:
+            if not os.path.exists(path):
+                print(f"[WARNING] {path} not found, skipped")
+                continue
+            convert(path, writer)
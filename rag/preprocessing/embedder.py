@@ -1,35 +1,137 @@
+import argparse
 import json
+import math
 import os
+import shutil
+import time
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 from langchain_openai import AzureOpenAIEmbeddings
 from langchain.vectorstores import FAISS
 
+from rag.langchain.chunk_layouts import CHUNK_LAYOUTS
+from rag.langchain.index_config import INDEX_CONFIG_FILE
+from rag.langchain.sqlite_docstore import DOCSTORE_FILE, write_docstore
+from rag.preprocessing.bulk_embedder import BATCH_SIZE, MAX_CONCURRENCY, BulkEmbedder
+from rag.preprocessing.embedding_store import STORE_DIR, EmbeddingStore, content_hash
+
 # ========== Configure Azure OpenAI ==========
 load_dotenv()
-embedding_model = AzureOpenAIEmbeddings(
-    deployment=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
-    openai_api_type="azure",
-    chunk_size=16
-)
-
-# ========== Load chunk data ==========
-with open("rag/chunks.json", "r", encoding="utf-8") as f:
-    raw_chunks = json.load(f)
-
-texts = []
-metadatas = []
-for i, chunk in enumerate(raw_chunks):
-    chunk_id = f"chunk_{i}"
-    chunk["chunk_id"] = chunk_id
-    texts.append(chunk["content"])
-    metadatas.append(chunk["metadata"])
-
-# ========== Generate and Save LangChain FAISS ==========
-print("Embedding and building FAISS index...")
-
-faiss_index = FAISS.from_texts(texts=texts, embedding=embedding_model, metadatas=metadatas)
-faiss_index.save_local("rag/faiss_index")
-
-print(f"Embedded {len(texts)} chunks.")
-print("Saved to rag/faiss_index/")
+
+
+def load_chunks(chunks_path):
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        raw_chunks = json.load(f)
+
+    texts = []
+    metadatas = []
+    for i, chunk in enumerate(raw_chunks):
+        chunk_id = f"chunk_{i}"
+        chunk["chunk_id"] = chunk_id
+        texts.append(chunk["content"])
+        metadatas.append(chunk["metadata"])
+    return texts, metadatas
+
+
+def replace_directory(build_dir, out_dir):
+    """Swap build_dir in for out_dir with two renames, the previous build is deleted once out of the way"""
+    old_dir = f"{out_dir.rstrip('/')}.old"
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(build_dir, out_dir)
+    if os.path.exists(old_dir):
+        # Workers still serving the previous build keep its open files
+        shutil.rmtree(old_dir)
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+               if os.path.isfile(os.path.join(path, name)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Embed a chunks file and save it as a LangChain FAISS index. The index directory is replaced "
+                    "as a whole; to switch a running app to the new index, publish it with "
+                    "rag.preprocessing.publish_snapshot instead of rebuilding the directory it serves"
+    )
+    parser.add_argument("--mode", choices=list(CHUNK_LAYOUTS), default="fine",
+                        help="chunk layout, sets the default --chunks and --out")
+    parser.add_argument("--chunks", help="chunks json (default: the layout's chunks file)")
+    parser.add_argument("--out", help="index directory (default: the layout's index directory)")
+    parser.add_argument("--store", help=f"embedding store directory (default: {STORE_DIR}/<mode>)")
+    parser.add_argument("--full", action="store_true", help="re-embed every chunk, ignoring stored vectors")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="texts per embeddings request")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY, help="maximum concurrent requests")
+    args = parser.parse_args()
+
+    layout = CHUNK_LAYOUTS[args.mode]
+    chunks_path = args.chunks or layout["chunks"]
+    out_dir = args.out or layout["index_dir"]
+
+    deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
+    embedding_model = AzureOpenAIEmbeddings(
+        deployment=deployment,
+        openai_api_type="azure",
+        chunk_size=16
+    )
+
+    # ========== Load chunk data ==========
+    texts, metadatas = load_chunks(chunks_path)
+
+    # ========== Embed new or changed chunks only ==========
+    started = time.perf_counter()
+    store = EmbeddingStore(args.store or os.path.join(STORE_DIR, args.mode))
+    keys = [content_hash(text, deployment) for text in texts]
+    missing = list(dict.fromkeys(keys)) if args.full else store.missing(keys)
+    text_by_key = dict(zip(keys, texts))
+    reused = len(text_by_key) - len(missing)
+
+    print(f"Embedding {len(missing)} new or changed texts ({reused} distinct texts reused from {store.path})...")
+    if missing:
+        # Each completed batch goes into the store, an interrupted run resumes from the last checkpoint
+        bulk = BulkEmbedder(deployment, batch_size=args.batch_size, max_concurrency=args.concurrency)
+        bulk.embed([text_by_key[key] for key in missing],
+                   on_batch=lambda start, vectors: store.add(missing[start:start + len(vectors)], vectors),
+                   checkpoint=store.checkpoint)
+    vectors = store.get(keys)
+    store.save(keys)
+    embed_seconds = time.perf_counter() - started
+
+    # ========== Build and Save LangChain FAISS from the stored vectors ==========
+    faiss_index = FAISS.from_embeddings(zip(texts, vectors.tolist()), embedding_model, metadatas=metadatas)
+    build_seconds = time.perf_counter() - started
+    # Built in a fresh directory that replaces out_dir as a whole: a worker never pairs the new index.faiss
+    # with the previous docstore. Shards and index_config.json of the previous build are dropped with it.
+    build_dir = f"{out_dir.rstrip('/')}.tmp"
+    if os.path.exists(build_dir):
+        shutil.rmtree(build_dir)
+    faiss_index.save_local(build_dir)
+    os.remove(os.path.join(build_dir, "index.pkl"))
+    # Documents go to SQLite instead of the pickle save_local writes, the app reads them on demand
+    write_docstore(os.path.join(build_dir, DOCSTORE_FILE), faiss_index.docstore, faiss_index.index_to_docstore_id)
+
+    # Kept next to the index for rag/benchmarks/compare_chunk_modes.py
+    build_info = {
+        "mode": args.mode,
+        "chunks": chunks_path,
+        "documents": len(texts),
+        "characters": sum(len(text) for text in texts),
+        "embedded": len(missing),
+        "reused": reused,
+        "embed_seconds": round(embed_seconds, 2),
+        "build_seconds": round(build_seconds, 2),
+        "index_bytes": dir_size(build_dir),
+        "embedding_deployment": os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+        "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(build_dir, "build_info.json"), "w", encoding="utf-8") as f:
+        json.dump(build_info, f, indent=2)
+    replace_directory(build_dir, out_dir)
+
+    print(f"Indexed {len(texts)} chunks ({len(missing)} embedded, "
+          f"{math.ceil(len(missing) / args.batch_size)} batches) in {build_seconds:.1f}s.")
+    print(f"Saved to {out_dir}/")
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Build cache of chunk embeddings, one store per chunk layout
+STORE_DIR = "rag/cache/chunk_embeddings"
+
+
+def content_hash(text, deployment):
+    # The deployment is part of the key, vectors of another embedding model are never reused
+    return hashlib.sha1(f"{deployment}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Chunk embeddings kept between embedder runs: vectors.npy (float32, one row per text, memory-mapped)
+    and keys.json (content hash -> row). Only texts whose hash is missing need to be embedded again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = {}
+        self.vectors = None
+        self._pending = {}
+
+        keys_path = os.path.join(path, "keys.json")
+        if os.path.exists(keys_path):
+            with open(keys_path, "r", encoding="utf-8") as f:
+                self.rows = json.load(f)["rows"]
+            self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.rows) + len(self._pending)
+
+    def missing(self, keys):
+        """Keys without a stored vector, each once, in first-seen order"""
+        return [key for key in dict.fromkeys(keys) if key not in self.rows and key not in self._pending]
+
+    def add(self, keys, vectors):
+        for key, vector in zip(keys, vectors):
+            self._pending[key] = np.asarray(vector, dtype=np.float32)
+
+    def get(self, keys):
+        """(len(keys), dimension) array of the stored vectors"""
+        return np.stack([
+            self._pending[key] if key in self._pending else self.vectors[self.rows[key]]
+            for key in keys
+        ])
+
+    def checkpoint(self):
+        """Persist what was added so far, keeping every stored vector"""
+        self.save(list(self.rows) + list(self._pending))
+
+    def save(self, keep):
+        """Write the vectors of the keys in keep (dropping texts no longer in the chunks) and swap the files in"""
+        keep = list(dict.fromkeys(keep))
+        vectors = self.get(keep) if keep else np.empty((0, 0), dtype=np.float32)
+
+        os.makedirs(self.path, exist_ok=True)
+        # Written aside then renamed, the current vectors.npy may still be mapped by self.vectors
+        with open(os.path.join(self.path, "vectors.npy.tmp"), "wb") as f:
+            np.save(f, vectors)
+        with open(os.path.join(self.path, "keys.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump({"dimension": int(vectors.shape[1]) if keep else 0,
+                       "rows": {key: row for row, key in enumerate(keep)}}, f)
+        os.replace(os.path.join(self.path, "vectors.npy.tmp"), os.path.join(self.path, "vectors.npy"))
+        os.replace(os.path.join(self.path, "keys.json.tmp"), os.path.join(self.path, "keys.json"))
+
+        self.rows = {key: row for row, key in enumerate(keep)}
+        self.vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="r")
+        self._pending = {}
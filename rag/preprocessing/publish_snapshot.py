@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+
+from rag.langchain.chunk_layouts import CHUNK_LAYOUTS, CHUNK_MODE
+from rag.langchain.index_config import INDEX_CONFIG_FILE
+from rag.langchain.record_store import fresh_store, store_path
+from rag.langchain.sharded_index import SHARDS_FILE, load_shards_config, shard_file
+from rag.langchain.snapshots import (
+    CATALOG_FILE,
+    CHUNKS_FILE,
+    SNAPSHOT_DIR,
+    create_snapshot,
+    current_snapshot,
+    list_snapshots,
+    prune_snapshots,
+    set_current,
+)
+from rag.langchain.sqlite_docstore import DOCSTORE_FILE
+
+# Copied when present next to index.faiss
+OPTIONAL_INDEX_FILES = (DOCSTORE_FILE, "index.pkl", INDEX_CONFIG_FILE, "build_info.json", SHARDS_FILE)
+
+
+def snapshot_files(index_dir, chunks_path, catalog_path):
+    files = {"index.faiss": os.path.join(index_dir, "index.faiss")}
+    for name in OPTIONAL_INDEX_FILES:
+        if os.path.exists(os.path.join(index_dir, name)):
+            files[name] = os.path.join(index_dir, name)
+    if DOCSTORE_FILE in files:
+        files.pop("index.pkl", None)
+    shards = load_shards_config(index_dir)
+    for slug in (shards or {}).get("shards", {}):
+        files[shard_file(slug)] = os.path.join(index_dir, shard_file(slug))
+    files[CHUNKS_FILE] = chunks_path
+    files[CATALOG_FILE] = catalog_path
+    # The catalog is read from its SQLite copy when it is up to date
+    catalog_store = fresh_store(catalog_path)
+    if catalog_store:
+        files[store_path(CATALOG_FILE)] = catalog_store
+    return files
+
+
+def ingest_graph(chunks_path, version):
+    from graph.connector import load_and_ingest_optimized
+    return load_and_ingest_optimized(chunks_path, snapshot=version)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish an index build as a new snapshot and switch the app to it")
+    parser.add_argument("--root", default=SNAPSHOT_DIR)
+    parser.add_argument("--mode", choices=list(CHUNK_LAYOUTS), default=CHUNK_MODE)
+    parser.add_argument("--index-dir", help="built index (default: the layout's index directory)")
+    parser.add_argument("--chunks", help="chunks used for product links (default: the layout's chunks file)")
+    parser.add_argument("--graph-chunks", default="rag/chunks.json", help="chunks ingested by --graph")
+    parser.add_argument("--catalog", default="rag/brand_products.json")
+    parser.add_argument("--graph", action="store_true", help="also ingest the chunks into Neo4j, tagged with the version")
+    parser.add_argument("--keep", type=int, default=3, help="snapshots kept on disk")
+    parser.add_argument("--rollback", metavar="VERSION", help="switch back to a published snapshot and exit")
+    parser.add_argument("--list", action="store_true", help="list published snapshots and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        current = current_snapshot(args.root)
+        for name in list_snapshots(args.root):
+            print(f"{'*' if current and os.path.basename(current) == name else ' '} {name}")
+        raise SystemExit(0)
+
+    if args.rollback:
+        set_current(args.root, args.rollback)
+        print(f"Serving {args.rollback}, workers switch on their next reload check")
+        raise SystemExit(0)
+
+    index_dir = args.index_dir or CHUNK_LAYOUTS[args.mode]["index_dir"]
+    chunks_path = args.chunks or CHUNK_LAYOUTS[args.mode]["chunks"]
+    os.makedirs(args.root, exist_ok=True)
+
+    manifest = {"mode": args.mode, "source_index_dir": index_dir, "graph": args.graph}
+    build_info_path = os.path.join(index_dir, "build_info.json")
+    if os.path.exists(build_info_path):
+        with open(build_info_path, "r", encoding="utf-8") as f:
+            manifest["documents"] = json.load(f).get("documents")
+
+    version = create_snapshot(args.root, snapshot_files(index_dir, chunks_path, args.catalog), manifest)
+    print(f"Created snapshot {version}")
+
+    if args.graph:
+        # One transaction: the live graph keeps the previous version until it commits
+        ingest_graph(args.graph_chunks, version)
+
+    set_current(args.root, version)
+    print(f"Serving {version}, workers switch on their next reload check")
+
+    for name in prune_snapshots(args.root, args.keep):
+        print(f"Removed old snapshot {name}")
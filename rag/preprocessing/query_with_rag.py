@@ -5,6 +5,9 @@ import openai
 import os
 from dotenv import load_dotenv
 
+from rag.langchain.record_store import ChunkStore, fresh_store
+from rag.langchain.reranker import RERANK_ENABLED, rerank_order
+
 # ========== Configure OpenAI ==========
 load_dotenv()
 openai.api_type = "azure"
@@ -15,40 +18,71 @@ DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
 LLM_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
 
 # ========== Load FAISS index and metadata ==========
-index = faiss.read_index("rag/faiss_index.index")
-
-with open("rag/metadata.json", "r", encoding="utf-8") as f:
-    metadata = json.load(f)
-
-# ========== Core Function ==========
-def query_with_rag(question, chatbot_name, top_k=60, distance_threshold=1.5):
-    # Step 1: Embed the query
+# With RAG_RETRIEVAL_SERVICE=1 the search runs in rag/retrieval_service.py and nothing is loaded here
+RETRIEVAL_SERVICE = os.getenv("RAG_RETRIEVAL_SERVICE", "0") == "1"
+if RETRIEVAL_SERVICE:
+    from rag.langchain.retrieval_client import RetrievalClient
+    retrieval_client = RetrievalClient()
+else:
+    index = faiss.read_index("rag/faiss_index.index")
+
+    # The SQLite copy is read a hit at a time, the JSON file is loaded whole when there is none
+    metadata_store = fresh_store("rag/metadata.json")
+    if metadata_store:
+        metadata = ChunkStore(metadata_store)
+    else:
+        with open("rag/metadata.json", "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+
+
+def search_service(question, top_k):
+    """(distance, metadata entry) pairs from the retrieval service, shaped like the rows of metadata.json"""
+    docs = retrieval_client.retrieve(question, k=top_k, filters={})
+    # Hybrid results carry the FAISS distance as "distance", lexical-only matches have none and are kept
+    return [(doc.metadata.pop("score", doc.metadata.get("distance", 0.0)), {"content": doc.page_content, "metadata": doc.metadata})
+            for doc in docs]
+
+
+def search_local(question, top_k):
     response = openai.Embedding.create(
         deployment_id=DEPLOYMENT,
         input=[question]
     )
     query_vec = np.array(response["data"][0]["embedding"]).astype("float32")
-
-    # Step 2: FAISS similarity search
     D, I = index.search(np.array([query_vec]), top_k)
+    count = len(metadata)
+    hits = [(dist, i) for dist, i in zip(D[0], I[0]) if 0 <= i < count]
+    if isinstance(metadata, ChunkStore):
+        return list(zip([dist for dist, _ in hits], metadata.records_at([i for _, i in hits])))
+    return [(dist, metadata[i]) for dist, i in hits]
+
+# ========== Core Function ==========
+def query_with_rag(question, chatbot_name, top_k=60, distance_threshold=1.5):
+    # Step 1-2: Embed the query and run the FAISS similarity search
+    hits = search_service(question, top_k) if RETRIEVAL_SERVICE else search_local(question, top_k)
+
+    # Step 3: Filter by distance threshold, keep the chunks the local reranker scores best and collect context
+    hits = [(dist, meta) for dist, meta in hits if dist < distance_threshold]
+    if RERANK_ENABLED:
+        order, _ = rerank_order(question, [meta.get("content", "") for _, meta in hits],
+                                [meta.get("metadata", {}) for _, meta in hits])
+        print(f"[DEBUG] Reranker kept {len(order)} of {len(hits)} chunks")
+        hits = [hits[i] for i in order]
 
-    # Step 3: Filter by distance threshold and collect context
     contexts = []
     sources = []
-    for dist, i in zip(D[0], I[0]):
-        if i < len(metadata) and dist < distance_threshold:
-            meta = metadata[i]
-            context_text = meta.get("content", "")
-            contexts.append(context_text)
-
-            sources.append({
-                "brand": meta.get("metadata", {}).get("brand"),
-                "product_name": meta.get("metadata", {}).get("product_name", ""),
-                "brand_url": meta.get("metadata", {}).get("brand_url", ""),
-                # "field": meta.get("metadata", {}).get("field"),
-                "url": meta.get("metadata", {}).get("product_url", ""),
-                # "distance": round(float(dist), 4)
-            })
+    for dist, meta in hits:
+        context_text = meta.get("content", "")
+        contexts.append(context_text)
+
+        sources.append({
+            "brand": meta.get("metadata", {}).get("brand"),
+            "product_name": meta.get("metadata", {}).get("product_name", ""),
+            "brand_url": meta.get("metadata", {}).get("brand_url", ""),
+            # "field": meta.get("metadata", {}).get("field"),
+            "url": meta.get("metadata", {}).get("product_url", ""),
+            # "distance": round(float(dist), 4)
+        })
 
     full_context = "\n---\n".join(contexts)
 
@@ -8,6 +8,8 @@ from dataclasses import dataclass
 import requests
 from typing import List, Dict
 
+from rag.langchain.record_store import store_path, write_catalog_store
+
 # Configuration
 BASE_URL = "https://www.madewithnestle.ca"
 MAX_DEPTH = 2
@@ -391,6 +393,9 @@ def save_results(data):
     with open(os.path.join("rag/brand_products.json"), "w", encoding="utf-8") as f:
         json.dump(output, f, indent=2, ensure_ascii=False)
 
+    # Indexed copy the product catalog is read from
+    write_catalog_store(store_path("rag/brand_products.json"), output, source="rag/brand_products.json")
+
 
 if __name__ == "__main__":
     scrape_site(BASE_URL)
\ No newline at end of file
@@ -1,7 +1,11 @@
+import argparse
 import json
 import re
 from pathlib import Path
 
+from rag.langchain.chunk_layouts import CHUNK_LAYOUTS
+from rag.langchain.record_store import store_path, write_chunk_store
+
 def ingredients_helper(text):
     # Preprocessing: Remove unwanted characters and patterns
     text = re.sub(r'\*.*?(?=\s|$)', '', text)  # Remove asterisk and its content
@@ -33,162 +37,252 @@ def ingredients_helper(text):
 
 
 # === Split data into chunks ===
-with open("rag/brand_products.json", "r", encoding="utf-8") as f:
-    raw_data = json.load(f)
-
-chunks = []
-
-for brand_block in raw_data:
+def brand_chunk(brand_block):
     brand = brand_block.get("brand")
     category = brand_block.get("category")
-    category_description = brand_block.get("category_description")
-    products = brand_block.get("products", [])
     brand_url = brand_block.get("url", "")
+    return {
+        "metadata": {
+            "brand": brand,
+            "brand_url": brand_url,
+            "category": category,
+            "chunk_type": "Brand metadata",
+        },
+        "content": f"\"{brand}\" is a brand from Nestle company, it belongs to \"{category}\" category. The URL (link) of this brand is: {brand_url}",
+    }
+
+
+def fine_chunks(raw_data):
+    """One chunk per fact: product metadata, description, every nutrient, feature and ingredient"""
+    chunks = []
+
+    for brand_block in raw_data:
+        brand = brand_block.get("brand")
+        category = brand_block.get("category")
+        category_description = brand_block.get("category_description")
+        products = brand_block.get("products", [])
+        brand_url = brand_block.get("url", "")
+
+        # --- Chunk 0: Brand metadata ---
+        chunks.append(brand_chunk(brand_block))
+
+        for product in products:
+            name = product.get("name")
+            specification = product.get("specification")
+            status = product.get("status", "Regular")
+            product_url = product.get("product_url", "")
+
+            # --- Chunk 1: product_metadata ---
+            meta_content = f"\"{name}\" is a product belongs to \"{brand}\" brand. The url (link) of this product is: {product_url}."
+            if status:
+                meta_content += f" It is the {status} product."
 
-    # --- Chunk 0: Brand metadata ---
-    chunks.append({
-            "metadata": {
-                "brand": brand,
-                "brand_url": brand_url,
-                "category": category,
-                "chunk_type": "Brand metadata",
-            },
-            "content": f"\"{brand}\" is a brand from Nestle company, it belongs to \"{category}\" category. The URL (link) of this brand is: {brand_url}",
-        })
-
-    for product in products:
-        name = product.get("name")
-        specification = product.get("specification")
-        status = product.get("status", "Regular")
-        product_url = product.get("product_url", "")
-
-        # --- Chunk 1: product_metadata ---
-        meta_content = f"\"{name}\" is a product belongs to \"{brand}\" brand. The url (link) of this product is: {product_url}."
-        if status:
-            meta_content += f" It is the {status} product."
-
-        chunks.append({
-            "metadata": {
-                "brand": brand,
-                "product_name": name,
-                "brand_url": brand_url,
-                "product_url": product_url,
-                "category": category,
-                "chunk_type": "product_metadata",
-                **({"status": status} if status else {})
-            },
-            "content": meta_content
-        })
-
-        # --- Chunk 2: core_desc ---
-        description = product.get("description", "")
-        if description:
-            desc_short = description.split(".")[0].strip()  # First sentence
             chunks.append({
                 "metadata": {
                     "brand": brand,
+                    "product_name": name,
                     "brand_url": brand_url,
                     "product_url": product_url,
-                    "product_name": name,
-                    "chunk_type": "core_desc",
-                    "specification": specification
+                    "category": category,
+                    "chunk_type": "product_metadata",
+                    **({"status": status} if status else {})
                 },
-                "content": f"{name} ({specification}): {desc_short}."
+                "content": meta_content
             })
 
-        # --- Chunk 3: nutrition (one per nutrient) ---
-        nutrition_list = product.get("nutrition", [])
-        for item in nutrition_list:
-            field = item.get("type", "").strip().lower()
-            amount = item.get("amount", "").strip()
-            dv = item.get("dv", "").strip()
-
-            nu_content = f"{name} from {brand} has {amount} {field} and dv is {dv}."
-            if not dv:
-                nu_content = f"{name} from {brand} has {amount} {field} and dv is not provided."
-
-            if field and amount:
+            # --- Chunk 2: core_desc ---
+            description = product.get("description", "")
+            if description:
+                desc_short = description.split(".")[0].strip()  # First sentence
                 chunks.append({
                     "metadata": {
                         "brand": brand,
-                        "product_name": name,
                         "brand_url": brand_url,
                         "product_url": product_url,
-                        "chunk_type": "nutrition",
-                        "field": field,
-                        "amount": amount,
-                        "dv": dv
-                    },
-                    "content": nu_content
-                })
-
-        # --- Chunk 4: features ---
-        features = product.get("features", "")
-        feature_lines = features.strip().split("\n")
-        for line in feature_lines:
-            if line.strip():
-                field = line.split(":")[0].strip() if ":" in line else line.strip()
-                chunks.append({
-                    "metadata": {
-                        "brand": brand,
                         "product_name": name,
-                        "brand_url": brand_url,
-                        "product_url": product_url,
-                        "chunk_type": "features",
-                        "field": field
+                        "chunk_type": "core_desc",
+                        "specification": specification
                     },
-                    "content": f"{name} has the feature: {field}"
+                    "content": f"{name} ({specification}): {desc_short}."
                 })
 
-        # --- Chunk 5: ingredients ---
-        ingredients = product.get("ingredient", "")
-        if ingredients:
-            ingredient_lines = ingredients_helper(ingredients)
-            for line in ingredient_lines:
+            # --- Chunk 3: nutrition (one per nutrient) ---
+            nutrition_list = product.get("nutrition", [])
+            for item in nutrition_list:
+                field = item.get("type", "").strip().lower()
+                amount = item.get("amount", "").strip()
+                dv = item.get("dv", "").strip()
+
+                nu_content = f"{name} from {brand} has {amount} {field} and dv is {dv}."
+                if not dv:
+                    nu_content = f"{name} from {brand} has {amount} {field} and dv is not provided."
+
+                if field and amount:
+                    chunks.append({
+                        "metadata": {
+                            "brand": brand,
+                            "product_name": name,
+                            "brand_url": brand_url,
+                            "product_url": product_url,
+                            "chunk_type": "nutrition",
+                            "field": field,
+                            "amount": amount,
+                            "dv": dv
+                        },
+                        "content": nu_content
+                    })
+
+            # --- Chunk 4: features ---
+            features = product.get("features", "")
+            feature_lines = features.strip().split("\n")
+            for line in feature_lines:
                 if line.strip():
-                    field = line.strip()
+                    field = line.split(":")[0].strip() if ":" in line else line.strip()
                     chunks.append({
                         "metadata": {
                             "brand": brand,
                             "product_name": name,
                             "brand_url": brand_url,
                             "product_url": product_url,
-                            "chunk_type": "ingredients",
+                            "chunk_type": "features",
                             "field": field
                         },
-                        "content": f"{name} has the ingredients: {field}"
+                        "content": f"{name} has the feature: {field}"
                     })
-        else:
+
+            # --- Chunk 5: ingredients ---
+            ingredients = product.get("ingredient", "")
+            if ingredients:
+                ingredient_lines = ingredients_helper(ingredients)
+                for line in ingredient_lines:
+                    if line.strip():
+                        field = line.strip()
+                        chunks.append({
+                            "metadata": {
+                                "brand": brand,
+                                "product_name": name,
+                                "brand_url": brand_url,
+                                "product_url": product_url,
+                                "chunk_type": "ingredients",
+                                "field": field
+                            },
+                            "content": f"{name} has the ingredients: {field}"
+                        })
+            else:
+                chunks.append({
+                    "metadata": {
+                        "brand": brand,
+                        "product_name": name,
+                        "brand_url": brand_url,
+                        "product_url": product_url,
+                        "chunk_type": "ingredients",
+                        "field": "Not provided"
+                    },
+                    "content": f"The ingredients of {name} are not provided."
+                })
+
+            # --- Chunk 6: category ---
             chunks.append({
                 "metadata": {
                     "brand": brand,
                     "product_name": name,
                     "brand_url": brand_url,
                     "product_url": product_url,
-                    "chunk_type": "ingredients",
-                    "field": "Not provided"
+                    "chunk_type": "category",
+                    "field": category
                 },
-                "content": f"The ingredients of {name} are not provided."
+                "content": f"{name} belongs to the {category} category."
             })
 
-        # --- Chunk 6: category ---
-        chunks.append({
-            "metadata": {
+    return chunks
+
+
+def product_chunks(raw_data):
+    """
+    Compact layout: per product one overview (status, category, description, features), one nutrition
+    table and one ingredient list, plus the brand documents. About 3 documents per product instead of ~40.
+    """
+    chunks = [brand_chunk(brand_block) for brand_block in raw_data]
+
+    for brand_block in raw_data:
+        brand = brand_block.get("brand")
+        category = brand_block.get("category")
+        brand_url = brand_block.get("url", "")
+
+        for product in brand_block.get("products", []):
+            name = product.get("name")
+            specification = product.get("specification")
+            status = product.get("status", "Regular")
+            product_url = product.get("product_url", "")
+            metadata = {
                 "brand": brand,
                 "product_name": name,
                 "brand_url": brand_url,
                 "product_url": product_url,
-                "chunk_type": "category",
-                "field": category
-            },
-            "content": f"{name} belongs to the {category} category."
-        })
+                "category": category,
+                "specification": specification,
+                **({"status": status} if status else {})
+            }
+
+            # --- Overview ---
+            overview = f"\"{name}\" ({specification}) is a product belongs to \"{brand}\" brand in the {category} category. The url (link) of this product is: {product_url}."
+            if status:
+                overview += f" It is the {status} product."
+            description = product.get("description", "").strip()
+            if description:
+                overview += f"\n{description}"
+            features = [line.strip() for line in product.get("features", "").split("\n") if line.strip()]
+            if features:
+                overview += "\nFeatures:\n" + "\n".join(f"- {line}" for line in features)
+            chunks.append({"metadata": {**metadata, "chunk_type": "product_overview"}, "content": overview})
+
+            # --- Nutrition table ---
+            rows = []
+            for item in product.get("nutrition", []):
+                field = item.get("type", "").strip().lower()
+                amount = item.get("amount", "").strip()
+                dv = item.get("dv", "").strip()
+                if field and amount:
+                    rows.append(f"- {field}: {amount}" + (f" ({dv} dv)" if dv else ""))
+            if rows:
+                chunks.append({
+                    "metadata": {**metadata, "chunk_type": "nutrition_table"},
+                    "content": f"Nutrition facts of {name} from {brand} ({specification}):\n" + "\n".join(rows)
+                })
+
+            # --- Ingredient list ---
+            ingredients = product.get("ingredient", "")
+            fields = [line.strip() for line in ingredients_helper(ingredients) if line.strip()] if ingredients else []
+            content = f"The ingredients of {name} from {brand} are: {', '.join(fields)}." if fields else f"The ingredients of {name} are not provided."
+            chunks.append({"metadata": {**metadata, "chunk_type": "ingredients_list"}, "content": content})
+
+    return chunks
+
+
+CHUNKERS = {
+    "fine": fine_chunks,
+    "product": product_chunks,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split rag/brand_products.json into documents for the vector index")
+    parser.add_argument("--mode", choices=list(CHUNKERS), default="fine")
+    parser.add_argument("--input", default="rag/brand_products.json")
+    parser.add_argument("--output", help="defaults to the chunks file of the chosen layout")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        raw_data = json.load(f)
 
+    chunks = CHUNKERS[args.mode](raw_data)
 
+    # === Save as chunks.json ===
+    output_path = Path(args.output or CHUNK_LAYOUTS[args.mode]["chunks"])
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False, indent=2)
 
-# === Save as chunks.json ===
-output_path = Path("rag/chunks.json")
-with open(output_path, "w", encoding="utf-8") as f:
-    json.dump(chunks, f, ensure_ascii=False, indent=2)
+    # Indexed copy, read by position, product or brand
+    write_chunk_store(store_path(str(output_path)), chunks, source=str(output_path))
 
-print(f"Finished: {len(chunks)} chunks saved to rag/chunks.json")
+    print(f"Finished: {len(chunks)} chunks saved to {output_path} and {store_path(str(output_path))}")
@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from rag.langchain.question_router import (
+    ROUTES,
+    MODEL_PATH,
+    QuestionRouter,
+    hashed_features,
+    softmax,
+)
+
+LABELED_PATH = "rag/router/labeled_questions.json"
+
+
+def train_lexical(questions, labels, epochs=400, lr=0.5, l2=1e-3):
+    """Multinomial logistic regression over hashed n-gram features, plain batch gradient descent"""
+    x = np.stack([hashed_features(q) for q in questions])
+    y = np.zeros((len(labels), len(ROUTES)), dtype=np.float32)
+    y[np.arange(len(labels)), [ROUTES.index(label) for label in labels]] = 1.0
+
+    weights = np.zeros((len(ROUTES), x.shape[1]), dtype=np.float32)
+    bias = np.zeros(len(ROUTES), dtype=np.float32)
+
+    for _ in range(epochs):
+        probs = softmax(x @ weights.T + bias)
+        grad = probs - y
+        weights -= lr * (grad.T @ x / len(x) + l2 * weights)
+        bias -= lr * grad.mean(axis=0)
+
+    return weights, bias
+
+
+def compute_centroids(vectors, labels):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    centroids = np.stack([vectors[[label == route for label in labels]].mean(axis=0) for route in ROUTES])
+    return centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+
+def embed_questions(questions):
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    embedding = AzureOpenAIEmbeddings(
+        deployment=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+        openai_api_type="azure",
+        chunk_size=16
+    )
+    return embedding.embed_documents(questions)
+
+
+def build_router(questions, labels, vectors=None):
+    router = QuestionRouter(model_path=None)
+    router.weights, router.bias = train_lexical(questions, labels)
+    if vectors is not None:
+        router.centroids = compute_centroids(vectors, labels)
+    return router
+
+
+def evaluate(data, vectors=None, folds=5, seed=0):
+    """K-fold accuracy of the local router, plus how often it would defer to the LLM"""
+    order = np.random.default_rng(seed).permutation(len(data))
+    correct = confident = confident_correct = 0
+    durations = []
+
+    for fold in range(folds):
+        test_idx = order[fold::folds]
+        train_idx = np.setdiff1d(order, test_idx)
+
+        router = build_router(
+            [data[i]["question"] for i in train_idx],
+            [data[i]["label"] for i in train_idx],
+            [vectors[i] for i in train_idx] if vectors is not None else None
+        )
+
+        for i in test_idx:
+            embed = (lambda v=vectors[i]: v) if vectors is not None else None
+            started = time.perf_counter()
+            decision = router.classify(data[i]["question"], embed=embed)
+            durations.append(time.perf_counter() - started)
+
+            hit = decision["route"] == data[i]["label"]
+            correct += hit
+            if decision["confidence"] >= router.threshold:
+                confident += 1
+                confident_correct += hit
+
+    durations_ms = np.array(durations) * 1000
+    print(f"Questions:                   {len(data)} ({folds}-fold cross-validation)")
+    print(f"Local accuracy:              {correct / len(data):.3f}")
+    print(f"Decided locally (>= {router.threshold}):   {confident / len(data):.3f}")
+    print(f"Accuracy when local:         {confident_correct / max(confident, 1):.3f}")
+    print(f"Time per decision:           mean {durations_ms.mean():.3f} ms, p95 {np.percentile(durations_ms, 95):.3f} ms")
+
+
+def evaluate_llm(data):
+    """Baseline: accuracy and latency of the LLM classifier the router replaces"""
+    from rag.langchain.response_selector import question_classifier
+
+    correct = 0
+    durations = []
+    for item in data:
+        started = time.perf_counter()
+        correct += question_classifier(item["question"]) == item["label"]
+        durations.append(time.perf_counter() - started)
+
+    durations_ms = np.array(durations) * 1000
+    print(f"LLM accuracy:                {correct / len(data):.3f}")
+    print(f"LLM time per decision:       mean {durations_ms.mean():.1f} ms, p95 {np.percentile(durations_ms, 95):.1f} ms")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Train and evaluate the local question router")
+    parser.add_argument("--data", default=LABELED_PATH)
+    parser.add_argument("--output", default=MODEL_PATH)
+    parser.add_argument("--with-embeddings", action="store_true",
+                        help="embed the labeled questions (Azure) to add the nearest-centroid signal")
+    parser.add_argument("--compare-llm", action="store_true", help="also measure the LLM classifier")
+    args = parser.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    questions = [item["question"] for item in data]
+    labels = [item["label"] for item in data]
+    vectors = embed_questions(questions) if args.with_embeddings else None
+
+    evaluate(data, vectors)
+    if args.compare_llm:
+        evaluate_llm(data)
+
+    router = build_router(questions, labels, vectors)
+    arrays = {"weights": router.weights, "bias": router.bias}
+    if router.centroids is not None:
+        arrays["centroids"] = router.centroids
+        arrays["centroid_temperature"] = np.float32(router.centroid_temperature)
+    np.savez(args.output, **arrays)
+    print(f"Saved router model to {args.output}")
@@ -1,11 +1,103 @@
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
+import asyncio
+import json
+import time
+
+from rag.langchain.rag_answer import (
+    query_with_langchain_rag,
+    aquery_with_langchain_rag,
+    stream_langchain_rag,
+    RETRIEVAL_K,
+)
+from rag.langchain.rag_engine import SPECULATIVE_RETRIEVAL, get_rag_engine
+from rag.langchain.graph_answer import grag_view, agrag_answer, stream_grag
+from geolocation.location_finder import location_query, alocation_query
+from rag.langchain.question_router import get_question_router
+from rag.langchain.semantic_cache import SEMANTIC_CACHE_ENABLED, get_semantic_cache, history_fingerprint
+
+# Store answers depend on the user's location, only these routes go through the semantic cache
+CACHEABLE_ROUTES = ("rag", "graphrag")
+
+
+def _route_question(question, name, chat_history):
+    """Routing, speculative retrieval and semantic cache lookup shared by the plain and streaming views"""
+    engine = get_rag_engine()
+
+    # Most questions end up on the RAG route: start its embedding + search while routing runs
+    speculative = engine.start_speculative_retrieval(question, k=RETRIEVAL_K) if SPECULATIVE_RETRIEVAL else None
+    embedded = []
+
+    def embed():
+        if not embedded:
+            embedded.append(speculative.embedding() if speculative else engine.embedding.embed_query(question))
+        return embedded[0]
+
+    # Local routing, the LLM classifier is only consulted when the router is not confident
+    decision = get_question_router().route(question, embed=embed)
+    routed_at = time.perf_counter()
+    option = decision["route"]
+    if speculative and option != "rag":
+        speculative.discard()
+
+    routing = {
+        "engine": engine,
+        "option": option,
+        "decision": decision,
+        "routed_at": routed_at,
+        "speculative": speculative,
+        "cache_context": None,
+        "cached": None,
+    }
+
+    # Near-duplicate of a question already answered in the same context: skip the LLM entirely. Only an
+    # embedding routing or retrieval already computed is used, a question retrieval answers on the lexical
+    # fast path is looked up by its exact wording rather than paying for an embedding call
+    if SEMANTIC_CACHE_ENABLED and option in CACHEABLE_ROUTES:
+        vector = embedded[0] if embedded else None
+        if vector is None and speculative:
+            # Discarded for another route, its vector is only taken if it is already there
+            vector = speculative.computed_embedding(wait=option == "rag")
+        if _semantic_lookup(routing, question, name, chat_history, vector) and speculative:
+            speculative.discard()
+
+    return routing
+
+
+def _semantic_lookup(routing, question, name, chat_history, vector):
+    routing["cache_context"] = {
+        "vector": vector,
+        "route": routing["option"],
+        "chatbot_name": name,
+        "history_fp": history_fingerprint(chat_history),
+        "version": routing["engine"].version,
+        "question": question,
+    }
+    cached = get_semantic_cache().lookup(**routing["cache_context"])
+    if cached:
+        payload, similarity = cached
+        print(f"[DEBUG] Semantic cache hit ({similarity:.3f}) for: {question}")
+        routing["cached"] = {**payload, "cache_similarity": round(similarity, 3)}
+    return routing["cached"] is not None
+
+
+def _rag_inputs(routing):
+    """Prefetched documents and timings for the RAG route"""
+    speculative = routing["speculative"]
+    source_docs, timings = None, {"route_ms": routing["decision"]["elapsed_ms"]}
+    if speculative:
+        source_docs = speculative.result()
+        timings.update(speculative.timings)
+        timings["speculative_saved_ms"] = speculative.overlap_saved_ms(routing["routed_at"])
+    return source_docs, timings
+
+
+def _cache_answer(routing, answer):
+    if routing["cache_context"]:
+        get_semantic_cache().store(payload={"answer": answer}, **routing["cache_context"])
 
-from rag.langchain.rag_answer import query_with_langchain_rag
-from rag.langchain.graph_answer import grag_view
-from geolocation.location_finder import location_query
-from rag.langchain.response_selector import question_classifier
 
 @api_view(["POST"])
 def rag_ask_view(request):
@@ -21,7 +113,11 @@ def rag_ask_view(request):
         return Response({"error": "Missing question"}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        option = question_classifier(question)
+        routing = _route_question(question, name, chat_history)
+        option = routing["option"]
+        if routing["cached"]:
+            return Response(routing["cached"])
+
         # Find store locator and provide Amazon link
         if option == "store":
             answer = location_query(question, float(lon), float(lat), chat_history)
@@ -29,11 +125,187 @@ def rag_ask_view(request):
         # If the question is about nutrition facts or how many/much of a specific nutrition (GraphRAG)
         elif option == "graphrag":
             answer = grag_view(question, chat_history)
+            if answer.status_code == 200 and "answer" in answer.data:
+                _cache_answer(routing, answer.data["answer"])
             return answer
         # If the question is about a specific product or brand (LangChain RAG)
         else:
-            answer = query_with_langchain_rag(question, chatbot_name=name, chat_history=chat_history)
+            source_docs, timings = _rag_inputs(routing)
+            answer = query_with_langchain_rag(question, chatbot_name=name, chat_history=chat_history,
+                                              engine=routing["engine"], source_docs=source_docs, timings=timings)
+            _cache_answer(routing, answer["answer"])
             return Response(answer)
     except Exception as e:
         print("[ERROR]", e)
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# === Server-Sent Events variants ===
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _event_stream(events):
+    try:
+        for event, data in events:
+            yield _sse(event, data)
+    except Exception as e:
+        print("[ERROR]", e)
+        yield _sse("error", {"error": str(e)})
+
+
+def _sse_response(events):
+    response = StreamingHttpResponse(_event_stream(events), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop reverse proxies (nginx, Azure front ends) from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _cached_on_done(events, routing):
+    """Pass events through and store the final answer in the semantic cache"""
+    for event, data in events:
+        if event == "done" and "answer" in data:
+            _cache_answer(routing, data["answer"])
+        yield event, data
+
+
+def _rag_stream_events(question, name, lat, lon, chat_history):
+    routing = _route_question(question, name, chat_history)
+    option = routing["option"]
+    yield "route", {"route": option}
+
+    if routing["cached"]:
+        yield "done", routing["cached"]
+    elif option == "store":
+        # Store answers are short and built from a single completion, send them in one piece
+        answer = location_query(question, float(lon), float(lat), chat_history)
+        yield "done", answer.data
+    elif option == "graphrag":
+        yield from _cached_on_done(stream_grag(question, chat_history), routing)
+    else:
+        source_docs, timings = _rag_inputs(routing)
+        yield from _cached_on_done(
+            stream_langchain_rag(question, chatbot_name=name, chat_history=chat_history,
+                                 engine=routing["engine"], source_docs=source_docs, timings=timings),
+            routing
+        )
+
+
+@api_view(["POST"])
+def rag_stream_view(request):
+    """Same as rag_ask_view, but the answer is streamed as SSE "token" events and a final "done" patch"""
+    question = (request.data.get("question") or "").lower()
+    name = request.data.get("name")
+    lat = request.data.get('latitude')
+    lon = request.data.get('longitude')
+    chat_history = request.data.get("chat_history", [])
+
+    if not question:
+        return Response({"error": "Missing question"}, status=status.HTTP_400_BAD_REQUEST)
+
+    return _sse_response(_rag_stream_events(question, name, lat, lon, chat_history))
+
+
+@api_view(["POST"])
+def grag_stream_view(request):
+    """GraphRAG answer streamed as SSE events"""
+    question = (request.data.get("question") or "").lower()
+    chat_history = request.data.get("chat_history", [])
+
+    if not question:
+        return Response({"error": "Missing question"}, status=status.HTTP_400_BAD_REQUEST)
+
+    return _sse_response(stream_grag(question, chat_history))
+
+
+# === Async (ASGI) variants ===
+# Plain Django coroutine views: under an ASGI server one worker keeps many conversations in flight
+# while the LLM, embedding and Neo4j calls are awaited. Django 4.2's csrf_exempt wraps views in a
+# sync function, so the flag is set on the coroutine views directly, like DRF does for @api_view.
+def _json_body(request):
+    return json.loads(request.body or b"{}")
+
+
+async def _aroute_question(question, name, chat_history):
+    # A reload rebuilds the engine from disk, keep that off the event loop
+    engine = await asyncio.to_thread(get_rag_engine)
+
+    # Start the embedding while routing runs: it feeds the router centroids, the semantic cache and retrieval
+    embedding = asyncio.ensure_future(engine.embedding.aembed_query(question)) if SPECULATIVE_RETRIEVAL else None
+
+    async def aembed():
+        nonlocal embedding
+        if embedding is None:
+            embedding = asyncio.ensure_future(engine.embedding.aembed_query(question))
+        return await embedding
+
+    decision = await get_question_router().aroute(question, aembed=aembed)
+    routing = {
+        "engine": engine,
+        "option": decision["route"],
+        "decision": decision,
+        "cache_context": None,
+        "cached": None,
+    }
+
+    if SEMANTIC_CACHE_ENABLED and routing["option"] in CACHEABLE_ROUTES:
+        # The embedding started for routing and retrieval if there is one, else only the exact wording is looked up
+        vector = await embedding if embedding is not None else None
+        await asyncio.to_thread(_semantic_lookup, routing, question, name, chat_history, vector)
+    if embedding and routing["option"] != "rag":
+        embedding.cancel()
+
+    return routing
+
+
+async def rag_ask_async_view(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    data = _json_body(request)
+    question = (data.get("question") or "").lower()
+    name = data.get("name")
+    lat = data.get('latitude')
+    lon = data.get('longitude')
+    chat_history = data.get("chat_history", [])
+
+    if not question:
+        return JsonResponse({"error": "Missing question"}, status=400)
+
+    try:
+        routing = await _aroute_question(question, name, chat_history)
+        option = routing["option"]
+        if routing["cached"]:
+            return JsonResponse(routing["cached"])
+
+        if option == "store":
+            return JsonResponse(await alocation_query(question, float(lon), float(lat), chat_history))
+        elif option == "graphrag":
+            payload, status_code = await agrag_answer(question, chat_history)
+            if status_code == 200 and "answer" in payload:
+                await asyncio.to_thread(_cache_answer, routing, payload["answer"])
+            return JsonResponse(payload, status=status_code)
+        else:
+            # The embedding started during routing is already in the embedding cache
+            answer = await aquery_with_langchain_rag(question, chatbot_name=name, chat_history=chat_history,
+                                                     engine=routing["engine"],
+                                                     timings={"route_ms": routing["decision"]["elapsed_ms"]})
+            await asyncio.to_thread(_cache_answer, routing, answer["answer"])
+            return JsonResponse(answer)
+    except Exception as e:
+        print("[ERROR]", e)
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+async def grag_async_view(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    data = _json_body(request)
+    payload, status_code = await agrag_answer((data.get("question") or "").lower(), data.get("chat_history", []))
+    return JsonResponse(payload, status=status_code)
+
+
+rag_ask_async_view.csrf_exempt = True
+grag_async_view.csrf_exempt = True
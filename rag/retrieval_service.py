@@ -0,0 +1,101 @@
+import argparse
+import os
+import signal
+import socketserver
+import sys
+
+from rag.langchain import rag_engine
+from rag.langchain.retrieval_client import (
+    SOCKET_PATH,
+    decode_vector,
+    encode_docs,
+    encode_vector,
+    recv_message,
+    send_message,
+)
+
+
+def handle_request(request):
+    engine = rag_engine.get_rag_engine()
+    op = request.get("op")
+
+    if op == "info":
+        return {
+            "version": engine.version,
+            "index_dir": engine.index_dir,
+            "chunks": engine.chunks_json_path,
+            "catalog": engine.product_info_path,
+            "ntotal": engine.vectorstore.index.ntotal,
+            "batching": engine.batch_stats(),
+        }
+    if op == "embed":
+        return {"vector": encode_vector(engine.embedding.embed_query(request["text"]))}
+    if op == "retrieve":
+        timings = {}
+        docs = engine.retrieve(request["question"], k=request.get("k", 10), timings=timings,
+                               filters=request.get("filters"))
+        return {"docs": encode_docs(docs), "timings": timings, "version": engine.version}
+    if op == "lexical":
+        timings = {}
+        filters, k = engine.question_filters(request["question"], request.get("k", 10), request.get("filters"), timings)
+        docs = engine.lexical_retrieve(request["question"], k, filters, timings)
+        return {"docs": encode_docs(docs) if docs is not None else None, "timings": timings, "version": engine.version}
+    if op == "search":
+        timings = {}
+        docs = engine.search_for_question(request["question"], decode_vector(request["vector"]),
+                                          k=request.get("k", 10), filters=request.get("filters"), timings=timings)
+        return {"docs": encode_docs(docs), "timings": timings, "version": engine.version}
+    return {"error": f"unknown op {op!r}"}
+
+
+class RetrievalHandler(socketserver.BaseRequestHandler):
+    """One worker connection: requests are answered in order until the worker disconnects"""
+
+    def handle(self):
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (OSError, ValueError):
+                return
+            if request is None:
+                return
+            try:
+                response = handle_request(request)
+            except Exception as e:
+                print(f"[ERROR] Retrieval request {request.get('op')!r} failed: {e}")
+                response = {"error": f"{type(e).__name__}: {e}"}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+
+class RetrievalServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path=SOCKET_PATH):
+    # This process owns the index, it must not forward to itself
+    rag_engine.RETRIEVAL_SERVICE = False
+    engine = rag_engine.get_rag_engine()
+    engine.warm_up()
+
+    if os.path.exists(path):
+        os.remove(path)
+    # Let the finally below remove the socket file when stopped by a process manager
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with RetrievalServer(path, RetrievalHandler) as server:
+        os.chmod(path, 0o660)
+        print(f"[DEBUG] Retrieval service listening on {path} (version {engine.version})")
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval process shared by the web workers of a node")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    args = parser.parse_args()
+
+    serve(args.socket)
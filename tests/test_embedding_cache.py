@@ -0,0 +1,157 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from rag.langchain import embedding_cache
+from rag.langchain.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class EmbeddingCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "cache.sqlite3")
+
+    def disk_keys(self):
+        with sqlite3.connect(self.path) as db:
+            return {key for (key,) in db.execute("SELECT key FROM embeddings")}
+
+    def accessed(self, text):
+        with sqlite3.connect(self.path) as db:
+            key = embedding_cache.cache_key(text, "d")
+            return db.execute("SELECT accessed FROM embeddings WHERE key = ?", (key,)).fetchone()[0]
+
+    def test_trivial_variants_share_an_entry(self):
+        cache = EmbeddingCache(self.path)
+        cache.put("What is Aero?", "d", [1.0, 2.0])
+        np.testing.assert_array_equal(cache.get("  what is   aero ", "d"), [1.0, 2.0])
+        self.assertIsNone(cache.get("what is aero", "other deployment"))
+
+    def test_disk_tier_is_shared_with_a_new_process(self):
+        EmbeddingCache(self.path).put("aero", "d", [1.0, 2.0])
+        cache = EmbeddingCache(self.path)
+        np.testing.assert_array_equal(cache.get("aero", "d"), [1.0, 2.0])
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        cache.get("aero", "d")
+        self.assertEqual(cache.stats()["memory_hits"], 1)
+
+    def test_expired_entries_are_misses(self):
+        cache = EmbeddingCache(self.path, ttl=60)
+        cache.put("aero", "d", [1.0])
+        with mock.patch("rag.langchain.embedding_cache.time.time", return_value=time.time() + 120):
+            self.assertIsNone(cache.get("aero", "d"))
+            self.assertIsNone(EmbeddingCache(self.path, ttl=60).get("aero", "d"))
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_eviction_keeps_the_most_recently_used_rows(self):
+        with mock.patch.object(embedding_cache, "EVICT_EVERY", 4):
+            EmbeddingCache(self.path).put("old", "d", [1.0])
+            cache = EmbeddingCache(self.path, disk_size=2)
+            for text in ("a", "b", "c"):
+                cache.put(text, "d", [2.0])
+            time.sleep(0.01)
+            # A disk hit makes "old" more recent than a, b and c once the access times are flushed
+            self.assertIsNotNone(cache.get("old", "d"))
+            time.sleep(0.01)
+            cache.put("new", "d", [3.0])
+            self.assertEqual(self.disk_keys(), {embedding_cache.cache_key(text, "d") for text in ("old", "new")})
+
+    def test_access_times_are_written_in_batches(self):
+        EmbeddingCache(self.path).put("aero", "d", [1.0])
+        written = self.accessed("aero")
+        with mock.patch.object(embedding_cache, "EVICT_EVERY", 3):
+            cache = EmbeddingCache(self.path)
+            time.sleep(0.01)
+            self.assertIsNotNone(cache.get("aero", "d"))
+            self.assertEqual(self.accessed("aero"), written)
+            for text in ("a", "b", "c"):
+                cache.put(text, "d", [2.0])
+        self.assertGreater(self.accessed("aero"), written)
+
+    def test_disk_reads_dont_take_the_lock(self):
+        cache = EmbeddingCache(self.path)
+        cache.put("aero", "d", [1.0])
+        cache._memory.clear()
+        read = cache._read
+
+        def unlocked_read(key):
+            self.assertFalse(cache._lock.locked())
+            return read(key)
+
+        with mock.patch.object(cache, "_read", side_effect=unlocked_read) as patched:
+            self.assertIsNotNone(cache.get("aero", "d"))
+        patched.assert_called_once()
+
+    def test_without_a_path_only_the_memory_tier_is_used(self):
+        cache = EmbeddingCache(path="", memory_size=1)
+        cache.put("a", "d", [1.0])
+        cache.put("b", "d", [2.0])
+        self.assertIsNone(cache.get("a", "d"))
+        self.assertIsNotNone(cache.get("b", "d"))
+
+
+class FailingEmbeddings:
+    def embed_documents(self, texts):
+        raise RuntimeError("rate limited")
+
+    def embed_query(self, text):
+        raise RuntimeError("rate limited")
+
+
+class CachedEmbeddingsTests(unittest.TestCase):
+    def test_a_failed_embedding_fails_every_caller_of_the_text(self):
+        embeddings = CachedEmbeddings(FailingEmbeddings(), EmbeddingCache(path=""), "d")
+        results = embeddings._embed_batch(["aero", "aero", "aero"])
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+    def test_concurrent_callers_of_a_failing_text_all_get_the_error(self):
+        embeddings = CachedEmbeddings(FailingEmbeddings(), EmbeddingCache(path=""), "d", batching=True)
+        errors = []
+
+        def embed():
+            try:
+                embeddings.embed_query("aero")
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=embed, daemon=True) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual(len(errors), 4)
+
+    def test_aembed_query_uses_the_cache_off_the_event_loop(self):
+        class Embeddings:
+            async def aembed_query(self, text):
+                return [1.0, 2.0]
+
+        cache = EmbeddingCache(path="")
+        threads = []
+
+        def recorded(method):
+            def call(*args):
+                threads.append(threading.current_thread())
+                return method(*args)
+            return call
+
+        for name in ("get", "put"):
+            patcher = mock.patch.object(cache, name, side_effect=recorded(getattr(cache, name)))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        embeddings = CachedEmbeddings(Embeddings(), cache, "d")
+        self.assertEqual(asyncio.run(embeddings.aembed_query("aero")), [1.0, 2.0])
+        self.assertEqual(asyncio.run(embeddings.aembed_query("aero")), [1.0, 2.0])
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.main_thread(), threads)
@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from rag.langchain import graph_answer
+
+
+def query_result(data):
+    return {"success": True, "data": data, "cypher_used": "MATCH (p:Product) RETURN p", "result_count": len(data)}
+
+
+class FakeGraphRAG:
+    """EnhancedGraphRAG with a canned query result, whose LLM stream fails after fail_after chunks"""
+
+    def __init__(self, result, fail_after=None):
+        self.result = result
+        self.llm = SimpleNamespace(stream=self._stream)
+        self.fail_after = fail_after
+
+    def query_with_fallback(self, question, chat_history):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    def answer_messages(self, question, data):
+        return []
+
+    def _stream(self, messages):
+        for i, text in enumerate(["KitKat MEGA ", "has 290 calories."]):
+            if self.fail_after is not None and i == self.fail_after:
+                raise TimeoutError("LLM stream cut")
+            yield SimpleNamespace(content=text)
+
+
+def stream(fake, fallback=None):
+    fallback = fallback or mock.Mock(return_value="Fallback answer")
+    with mock.patch.object(graph_answer, "EnhancedGraphRAG", return_value=fake), \
+            mock.patch.object(graph_answer, "_fallback_chain_answer", fallback):
+        return list(graph_answer.stream_grag("kitkat mega calories", []))
+
+
+class StreamGragTests(unittest.TestCase):
+    def test_tokens_then_done(self):
+        events = stream(FakeGraphRAG(query_result([{"calories": 290}])))
+        self.assertEqual([event for event, _ in events], ["token", "token", "done"])
+        self.assertEqual(events[-1][1]["answer"], "KitKat MEGA has 290 calories.")
+        self.assertEqual(events[-1][1]["debug_info"]["result_count"], 1)
+
+    def test_no_results_answer(self):
+        events = stream(FakeGraphRAG(query_result([])))
+        self.assertEqual(events, [("done", {"answer": graph_answer.NO_RESULTS_ANSWER,
+                                            "debug_info": {"cypher_used": "MATCH (p:Product) RETURN p",
+                                                           "result_count": 0}})])
+
+    def test_pipeline_error_falls_back_to_the_chain(self):
+        events = stream(FakeGraphRAG(ConnectionError("neo4j down")))
+        self.assertEqual(events, [("done", {"answer": "Fallback answer"})])
+
+    def test_failure_mid_stream_falls_back_to_the_chain(self):
+        events = stream(FakeGraphRAG(query_result([{"calories": 290}]), fail_after=1))
+        self.assertEqual(events[0], ("token", {"text": "KitKat MEGA "}))
+        self.assertEqual(events[-1], ("done", {"answer": "Fallback answer"}))
+
+    def test_error_event_when_the_fallback_fails_too(self):
+        events = stream(FakeGraphRAG(ConnectionError("neo4j down")), mock.Mock(side_effect=RuntimeError("no graph")))
+        self.assertEqual(len(events), 1)
+        event, payload = events[0]
+        self.assertEqual(event, "error")
+        self.assertEqual(payload["debug_error"], "neo4j down")
+
+
+class AsyncSchemaCacheTests(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(graph_answer, "_async_schema_info", None),
+            mock.patch.object(graph_answer, "_async_schema_retry_at", 0.0),
+            mock.patch.object(graph_answer, "_get_async_clients", return_value=(object(), object())),
+            mock.patch.object(graph_answer.AsyncEnhancedGraphRAG, "_load_query_examples", return_value=[]),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def create(self, discovered):
+        discover = mock.AsyncMock(side_effect=discovered)
+        with mock.patch.object(graph_answer.AsyncEnhancedGraphRAG, "_abuild_dynamic_schema", discover):
+            return asyncio.run(graph_answer.AsyncEnhancedGraphRAG.create()).schema_info, discover.await_count
+
+    def test_fallback_schema_is_not_kept(self):
+        schema = {"nodes": [], "relationships": ["OWNS"]}
+        self.assertEqual(self.create([graph_answer.DEFAULT_SCHEMA]), (graph_answer.DEFAULT_SCHEMA, 1))
+        # Within the retry interval the fallback is used without another discovery
+        self.assertEqual(self.create([schema]), (graph_answer.DEFAULT_SCHEMA, 0))
+
+        graph_answer._async_schema_retry_at = 0.0
+        self.assertEqual(self.create([schema]), (schema, 1))
+        # A discovered schema is kept
+        self.assertEqual(self.create([graph_answer.DEFAULT_SCHEMA]), (schema, 0))
@@ -0,0 +1,69 @@
+import unittest
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from rag.langchain.lexical_index import RRF_K, LexicalIndex, reciprocal_rank_fusion, tokenize
+
+DOCS = [
+    Document(page_content="Contains milk, sugar and cocoa butter.", metadata={"product_name": "Aero Mint", "brand": "Aero"}),
+    Document(page_content="Peanuts may be present.", metadata={"product_name": "KitKat Mega", "brand": "Kit Kat"}),
+    Document(page_content="230 calories and 11 g of sugars.", metadata={"product_name": "Coffee Crisp", "brand": "Coffee Crisp"}),
+    Document(page_content="Wafer fingers covered in milk chocolate.", metadata={"product_name": "KitKat", "brand": "Kit Kat"}),
+]
+
+
+def vectorstore(docs):
+    index = faiss.IndexFlatL2(2)
+    index.add(np.zeros((len(docs), 2), dtype=np.float32))
+    docstore = InMemoryDocstore({str(i): doc for i, doc in enumerate(docs)})
+    return SimpleNamespace(index=index, docstore=docstore, index_to_docstore_id={i: str(i) for i in range(len(docs))})
+
+
+class ReciprocalRankFusionTests(unittest.TestCase):
+    def test_positions_ranked_well_in_both_rankings_win(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [2, 4, 1]], [1.0, 1.0], k=3)
+        self.assertEqual([position for position, _ in fused], [2, 1, 4])
+        self.assertAlmostEqual(fused[0][1], 1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+
+    def test_weights_and_k(self):
+        fused = reciprocal_rank_fusion([[1], [2]], [1.0, 2.0], k=1)
+        self.assertEqual(fused, [(2, 2.0 / (RRF_K + 1))])
+        self.assertEqual(reciprocal_rank_fusion([[], []], [1.0, 1.0], k=5), [])
+
+
+class LexicalIndexTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = LexicalIndex(vectorstore(DOCS))
+
+    def test_tokenize_drops_stopwords_and_plurals(self):
+        self.assertEqual(tokenize("What are the Peanuts in KitKat®?"), ["peanut", "kitkat"])
+
+    def test_best_match_first(self):
+        scores, positions, confidence = self.index.search("does kitkat mega have peanuts", k=2)
+        self.assertEqual(positions[0], 1)
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(confidence, 1.0)
+
+    def test_metadata_and_one_word_brands_are_indexed(self):
+        _, positions, _ = self.index.search("coffeecrisp", k=4)
+        self.assertEqual(positions, [2])
+
+    def test_restricted_to_ids(self):
+        _, positions, _ = self.index.search("milk", k=4)
+        self.assertEqual(sorted(positions), [0, 3])
+        _, positions, _ = self.index.search("milk", k=4, ids=np.array([3, 2]))
+        self.assertEqual(positions, [3])
+
+    def test_confidence_counts_unknown_terms(self):
+        _, positions, confidence = self.index.search("aero mint halal", k=1)
+        self.assertEqual(positions, [0])
+        self.assertLess(confidence, 1.0)
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search("halal", k=3), ([], [], 0.0))
+        self.assertEqual(self.index.search("the", k=3), ([], [], 0.0))
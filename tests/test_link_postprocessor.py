@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+
+from langchain.schema import Document
+
+from rag.langchain.link_postprocessor import AhoCorasick, LinkPostprocessor
+
+
+class FakeLinkManager:
+    image_map = {
+        "aero mint": "https://img/aero-mint.png",
+        "kitkat": "https://img/kitkat.png",
+        "kitkat mega": "https://img/kitkat-mega.png",
+    }
+    links = {
+        "aero mint": {"display_name": "Aero Mint (Aero)", "url": "https://aero/mint"},
+        "kitkat mega": {"display_name": "KitKat Mega (Kit Kat)", "url": "https://kitkat/mega"},
+    }
+
+    def get_product_link(self, product, brand=""):
+        return self.links.get(product.lower())
+
+
+class AhoCorasickTests(unittest.TestCase):
+    def test_every_occurrence_in_the_order_it_ends(self):
+        matcher = AhoCorasick(["he", "she", "his", "hers"])
+        self.assertEqual(list(matcher.find("ushers")), ["she", "he", "hers"])
+
+    def test_overlapping_and_repeated_patterns(self):
+        matcher = AhoCorasick(["kitkat", "kitkat mega", "mega", "at"])
+        # Patterns ending at the same character come longest first
+        self.assertEqual(list(matcher.find("kitkat mega and kitkat")),
+                         ["kitkat", "at", "kitkat mega", "mega", "kitkat", "at"])
+        self.assertEqual(list(AhoCorasick([]).find("anything")), [])
+
+
+class LinkPostprocessorTests(unittest.TestCase):
+    def setUp(self):
+        self.postprocessor = LinkPostprocessor(FakeLinkManager())
+        patcher = mock.patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_find_image(self):
+        self.assertEqual(self.postprocessor.find_image("Aero Mint"), ("aero mint", "https://img/aero-mint.png"))
+        self.assertEqual(self.postprocessor.find_image("KitKat Mega (Kit Kat)"),
+                         ("kitkat mega", "https://img/kitkat-mega.png"))
+        # The longest image key making up most of the link text
+        self.assertEqual(self.postprocessor.find_image("the kitkat mega bar"), ("kitkat mega", "https://img/kitkat-mega.png"))
+        self.assertEqual(self.postprocessor.find_image("kitkat and many other treats"), (None, None))
+
+    def test_links_are_corrected_and_followed_by_one_image(self):
+        answer = ("Try [**aero mint**](https://wrong). Also **[KitKat Mega](https://old)**, "
+                  "and [**Aero Mint**](https://aero/mint) again.")
+        self.assertEqual(
+            self.postprocessor.process(answer),
+            "Try [**Aero Mint (Aero)**](https://aero/mint).\n\n![aero mint](https://img/aero-mint.png) "
+            "Also [**KitKat Mega (Kit Kat)**](https://kitkat/mega),\n\n![kitkat mega](https://img/kitkat-mega.png) "
+            "and [**Aero Mint (Aero)**](https://aero/mint) again."
+        )
+
+    def test_unknown_products_keep_their_link_and_images_are_not_repeated(self):
+        answer = "See [**Smarties**](https://smarties) and [**KitKat**](https://kitkat)\n\n![kitkat](https://img/kitkat.png)"
+        self.assertEqual(self.postprocessor.process(answer), answer)
+
+    def test_without_validation_or_images(self):
+        answer = "Try [**aero mint**](https://wrong)."
+        self.assertEqual(self.postprocessor.process(answer, validate=False, images=False), answer)
+
+    def test_related_links_of_the_sources(self):
+        docs = [
+            Document(page_content="", metadata={"product_name": "Aero Mint", "product_url": "https://aero/mint"}),
+            Document(page_content="", metadata={"product_name": "Aero Mint", "product_url": "https://aero/mint"}),
+            Document(page_content="", metadata={"brand": "Kit Kat", "brand_url": "https://kitkat"}),
+            Document(page_content="", metadata={}),
+        ]
+        self.assertEqual(
+            self.postprocessor.process("No links.", docs, images=False),
+            "No links.\n\n**Related Links**\n"
+            "- [Aero Mint | Made with Nestlé Canada](https://aero/mint)\n"
+            "- [Kit Kat Brands' Products | Made With Nestlé Canada](https://kitkat)"
+        )
@@ -0,0 +1,71 @@
+import unittest
+from types import SimpleNamespace
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from rag.langchain.metadata_index import MetadataIndex, compact_ngrams
+
+CHUNKS = [
+    {"product_name": "Aero", "brand": "Aero", "chunk_type": "overview"},
+    {"product_name": "Aero Mint", "brand": "Aero", "chunk_type": "nutrition"},
+    {"product_name": "KitKat", "brand": "Kit Kat", "chunk_type": "overview"},
+    {"product_name": "KitKat Mega", "brand": "Kit Kat", "chunk_type": "ingredients"},
+    {"product_name": "Coffee Crisp", "brand": "Coffee Crisp", "chunk_type": "nutrition"},
+    {"product_name": "Smarties®", "brand": "Smarties", "chunk_type": "overview"},
+]
+
+
+def vectorstore(chunks):
+    index = faiss.IndexFlatL2(2)
+    index.add(np.zeros((len(chunks), 2), dtype=np.float32))
+    docstore = InMemoryDocstore({str(i): Document(page_content="", metadata=m) for i, m in enumerate(chunks)})
+    return SimpleNamespace(index=index, docstore=docstore, index_to_docstore_id={i: str(i) for i in range(len(chunks))})
+
+
+class MetadataIndexTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = MetadataIndex(vectorstore(CHUNKS))
+
+    def ids(self, filters):
+        return self.index.ids(filters).tolist()
+
+    def test_ids_of_one_field(self):
+        self.assertEqual(self.ids({"brand": "Kit Kat"}), [2, 3])
+        self.assertEqual(self.ids({"product_name": "smarties"}), [5])
+
+    def test_ids_of_alternative_values_and_of_several_fields(self):
+        self.assertEqual(self.ids({"brand": ["Aero", "Coffee Crisp"]}), [0, 1, 4])
+        self.assertEqual(self.ids({"brand": ["Aero", "Coffee Crisp"], "chunk_type": "nutrition"}), [1, 4])
+        self.assertEqual(self.ids({"brand": "Unknown"}), [])
+        self.assertIsNone(self.index.ids({}))
+
+    def test_search_params_count_the_candidates(self):
+        params, count = self.index.search_params({"brand": "Aero"})
+        self.assertIsNotNone(params)
+        self.assertEqual(count, 2)
+        self.assertEqual(self.index.search_params({"brand": "Unknown"}), (None, 0))
+
+    def test_detect_prefers_the_longest_product(self):
+        self.assertEqual(self.index.detect("Calories in a KitKat Mega?"), {"product_name": ["KitKat Mega"]})
+
+    def test_detect_a_product_named_like_its_brand_as_the_brand(self):
+        self.assertEqual(self.index.detect("is aero gluten free"), {"brand": ["Aero"]})
+
+    def test_detect_brands_without_spaces(self):
+        self.assertEqual(self.index.detect("what kit-kat bars are there"), {"brand": ["Kit Kat"]})
+        self.assertEqual(self.index.detect("Kitkat flavours"), {"brand": ["Kit Kat"]})
+
+    def test_detect_brands_only_as_whole_words(self):
+        self.assertIsNone(self.index.detect("can I bring chocolate on an aeroplane"))
+        self.assertIsNone(self.index.detect("a coffee crispy snack"))
+
+    def test_detect_widens_to_every_brand_named(self):
+        self.assertEqual(self.index.detect("KitKat Mega or Aero Mint?"), {"product_name": ["KitKat Mega", "Aero Mint"]})
+        self.assertEqual(self.index.detect("KitKat Mega or Coffee Crisp?"), {"brand": ["Coffee Crisp", "Kit Kat"]})
+
+    def test_compact_ngrams(self):
+        self.assertEqual(compact_ngrams(" kit kat bar "), {"kit", "kitkat", "kitkatbar", "kat", "katbar", "bar"})
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from rag.langchain.micro_batcher import MicroBatcher
+
+
+class MicroBatcherTests(unittest.TestCase):
+    def test_concurrent_submits_share_a_batch(self):
+        batches = []
+
+        def double(items):
+            batches.append(list(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(double, max_batch=8, max_wait_ms=200)
+        results = {}
+        threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, batcher.submit(i))) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(results, {i: i * 2 for i in range(8)})
+        self.assertEqual(sum(len(batch) for batch in batches), 8)
+        self.assertLess(len(batches), 8)
+        self.assertEqual(batcher.stats()["items"], 8)
+
+    def test_max_batch_splits_batches(self):
+        batcher = MicroBatcher(lambda items: items, max_batch=2, max_wait_ms=200)
+        futures = [batcher._submit(i) for i in range(5)]
+        self.assertEqual([future.result(5) for future in futures], list(range(5)))
+        self.assertLessEqual(batcher.stats()["max_size"], 2)
+
+    def test_exception_result_fails_only_its_item(self):
+        batcher = MicroBatcher(lambda items: [ValueError(item) if item < 0 else item for item in items], 8, 50)
+        failing, passing = batcher._submit(-1), batcher._submit(1)
+        self.assertIsInstance(failing.exception(5), ValueError)
+        self.assertEqual(passing.result(5), 1)
+
+    def test_fn_error_fails_the_whole_batch(self):
+        def broken(items):
+            raise RuntimeError("index gone")
+
+        batcher = MicroBatcher(broken, 8, 10)
+        with self.assertRaises(RuntimeError):
+            batcher.submit(1)
+
+    def test_concurrent_coroutines_share_a_batch(self):
+        batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_batch=16, max_wait_ms=200)
+
+        async def main():
+            return await asyncio.gather(*[batcher.asubmit(i) for i in range(6)])
+
+        self.assertEqual(asyncio.run(main()), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(batcher.stats()["batches"], 1)
+
+    def test_cancelled_caller_doesnt_stop_the_batcher(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow(items):
+            started.set()
+            release.wait(5)
+            return items
+
+        batcher = MicroBatcher(slow, max_batch=1, max_wait_ms=0)
+
+        async def main():
+            first = asyncio.ensure_future(batcher.asubmit(1))
+            await asyncio.to_thread(started.wait, 5)
+            # Queued behind the running batch, then abandoned like a disconnected client
+            cancelled = asyncio.ensure_future(batcher.asubmit(2))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            # The cancellation reaches the batcher's future on the next loop iteration
+            await asyncio.sleep(0.01)
+            release.set()
+            return await first, await asyncio.wait_for(batcher.asubmit(3), 5)
+
+        self.assertEqual(asyncio.run(main()), (1, 3))
+        self.assertEqual(batcher.stats()["items"], 2)
+
+    def test_thread_is_replaced_when_it_dies(self):
+        batcher = MicroBatcher(lambda items: items, 8, 10)
+        process = batcher._process
+        calls = []
+
+        def dies_once():
+            calls.append(threading.current_thread())
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            process()
+
+        with mock.patch.object(batcher, "_process", side_effect=dies_once):
+            future = batcher._submit(1)
+            self.assertEqual(future.result(5), 1)
+        self.assertNotEqual(calls[0], calls[1])
+        self.assertEqual(batcher.submit(2), 2)
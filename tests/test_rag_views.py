@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from rag import rag_views
+from rag.langchain.rag_engine import SpeculativeRetrieval
+from rag.langchain.semantic_cache import SemanticAnswerCache
+
+
+class FakeEmbedding:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, question):
+        self.calls += 1
+        return [1.0, 0.0]
+
+
+class FakeEngine:
+    """A RAGEngine whose BM25 fast path answers questions naming "kitkat"""
+
+    version = "v1"
+
+    def __init__(self):
+        self.embedding = FakeEmbedding()
+
+    def start_speculative_retrieval(self, question, k):
+        return SpeculativeRetrieval(self, question, k)
+
+    def question_filters(self, question, k, filters=None, timings=None):
+        return {}, k
+
+    def lexical_retrieve(self, question, k, filters=None, timings=None):
+        return ["bm25 doc"] if "kitkat" in question else None
+
+    def search_for_question(self, question, vector, k=10, filters=None, timings=None):
+        return ["vector doc"]
+
+
+class KeywordRouter:
+    def route(self, question, embed=None):
+        return {"route": "rag", "confidence": 1.0, "source": "local", "elapsed_ms": 0.0}
+
+
+class RouteQuestionTests(unittest.TestCase):
+    def setUp(self):
+        self.engine = FakeEngine()
+        self.cache = SemanticAnswerCache()
+        for name, value in (("get_rag_engine", lambda: self.engine), ("get_question_router", KeywordRouter),
+                            ("get_semantic_cache", lambda: self.cache), ("SPECULATIVE_RETRIEVAL", True),
+                            ("SEMANTIC_CACHE_ENABLED", True)):
+            patcher = mock.patch.object(rag_views, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_fast_path_question_makes_no_embedding_call(self):
+        routing = rag_views._route_question("what is in a kitkat", "bot", [])
+        self.assertEqual(rag_views._rag_inputs(routing)[0], ["bm25 doc"])
+        self.assertIsNone(routing["cache_context"]["vector"])
+
+        # Cached and found again by its wording
+        rag_views._cache_answer(routing, "wafer and chocolate")
+        routing = rag_views._route_question("what is in a  kitkat?", "bot", [])
+        self.assertEqual(routing["cached"]["answer"], "wafer and chocolate")
+        self.assertEqual(self.engine.embedding.calls, 0)
+
+    def test_embedding_of_the_retrieval_is_reused(self):
+        routing = rag_views._route_question("what is in an aero bar", "bot", [])
+        self.assertEqual(rag_views._rag_inputs(routing)[0], ["vector doc"])
+        self.assertEqual(routing["cache_context"]["vector"], [1.0, 0.0])
+        self.assertEqual(self.engine.embedding.calls, 1)
+
+        rag_views._cache_answer(routing, "bubbly chocolate")
+        routing = rag_views._route_question("tell me what is in an aero bar", "bot", [])
+        self.assertEqual(routing["cached"]["answer"], "bubbly chocolate")
+        self.assertEqual(self.engine.embedding.calls, 2)
+
+
+class AsyncRouteQuestionTests(unittest.TestCase):
+    def test_semantic_cache_is_used_off_the_event_loop(self):
+        class AsyncEmbedding:
+            async def aembed_query(self, question):
+                return [1.0, 0.0]
+
+        class AsyncRouter:
+            async def aroute(self, question, aembed=None):
+                return {"route": "rag", "confidence": 1.0, "source": "local", "elapsed_ms": 0.0}
+
+        engine = FakeEngine()
+        engine.embedding = AsyncEmbedding()
+        cache = SemanticAnswerCache()
+        threads = []
+        lookup = cache.lookup
+
+        def recorded_lookup(**context):
+            threads.append(threading.current_thread())
+            return lookup(**context)
+
+        with mock.patch.object(rag_views, "get_rag_engine", lambda: engine), \
+                mock.patch.object(rag_views, "get_question_router", AsyncRouter), \
+                mock.patch.object(rag_views, "get_semantic_cache", lambda: cache), \
+                mock.patch.object(rag_views, "SPECULATIVE_RETRIEVAL", True), \
+                mock.patch.object(rag_views, "SEMANTIC_CACHE_ENABLED", True), \
+                mock.patch.object(cache, "lookup", side_effect=recorded_lookup):
+            routing = asyncio.run(rag_views._aroute_question("is aero vegan", "bot", []))
+
+        self.assertEqual(routing["cache_context"]["vector"], [1.0, 0.0])
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.main_thread())
@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from rag.langchain import record_store
+from rag.langchain.record_store import (
+    CatalogStore, ChunkStore, fresh_store, store_path, write_catalog_store, write_chunk_store
+)
+
+CHUNKS = [
+    {"chunk_id": "a", "metadata": {"product_name": "Aero Mint", "brand": "Aero", "chunk_type": "overview"},
+     "content": "Aero Mint overview"},
+    {"metadata": {"product_name": "KitKat", "brand": "Kit Kat®", "chunk_type": "nutrition"}, "content": "KitKat nutrition"},
+    {"chunk_id": "c", "metadata": {"product_name": "Aero Mint", "brand": "Aero", "chunk_type": "ingredients"},
+     "content": "Aero Mint ingredients"},
+]
+
+CATALOG = [
+    {"brand": "Aero", "category": "chocolate", "url": "https://aero", "products": [
+        {"name": "Aero Mint", "product_url": "https://aero/mint", "image_url": "mint.png"},
+        {"name": "Aero Milk", "product_url": "https://aero/milk", "image_url": ""},
+    ]},
+    {"brand": "Kit Kat", "category": "wafer", "url": "https://kitkat", "products": []},
+]
+
+
+class RecordStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.addCleanup(record_store._stale_reported.clear)
+
+    def write_json(self, name, records):
+        json_path = os.path.join(self.dir, name)
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(records, f)
+        return json_path
+
+    def test_chunk_store_round_trip(self):
+        json_path = self.write_json("chunks.json", CHUNKS)
+        self.assertEqual(write_chunk_store(store_path(json_path), CHUNKS, source=json_path), 3)
+        store = ChunkStore(store_path(json_path))
+
+        self.assertEqual(list(store), CHUNKS)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store[1], CHUNKS[1])
+        self.assertEqual(store.records_at([2, 7, 0]), [CHUNKS[2], CHUNKS[0]])
+        self.assertEqual(store.by_product("aero mint"), [CHUNKS[0], CHUNKS[2]])
+        self.assertEqual(store.by_product("Aero Mint", brand="Kit Kat"), [])
+        self.assertEqual(store.by_brand("kit kat"), [CHUNKS[1]])
+        with self.assertRaises(IndexError):
+            store[3]
+
+    def test_catalog_store_round_trip(self):
+        json_path = self.write_json("brand_products.json", CATALOG)
+        self.assertEqual(write_catalog_store(store_path(json_path), CATALOG, source=json_path), (2, 2))
+        store = CatalogStore(store_path(json_path))
+
+        self.assertEqual(store.load(), CATALOG)
+        self.assertEqual(store.brands()[1], {"brand": "Kit Kat", "category": "wafer", "url": "https://kitkat"})
+        self.assertEqual(store.brand_products("AERO"), CATALOG[0]["products"])
+        self.assertEqual(store.product("aero mint"), CATALOG[0]["products"][0])
+        self.assertIsNone(store.product("Coffee Crisp"))
+        self.assertEqual(store.link_rows(), [
+            ("Aero", "chocolate", "https://aero", "Aero Mint", "https://aero/mint", "mint.png"),
+            ("Aero", "chocolate", "https://aero", "Aero Milk", "https://aero/milk", ""),
+            ("Kit Kat", "wafer", "https://kitkat", None, None, None),
+        ])
+
+    def test_fresh_store_follows_the_json_content(self):
+        json_path = self.write_json("chunks.json", CHUNKS)
+        self.assertIsNone(fresh_store(json_path))
+        write_chunk_store(store_path(json_path), CHUNKS, source=json_path)
+        self.assertEqual(fresh_store(json_path), store_path(json_path))
+
+        # A checkout or copy rewrites the file with the same content and a new mtime
+        os.utime(json_path, ns=(1, 1))
+        self.assertEqual(fresh_store(json_path), store_path(json_path))
+
+        # An edit the mtime comparison missed: the JSON file is older than its copy
+        self.write_json("chunks.json", CHUNKS[:2])
+        os.utime(json_path, ns=(1, 1))
+        with mock.patch("builtins.print") as printed:
+            self.assertIsNone(fresh_store(json_path))
+            self.assertIsNone(fresh_store(json_path))
+        printed.assert_called_once()
+
+    def test_fresh_store_without_a_recorded_source(self):
+        json_path = self.write_json("chunks.json", CHUNKS)
+        write_chunk_store(store_path(json_path), CHUNKS)
+        with mock.patch("builtins.print"):
+            self.assertIsNone(fresh_store(json_path))
+        os.remove(json_path)
+        self.assertEqual(fresh_store(json_path), store_path(json_path))
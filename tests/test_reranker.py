@@ -0,0 +1,50 @@
+import importlib
+import os
+import unittest
+from unittest import mock
+
+from rag.langchain import reranker
+from rag.langchain.reranker import entity_scores, rerank_order
+
+METADATAS = [
+    {"product_name": "Aero Mint", "brand": "Aero"},
+    {"product_name": "Aero", "brand": "Aero"},
+    {"product_name": "KitKat", "brand": "Kit Kat"},
+    {"product_name": "Coffee Crisp", "brand": "Coffee Crisp"},
+]
+
+
+class EntityScoresTests(unittest.TestCase):
+    def test_named_products_and_brands(self):
+        self.assertEqual(entity_scores("Is Aero Mint vegan?", METADATAS).tolist(), [1.0, 1.0, 0.0, 0.0])
+        self.assertEqual(entity_scores("kit kat flavours", METADATAS).tolist(), [0.0, 0.0, 0.5, 0.0])
+
+    def test_brands_match_only_whole_words(self):
+        self.assertEqual(entity_scores("snacks for an aeroplane trip", METADATAS).tolist(), [0.0] * 4)
+        self.assertEqual(entity_scores("a coffee crispy snack", METADATAS).tolist(), [0.0] * 4)
+
+
+class RerankOrderTests(unittest.TestCase):
+    texts = ["Aero Mint contains milk and sugar.", "KitKat is a wafer bar.", "Coffee Crisp nutrition: 230 calories."]
+
+    def test_best_chunks_first(self):
+        order, scores = rerank_order("Does Aero Mint contain milk?", self.texts, METADATAS[:1] + METADATAS[2:], keep=3)
+        self.assertEqual(order[0], 0)
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_keep_and_min_share(self):
+        order, _ = rerank_order("Does Aero Mint contain milk?", self.texts, METADATAS[:1] + METADATAS[2:], keep=1)
+        self.assertEqual(order, [0])
+        order, _ = rerank_order("Does Aero Mint contain milk?", self.texts, METADATAS[:1] + METADATAS[2:], keep=3,
+                                min_share=0.9)
+        self.assertEqual(order, [0])
+
+    def test_nothing_to_keep(self):
+        self.assertEqual(rerank_order("milk", [], []), ([], []))
+        self.assertEqual(rerank_order("milk", self.texts, METADATAS[:3], keep=0), ([], []))
+
+    def test_rerank_keep_is_validated_at_import(self):
+        with mock.patch.dict(os.environ, {"RAG_RERANK_KEEP": "0"}):
+            with self.assertRaises(ValueError):
+                importlib.reload(reranker)
+        importlib.reload(reranker)
@@ -0,0 +1,44 @@
+import time
+import unittest
+from unittest import mock
+
+from rag.langchain.semantic_cache import SemanticAnswerCache
+
+CONTEXT = {"route": "rag", "chatbot_name": "bot", "history_fp": "h", "version": "v1"}
+
+
+class SemanticAnswerCacheTests(unittest.TestCase):
+    def test_near_duplicate_questions_hit(self):
+        cache = SemanticAnswerCache(threshold=0.9)
+        cache.store([1.0, 0.0], payload={"answer": "a"}, question="is aero vegan", **CONTEXT)
+        payload, similarity = cache.lookup([0.99, 0.05], **CONTEXT)
+        self.assertEqual(payload, {"answer": "a"})
+        self.assertGreater(similarity, 0.9)
+        self.assertIsNone(cache.lookup([0.0, 1.0], **CONTEXT))
+        self.assertIsNone(cache.lookup([1.0, 0.0], **{**CONTEXT, "chatbot_name": "other"}))
+
+    def test_exact_wording_hits_without_an_embedding(self):
+        cache = SemanticAnswerCache()
+        cache.store(None, payload={"answer": "a"}, question="Is Aero vegan?", **CONTEXT)
+        self.assertEqual(cache.lookup(None, question="is aero vegan", **CONTEXT), ({"answer": "a"}, 1.0))
+        self.assertIsNone(cache.lookup(None, question="is aero halal", **CONTEXT))
+        self.assertIsNone(cache.lookup(None, question="is aero vegan", **{**CONTEXT, "history_fp": "other"}))
+        self.assertIsNone(cache.lookup([1.0, 0.0], **CONTEXT))
+
+    def test_newer_answer_replaces_the_same_wording(self):
+        cache = SemanticAnswerCache()
+        cache.store([1.0, 0.0], payload={"answer": "old"}, question="is aero vegan", **CONTEXT)
+        cache.store(None, payload={"answer": "new"}, question="is aero vegan", **CONTEXT)
+        self.assertEqual(cache.lookup([1.0, 0.0], question="is aero vegan", **CONTEXT)[0], {"answer": "new"})
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertIsNone(cache.lookup([1.0, 0.0], **CONTEXT))
+
+    def test_expiry_eviction_and_version(self):
+        cache = SemanticAnswerCache(max_entries=1, ttl=60)
+        cache.store(None, payload={"answer": "a"}, question="a", **CONTEXT)
+        cache.store(None, payload={"answer": "b"}, question="b", **CONTEXT)
+        self.assertIsNone(cache.lookup(None, question="a", **CONTEXT))
+        with mock.patch("rag.langchain.semantic_cache.time.time", return_value=time.time() + 120):
+            self.assertIsNone(cache.lookup(None, question="b", **CONTEXT))
+        self.assertIsNone(cache.lookup(None, question="b", **{**CONTEXT, "version": "v2"}))
+        self.assertEqual(cache.stats()["entries"], 0)
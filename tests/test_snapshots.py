@@ -0,0 +1,59 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from rag.langchain.snapshots import (
+    MANIFEST_FILE, create_snapshot, current_snapshot, list_snapshots, load_manifest, prune_snapshots, set_current
+)
+
+
+class SnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.root = os.path.join(self.dir, "snapshots")
+        os.mkdir(self.root)
+        self.source = os.path.join(self.dir, "index.faiss")
+        with open(self.source, "wb") as f:
+            f.write(b"vectors")
+
+    def publish(self, version):
+        return create_snapshot(self.root, {"index.faiss": self.source}, {"mode": "fine"}, version=version)
+
+    def test_create_snapshot_copies_the_files_with_a_manifest(self):
+        version = create_snapshot(self.root, {"index.faiss": self.source}, {"mode": "fine"})
+        snapshot = os.path.join(self.root, version)
+
+        self.assertEqual(sorted(os.listdir(self.root)), [version])
+        self.assertEqual(sorted(os.listdir(snapshot)), ["index.faiss", MANIFEST_FILE])
+        manifest = load_manifest(snapshot)
+        self.assertEqual(manifest["version"], version)
+        self.assertEqual(manifest["mode"], "fine")
+        self.assertEqual(manifest["files"], {
+            "index.faiss": {"bytes": 7, "sha256": hashlib.sha256(b"vectors").hexdigest()}
+        })
+
+    def test_nothing_is_current_until_set(self):
+        self.publish("v1")
+        self.assertIsNone(current_snapshot(self.root))
+        set_current(self.root, "v1")
+        self.assertEqual(current_snapshot(self.root), os.path.join(self.root, "v1"))
+
+    def test_only_published_snapshots_can_be_current(self):
+        os.mkdir(os.path.join(self.root, "half-written"))
+        with self.assertRaises(ValueError):
+            set_current(self.root, "half-written")
+        self.assertEqual(list_snapshots(self.root), [])
+        self.assertEqual(list_snapshots(os.path.join(self.dir, "missing")), [])
+
+    def test_prune_keeps_the_newest_and_the_current(self):
+        for version in ("v1", "v2", "v3", "v4"):
+            self.publish(version)
+        set_current(self.root, "v1")
+
+        self.assertEqual(prune_snapshots(self.root, keep=2), ["v2"])
+        self.assertEqual(list_snapshots(self.root), ["v1", "v3", "v4"])
+        self.assertEqual(prune_snapshots(self.root, keep=0), [])
+        self.assertEqual(list_snapshots(self.root), ["v1", "v3", "v4"])
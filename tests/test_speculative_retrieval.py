@@ -0,0 +1,77 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from rag.langchain import rag_engine
+from rag.langchain.rag_engine import SpeculativeRetrieval
+
+
+class FakeEmbedding:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, question):
+        self.calls += 1
+        return [0.1, 0.2]
+
+
+class FakeEngine:
+    """question_filters / lexical_retrieve / search_for_question of a RAGEngine, failing where asked"""
+
+    def __init__(self, fail_in=None, release=None):
+        self.fail_in = fail_in
+        self.release = release
+        self.embedding = FakeEmbedding()
+
+    def question_filters(self, question, k, filters=None, timings=None):
+        if self.fail_in == "filters":
+            raise OSError("docstore unavailable")
+        return {}, k
+
+    def lexical_retrieve(self, question, k, filters=None, timings=None):
+        if self.fail_in == "lexical":
+            raise ConnectionError("retrieval service gone")
+        if self.release is not None:
+            self.release.wait(5)
+        return None
+
+    def search_for_question(self, question, vector, k=10, filters=None, timings=None):
+        return ["doc"]
+
+
+class SpeculativeRetrievalTests(unittest.TestCase):
+    def test_embedding_raises_when_filters_fail(self):
+        speculative = SpeculativeRetrieval(FakeEngine("filters"), "kitkat mega", 5)
+        # Used to stay pending forever, blocking the router and the semantic cache
+        self.assertIsInstance(speculative._vector.exception(timeout=5), OSError)
+        with self.assertRaises(OSError):
+            speculative.embedding()
+        with self.assertRaises(OSError):
+            speculative.result()
+
+    def test_embedding_raises_when_lexical_search_fails(self):
+        speculative = SpeculativeRetrieval(FakeEngine("lexical"), "kitkat mega", 5)
+        self.assertIsInstance(speculative._vector.exception(timeout=5), ConnectionError)
+
+    def test_embedding_shared_with_the_search(self):
+        engine = FakeEngine()
+        speculative = SpeculativeRetrieval(engine, "kitkat mega", 5)
+        self.assertEqual(speculative.result(), ["doc"])
+        self.assertEqual(speculative.embedding(), [0.1, 0.2])
+        self.assertEqual(engine.embedding.calls, 1)
+
+    def test_discard_before_running_does_not_block_embedding(self):
+        # A saturated pool: the second retrieval is still queued when the router picks another route
+        release = threading.Event()
+        with mock.patch.object(rag_engine, "_speculative_executor", ThreadPoolExecutor(max_workers=1)):
+            running = SpeculativeRetrieval(FakeEngine(release=release), "kitkat mega", 5)
+            queued = SpeculativeRetrieval(FakeEngine(), "aero calories", 5)
+            queued.discard()
+            try:
+                # Used to wait forever on a vector the cancelled task never computed
+                self.assertIsNone(queued._vector.result(timeout=5))
+                self.assertEqual(queued.embedding(), [0.1, 0.2])
+            finally:
+                release.set()
+            self.assertEqual(running.result(), ["doc"])
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+from rag.langchain.sqlite_docstore import SQLiteDocstore, write_docstore
+from rag.preprocessing.embedder import replace_directory
+
+
+def write_build(path, content):
+    docstore = InMemoryDocstore({"a": Document(page_content=content, metadata={"build": content})})
+    write_docstore(path, docstore, {0: "a"})
+
+
+def in_thread(function):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+class SQLiteDocstoreTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.index_dir = os.path.join(self.dir, "faiss_index")
+        os.mkdir(self.index_dir)
+        write_build(os.path.join(self.index_dir, "docstore.sqlite3"), "old")
+
+    def test_reads_documents_by_id_and_position(self):
+        docstore = SQLiteDocstore(os.path.join(self.index_dir, "docstore.sqlite3"))
+        self.assertEqual(docstore.search("a").page_content, "old")
+        self.assertEqual(docstore.documents_at([0])[0].metadata, {"build": "old"})
+        self.assertEqual(len(docstore), 1)
+
+    def test_new_threads_keep_reading_the_file_it_was_opened_on(self):
+        docstore = SQLiteDocstore(os.path.join(self.index_dir, "docstore.sqlite3"))
+        build_dir = f"{self.index_dir}.tmp"
+        os.mkdir(build_dir)
+        write_build(os.path.join(build_dir, "docstore.sqlite3"), "new")
+        replace_directory(build_dir, self.index_dir)
+
+        self.assertEqual(in_thread(lambda: docstore.search("a").page_content), "old")
+        self.assertEqual(SQLiteDocstore(os.path.join(self.index_dir, "docstore.sqlite3")).search("a").page_content, "new")
+
+    def test_replace_directory_leaves_only_the_new_build(self):
+        build_dir = f"{self.index_dir}.tmp"
+        os.mkdir(build_dir)
+        write_build(os.path.join(build_dir, "docstore.sqlite3"), "new")
+        open(os.path.join(self.index_dir, "index_config.json"), "w").close()
+        replace_directory(build_dir, self.index_dir)
+
+        self.assertEqual(sorted(os.listdir(self.dir)), ["faiss_index"])
+        self.assertEqual(os.listdir(self.index_dir), ["docstore.sqlite3"])
@@ -1,5 +1,9 @@
+import asyncio
+import json
 import os
 import re
+import weakref
+import httpx
 import requests
 from dotenv import load_dotenv
 from django.http import HttpResponse, JsonResponse
@@ -11,6 +15,7 @@ load_dotenv()
 AZURE_KEY = os.getenv("AZURE_TTS_KEY")
 AZURE_REGION = os.getenv("AZURE_TTS_REGION")
 AZURE_VOICE = os.getenv("AZURE_TTS_VOICE", "en-US-JennyNeural")
+TTS_TIMEOUT = float(os.getenv("AZURE_TTS_TIMEOUT", "30"))
 
 
 # Remove emojis from text
@@ -37,6 +42,36 @@ def clean_text(text):
     text = re.sub(r'\s{2,}', ' ', text)                          # multiple spaces
     return text.strip()
 
+def tts_request(cleaned_text):
+    """Azure TTS endpoint, headers and SSML body for the cleaned text"""
+    tts_url = f"https://{AZURE_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
+
+    headers = {
+        "Ocp-Apim-Subscription-Key": AZURE_KEY,
+        "Content-Type": "application/ssml+xml",
+        "X-Microsoft-OutputFormat": "audio-24khz-160kbitrate-mono-mp3",
+    }
+
+    ssml = f"""
+    <speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis'
+           xmlns:mstts='https://www.w3.org/2001/mstts'
+           xml:lang='en-US'>
+      <voice name='{AZURE_VOICE}'>
+        <mstts:express-as style='general'>
+          {cleaned_text}
+        </mstts:express-as>
+      </voice>
+    </speak>
+    """
+
+    return tts_url, headers, ssml.encode("utf-8")
+
+def tts_failed(status_code, text):
+    print("Azure TTS ERROR")
+    print("Status Code:", status_code)
+    print("Response Text:", text)
+    return JsonResponse({"error": "Azure TTS failed", "details": text}, status=500)
+
 @api_view(['POST'])
 def tts_generate(request):
     try:
@@ -50,34 +85,51 @@ def tts_generate(request):
         cleaned_text = clean_text(raw_text)
         print("[DEBUG] Cleaned text for TTS:", cleaned_text)
 
-        # Azure TTS endpoint
-        tts_url = f"https://{AZURE_REGION}.tts.speech.microsoft.com/cognitiveservices/v1"
-
-        headers = {
-            "Ocp-Apim-Subscription-Key": AZURE_KEY,
-            "Content-Type": "application/ssml+xml",
-            "X-Microsoft-OutputFormat": "audio-24khz-160kbitrate-mono-mp3",
-        }
-
-        ssml = f"""
-        <speak version='1.0' xmlns='http://www.w3.org/2001/10/synthesis'
-               xmlns:mstts='https://www.w3.org/2001/mstts'
-               xml:lang='en-US'>
-          <voice name='{AZURE_VOICE}'>
-            <mstts:express-as style='general'>
-              {cleaned_text}
-            </mstts:express-as>
-          </voice>
-        </speak>
-        """
-
-        response = requests.post(tts_url, headers=headers, data=ssml.encode("utf-8"))
+        tts_url, headers, body = tts_request(cleaned_text)
+        response = requests.post(tts_url, headers=headers, data=body)
+
+        if response.status_code != 200:
+            return tts_failed(response.status_code, response.text)
+
+        return HttpResponse(response.content, content_type="audio/mpeg")
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+# === Async variant for ASGI ===
+# httpx pools are bound to the event loop that created them, keep one client per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+def _get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(timeout=TTS_TIMEOUT)
+    return client
+
+async def tts_generate_async(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    try:
+        data = json.loads(request.body or b"{}")
+        raw_text = data.get("text", "").strip()
+        print("[DEBUG] Original text:", raw_text)
+
+        if not raw_text:
+            return JsonResponse({"error": "No text provided"}, status=400)
+
+        cleaned_text = clean_text(raw_text)
+        print("[DEBUG] Cleaned text for TTS:", cleaned_text)
+
+        tts_url, headers, body = tts_request(cleaned_text)
+        response = await _get_async_client().post(tts_url, headers=headers, content=body)
 
         if response.status_code != 200:
-            print("Azure TTS ERROR")
-            print("Status Code:", response.status_code)
-            print("Response Text:", response.text)
-            return JsonResponse({"error": "Azure TTS failed", "details": response.text}, status=500)
+            return tts_failed(response.status_code, response.text)
 
         return HttpResponse(response.content, content_type="audio/mpeg")
 
@@ -85,3 +137,6 @@ def tts_generate(request):
         import traceback
         traceback.print_exc()
         return JsonResponse({"error": str(e)}, status=500)
+
+# Django 4.2's csrf_exempt wraps views in a sync function, mark the coroutine view directly
+tts_generate_async.csrf_exempt = True